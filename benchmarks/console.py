@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""Measure `qmk console` throughput and latency against simulated devices.
+
+Runs `qmk console --format raw` with QMK_CONSOLE_BACKEND=simulated for a while, then reports:
+
+    lines/sec       Lines received per second
+    lost            Lines the simulator sent that never arrived (dropped reports, like a full hidraw buffer)
+    latency         From the simulator generating a line to us reading it from qmk's stdout, in ms
+    cpu             User + system CPU seconds used by qmk, including the simulator thread
+    max rss         Peak memory use of qmk, in MiB
+
+Run from the root of the repository:
+
+    python benchmarks/console.py --devices 8 --rate 2000 --duration 10
+    python benchmarks/console.py --threaded --json
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def percentile(values, percent):
+    """Returns the percent'th percentile of a sorted list.
+    """
+    if not values:
+        return None
+
+    return values[min(int(len(values) * percent / 100), len(values) - 1)]
+
+
+def read_output(stdout, received):
+    """Record the arrival time of every line qmk prints.
+    """
+    for line in stdout:
+        received.append((time.monotonic_ns(), line))
+
+
+def run(args):
+    """Run one benchmark and return the results as a dict.
+    """
+    simulate = f'devices={args.devices},rate={args.rate},report_size={args.report_size},line_length={args.line_length},lifetime={args.lifetime},downtime={args.downtime},bootloader={int(args.bootloader)}'
+    env = {
+        **os.environ,
+        'PYTHONPATH': os.pathsep.join(filter(None, [str(REPO_ROOT), os.environ.get('PYTHONPATH')])),
+        'QMK_NO_DAEMON': '1',
+        'QMK_CONSOLE_BACKEND': 'simulated',
+        'QMK_CONSOLE_SIMULATE': simulate,
+    }
+    command = [sys.executable, '-m', 'qmk_cli', 'console', '--format', 'raw', '--report-size', str(args.report_size)]
+
+    if args.threaded:
+        command.append('--threaded')
+
+    if not args.bootloader:
+        command.append('--no-bootloaders')
+
+    received = []
+    process = subprocess.Popen(command, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    reader = threading.Thread(target=read_output, args=(process.stdout, received), daemon=True)
+    reader.start()
+
+    time.sleep(args.duration)
+    process.send_signal(signal.SIGINT)
+    _, status, rusage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    reader.join()
+
+    latencies = []
+    sequences = {}
+
+    for arrived, line in received:
+        fields = line.split(maxsplit=3)
+
+        if len(fields) < 3 or not fields[2].isdigit():
+            continue
+
+        device, sequence, sent = int(fields[0]), int(fields[1]), int(fields[2])
+        latencies.append((arrived-sent) / 1000000)
+        sequences.setdefault(device, []).append(sequence)
+
+    latencies.sort()
+    expected = sum(max(seen) + 1 for seen in sequences.values())
+    elapsed = (received[-1][0] - received[0][0]) / 1000000000 if len(received) > 1 else 0
+
+    return {
+        'command': command,
+        'simulate': simulate,
+        'duration': args.duration,
+        'lines': len(latencies),
+        'lines_per_sec': len(latencies) / elapsed if elapsed else 0,
+        'lost': expected - len(latencies),
+        'latency_ms': {
+            'p50': percentile(latencies, 50),
+            'p90': percentile(latencies, 90),
+            'p99': percentile(latencies, 99),
+            'max': latencies[-1] if latencies else None,
+        },
+        'cpu_sec': rusage.ru_utime + rusage.ru_stime,
+        'max_rss_mib': rusage.ru_maxrss / 1024,
+    }
+
+
+def print_results(results):
+    latency = results['latency_ms']
+
+    print(f"{results['simulate']}{' (threaded)' if '--threaded' in results['command'] else ''}")
+    print(f"    lines/sec   {results['lines_per_sec']:.0f} ({results['lines']} lines, {results['lost']} lost)")
+
+    if latency['p50'] is not None:
+        print(f"    latency     p50 {latency['p50']:.2f}ms  p90 {latency['p90']:.2f}ms  p99 {latency['p99']:.2f}ms  max {latency['max']:.2f}ms")
+
+    print(f"    cpu         {results['cpu_sec']:.2f}s over {results['duration']}s")
+    print(f"    max rss     {results['max_rss_mib']:.1f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--devices', type=int, default=4, help='Number of simulated consoles (Default: 4)')
+    parser.add_argument('--rate', type=float, default=500, help='Lines per second from each console (Default: 500)')
+    parser.add_argument('--report-size', type=int, default=32, help='Report size (Default: 32)')
+    parser.add_argument('--line-length', type=int, default=64, help='Length of each line (Default: 64)')
+    parser.add_argument('--lifetime', type=float, default=0, help='Seconds before each console drops off, 0 for never (Default: 0)')
+    parser.add_argument('--downtime', type=float, default=1, help='Seconds a console stays away (Default: 1)')
+    parser.add_argument('--bootloader', action='store_true', help='Show consoles as bootloaders while they are away')
+    parser.add_argument('--duration', type=float, default=5, help='Seconds to run for (Default: 5)')
+    parser.add_argument('--threaded', action='store_true', help='Use the thread per device reader')
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    args = parser.parse_args()
+
+    results = run(args)
+
+    if args.json:
+        print(json.dumps(results, indent=4))
+    else:
+        print_results(results)
+
+
+if __name__ == '__main__':
+    main()
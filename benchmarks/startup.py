@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+"""Measure how long `qmk` takes to start up and find qmk_firmware and qmk_userspace.
+
+Runs each benchmark several times and reports the median, along with:
+
+    startup         Wall time for `qmk --version`, `qmk env` and `qmk console --list` (against simulated devices). Cold runs
+                    start with an empty cache directory, warm runs reuse one. The phases come from QMK_PROFILE.
+    discovery       find_qmk_firmware() + find_qmk_userspace() from directories nested at different depths below a
+                    qmk_userspace with a qmk.json of different sizes, with and without the discovery cache.
+    imports         Time spent importing each top level package, from `python -X importtime`.
+
+Results can be saved as JSON and compared against an earlier run. Any median that got slower by more than --threshold
+percent (and --min-delta ms) is a regression, and makes us exit 1.
+
+Run from the root of the repository:
+
+    python benchmarks/startup.py --runs 20
+    python benchmarks/startup.py --output baseline.json
+    python benchmarks/startup.py --baseline baseline.json --threshold 15
+    python benchmarks/startup.py --only discovery --depths 0,8,32 --qmk-json-sizes 1,4096 --json
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+COMMANDS = {
+    'version': ['--version'],
+    'env': ['env'],
+    'console-list': ['console', '--list'],
+}
+IMPORTTIME_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)')
+
+# Runs in a child process so every measurement starts from a fresh interpreter, the way `qmk` does.
+DISCOVERY_SCRIPT = '''
+import json, os, sys, time
+
+from qmk_cli import helpers
+
+runs = int(sys.argv[1])
+results = {}
+
+for mode in ('uncached', 'cached'):
+    if mode == 'uncached':
+        os.environ['QMK_NO_DISCOVERY_CACHE'] = '1'
+    else:
+        os.environ.pop('QMK_NO_DISCOVERY_CACHE', None)
+
+        # Results that depend on something modified in the last couple of seconds aren't cached. The tree was just created, so wait that out or every cached run is a miss.
+        time.sleep(helpers.DISCOVERY_RACY_NS / 1000000000)
+
+    samples = []
+
+    for _ in range(runs + 1):
+        helpers.find_qmk_firmware.cache_clear()
+        helpers.find_qmk_userspace.cache_clear()
+        helpers._discovery_cache.cache_clear()
+        start = time.perf_counter_ns()
+        userspace = helpers.find_qmk_userspace()
+        firmware = helpers.find_qmk_firmware()
+        samples.append((time.perf_counter_ns() - start) / 1000000)
+
+    # The first cached run fills the cache, leave it out like we leave out the warm up of everything else.
+    results[mode] = samples[1:]
+
+results['userspace'] = str(userspace)
+results['firmware'] = str(firmware)
+print(json.dumps(results))
+'''
+
+
+def percentile(values, percent):
+    """Returns the percent'th percentile of a sorted list.
+    """
+    if not values:
+        return None
+
+    return values[min(int(len(values) * percent / 100), len(values) - 1)]
+
+
+def summarize(samples):
+    """Returns the min, median, p90 and max of a list of timings.
+    """
+    samples = sorted(samples)
+
+    return {
+        'runs': len(samples),
+        'min_ms': samples[0],
+        'median_ms': statistics.median(samples),
+        'p90_ms': percentile(samples, 90),
+        'max_ms': samples[-1],
+    }
+
+
+def qmk_env(args, tmp, cache_dir, **extra):
+    """Returns the environment to run qmk in, isolated from the user's config and caches.
+    """
+    env = {
+        **os.environ,
+        'PYTHONPATH': os.pathsep.join(filter(None, [str(REPO_ROOT), os.environ.get('PYTHONPATH')])),
+        'QMK_NO_DAEMON': '1',
+        'QMK_NO_COMPLETION_INDEX': '1',
+        'QMK_CACHE_DIR': str(cache_dir),
+        'QMK_HOME': str(args.qmk_home or tmp / 'qmk_firmware'),
+        'XDG_CONFIG_HOME': str(tmp / 'config'),
+        'QMK_CONSOLE_BACKEND': 'simulated',
+        'QMK_CONSOLE_SIMULATE': 'devices=4',
+        **extra,
+    }
+
+    for var in ('QMK_USERSPACE', 'QMK_PROFILE', 'QMK_NO_DISCOVERY_CACHE', 'QMK_EAGER_SUBCOMMANDS'):
+        env.pop(var, None)
+
+    return env
+
+
+def run_qmk(argv, env, cwd, profile=None):
+    """Run qmk once, returning how long it took in ms and what the profiler recorded.
+    """
+    if profile:
+        env = {**env, 'QMK_PROFILE': str(profile)}
+
+    start = time.perf_counter_ns()
+    result = subprocess.run([sys.executable, '-m', 'qmk_cli', *argv], env=env, cwd=cwd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    elapsed = (time.perf_counter_ns() - start) / 1000000
+
+    if result.returncode:
+        raise SystemExit(f'qmk {" ".join(argv)} exited {result.returncode}:\n{result.stderr.decode(errors="replace")}')
+
+    if profile:
+        with open(profile, encoding='utf-8') as fd:
+            return elapsed, json.load(fd)
+
+    return elapsed, None
+
+
+def bench_command(args, tmp, name, argv, cold):
+    """Run one command args.runs times, with an empty or a primed cache directory.
+    """
+    samples = []
+    phases = {}
+    profile = None
+
+    if not cold:
+        cache_dir = tmp / f'cache-warm-{name}'
+        run_qmk(argv, qmk_env(args, tmp, cache_dir), args.qmk_home or tmp)
+
+    for run in range(args.runs):
+        if cold:
+            cache_dir = tmp / f'cache-cold-{name}-{run}'
+
+        elapsed, profile = run_qmk(argv, qmk_env(args, tmp, cache_dir), args.qmk_home or tmp, tmp / 'profile.json')
+        samples.append(elapsed)
+
+        for phase in profile['phases']:
+            phases.setdefault(phase['phase'], []).append(phase['ms'])
+
+    return {
+        **summarize(samples),
+        'phases_ms': {
+            phase: statistics.median(times)
+            for phase, times in phases.items()
+        },
+        'qmk_firmware_head': profile['qmk_firmware_head'] if profile else None,
+    }
+
+
+def bench_startup(args, tmp):
+    """Measure cold and warm startup of each command.
+    """
+    results = {}
+
+    for name in args.commands:
+        results[name] = {
+            'argv': COMMANDS[name],
+            'cold': bench_command(args, tmp, name, COMMANDS[name], cold=True),
+            'warm': bench_command(args, tmp, name, COMMANDS[name], cold=False),
+        }
+
+    return results
+
+
+def make_userspace(root, depth, size_kib):
+    """Create a qmk_userspace with a qmk.json of about size_kib, and return a directory depth levels below it.
+    """
+    userspace = root / 'qmk_userspace'
+    build_targets = []
+    qmk_json = {'userspace_version': '1.1', 'build_targets': build_targets}
+    target_size = len(json.dumps(['keyboard/00000', 'keymap_00000'])) + 2
+
+    for i in range(max(size_kib * 1024 // target_size, 1)):
+        build_targets.append([f'keyboard/{i:05}', f'keymap_{i:05}'])
+
+    cwd = userspace.joinpath(*[f'd{level}' for level in range(depth)])
+    cwd.mkdir(parents=True)
+    (userspace / 'qmk.json').write_text(json.dumps(qmk_json), encoding='utf-8')
+
+    # The discovery cache won't store anything that changed in the last couple of seconds, so make it look like we set this up earlier.
+    an_hour_ago = time.time() - 3600
+    for path in [userspace / 'qmk.json', *reversed(cwd.relative_to(root).parents), cwd]:
+        os.utime(root / path, (an_hour_ago, an_hour_ago))
+
+    return cwd
+
+
+def bench_discovery(args, tmp):
+    """Measure discovery from different depths below qmk_userspace, with different qmk.json sizes.
+    """
+    results = {}
+
+    for depth in args.depths:
+        for size_kib in args.qmk_json_sizes:
+            case = f'depth{depth}-{size_kib}kib'
+            cwd = make_userspace(tmp / case, depth, size_kib)
+            env = qmk_env(args, tmp, tmp / f'cache-{case}')
+
+            # Creating the cache directory on the first write would touch tmp, which is one of the directories discovery depends on
+            (tmp / f'cache-{case}').mkdir()
+            result = subprocess.run([sys.executable, '-c', DISCOVERY_SCRIPT, str(args.runs)], env=env, cwd=cwd, stdout=subprocess.PIPE, check=True)
+            found = json.loads(result.stdout)
+
+            if Path(found['userspace']) != (tmp / case / 'qmk_userspace').resolve():
+                raise SystemExit(f'{case}: found qmk_userspace at {found["userspace"]}, not {tmp / case / "qmk_userspace"}')
+
+            results[case] = {
+                'depth': depth,
+                'qmk_json_kib': size_kib,
+                'uncached': summarize(found['uncached']),
+                'cached': summarize(found['cached']),
+            }
+
+    return results
+
+
+def import_times(argv, env, cwd):
+    """Returns the self time in ms of every module imported by one run of qmk.
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-m', 'qmk_cli', *argv], env=env, cwd=cwd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+    modules = {}
+
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+
+        if match:
+            modules[match.group(4)] = int(match.group(1)) / 1000
+
+    return modules
+
+
+def bench_imports(args, tmp):
+    """Break down the import time of each command by top level package.
+    """
+    results = {}
+
+    for name in args.commands:
+        env = qmk_env(args, tmp, tmp / f'cache-imports-{name}')
+        import_times(COMMANDS[name], env, args.qmk_home or tmp)
+        packages = {}
+        totals = []
+
+        for _ in range(args.runs):
+            package_times = {}
+            modules = import_times(COMMANDS[name], env, args.qmk_home or tmp)
+            totals.append(sum(modules.values()))
+
+            for module, ms in modules.items():
+                package = module.split('.')[0]
+                package_times[package] = package_times.get(package, 0) + ms
+
+            for package, ms in package_times.items():
+                packages.setdefault(package, []).append(ms)
+
+        medians = sorted(((statistics.median(times), package) for package, times in packages.items()), reverse=True)
+        results[name] = {
+            'total_ms': statistics.median(totals),
+            'modules': len(modules),
+            'packages_ms': {
+                package: ms
+                for ms, package in medians[:args.top]
+            },
+        }
+
+    return results
+
+
+def metrics(results):
+    """Returns the numbers we compare against a baseline, as a flat {name: ms} dict.
+    """
+    flat = {}
+
+    for name, result in results.get('startup', {}).items():
+        flat[f'startup.{name}.cold'] = result['cold']['median_ms']
+        flat[f'startup.{name}.warm'] = result['warm']['median_ms']
+
+    for case, result in results.get('discovery', {}).items():
+        flat[f'discovery.{case}.uncached'] = result['uncached']['median_ms']
+        flat[f'discovery.{case}.cached'] = result['cached']['median_ms']
+
+    for name, result in results.get('imports', {}).items():
+        flat[f'imports.{name}.total'] = result['total_ms']
+
+    return flat
+
+
+def compare(results, baseline, threshold, min_delta):
+    """Compare results to a baseline, returning a row for every metric in both and a list of the ones that regressed.
+    """
+    current = metrics(results)
+    previous = metrics(baseline)
+    rows = []
+    regressions = []
+
+    for name in current:
+        if name not in previous:
+            continue
+
+        change = (current[name] - previous[name]) / previous[name] * 100 if previous[name] else 0
+        regressed = change > threshold and current[name] - previous[name] > min_delta
+        rows.append({'metric': name, 'baseline_ms': previous[name], 'ms': current[name], 'change_percent': change, 'regressed': regressed})
+
+        if regressed:
+            regressions.append(name)
+
+    return rows, regressions
+
+
+def print_results(results):
+    for result in results.get('startup', {}).values():
+        print(f"qmk {' '.join(result['argv'])}")
+
+        for mode in ('cold', 'warm'):
+            stats = result[mode]
+            print(f"    {mode:<6} median {stats['median_ms']:7.1f}ms  min {stats['min_ms']:7.1f}ms  p90 {stats['p90_ms']:7.1f}ms")
+            print('           ' + '  '.join(f'{phase} {ms:.1f}' for phase, ms in stats['phases_ms'].items()))
+
+    if results.get('discovery'):
+        print('discovery                  uncached      cached')
+
+        for case, result in results['discovery'].items():
+            print(f"    {case:<20} {result['uncached']['median_ms']:8.2f}ms  {result['cached']['median_ms']:8.2f}ms")
+
+    for name, result in results.get('imports', {}).items():
+        print(f"imports for {name}: {result['total_ms']:.1f}ms in {result['modules']} modules")
+
+        for package, ms in result['packages_ms'].items():
+            print(f'    {package:<24} {ms:7.1f}ms')
+
+
+def print_comparison(rows, threshold):
+    print(f"{'Metric':<40} {'Baseline':>10} {'Now':>10} {'Change':>8}")
+
+    for row in rows:
+        flag = '  REGRESSION' if row['regressed'] else ''
+        print(f"{row['metric']:<40} {row['baseline_ms']:>8.2f}ms {row['ms']:>8.2f}ms {row['change_percent']:>+7.1f}%{flag}")
+
+    print(f"Threshold: {threshold}%")
+
+
+BENCHMARKS = {
+    'startup': bench_startup,
+    'discovery': bench_discovery,
+    'imports': bench_imports,
+}
+
+
+def comma_list(convert):
+    return lambda value: [convert(item) for item in value.split(',') if item]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--runs', type=int, default=10, help='Times to run each benchmark (Default: 10)')
+    parser.add_argument('--only', action='append', choices=BENCHMARKS, help='Only run this benchmark. May be passed multiple times.')
+    parser.add_argument('--commands', type=comma_list(str), default=list(COMMANDS), help=f'Comma separated commands to benchmark (Default: {",".join(COMMANDS)})')
+    parser.add_argument('--depths', type=comma_list(int), default=[0, 4, 16], help='Comma separated directory depths to run discovery from (Default: 0,4,16)')
+    parser.add_argument('--qmk-json-sizes', type=comma_list(int), default=[1, 1024, 10240], help='Comma separated qmk.json sizes in KiB (Default: 1,1024,10240)')
+    parser.add_argument('--qmk-home', type=Path, help='Run qmk against this qmk_firmware (Default: none)')
+    parser.add_argument('--top', type=int, default=15, help='Number of packages to show import times for (Default: 15)')
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    parser.add_argument('--output', type=Path, help='Also write the results as JSON to this file')
+    parser.add_argument('--baseline', type=Path, help='Compare against results saved with --output')
+    parser.add_argument('--threshold', type=float, default=10, help='Percent slower than the baseline that counts as a regression (Default: 10)')
+    parser.add_argument('--min-delta', type=float, default=1, help='Ignore changes smaller than this many ms (Default: 1)')
+    args = parser.parse_args()
+
+    unknown = set(args.commands) - set(COMMANDS)
+    if unknown:
+        parser.error(f'Unknown command(s): {", ".join(sorted(unknown))}')
+
+    if args.qmk_home:
+        args.qmk_home = args.qmk_home.resolve()
+
+    results = {
+        'python_version': sys.version.split()[0],
+        'platform': sys.platform,
+        'runs': args.runs,
+        'qmk_home': str(args.qmk_home) if args.qmk_home else None,
+    }
+
+    with tempfile.TemporaryDirectory(prefix='qmk-startup-') as tmp:
+        tmp = Path(tmp).resolve()
+
+        for benchmark in args.only or BENCHMARKS:
+            results[benchmark] = BENCHMARKS[benchmark](args, tmp)
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=4) + '\n', encoding='utf-8')
+
+    regressions = []
+
+    if args.baseline:
+        rows, regressions = compare(results, json.loads(args.baseline.read_text(encoding='utf-8')), args.threshold, args.min_delta)
+        results['comparison'] = {'baseline': str(args.baseline), 'threshold_percent': args.threshold, 'metrics': rows, 'regressions': regressions}
+
+    if args.json:
+        print(json.dumps(results, indent=4))
+    else:
+        print_results(results)
+
+        if args.baseline:
+            print_comparison(results['comparison']['metrics'], args.threshold)
+
+    if regressions:
+        print(f'{len(regressions)} regression(s): {", ".join(regressions)}', file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+"""Entrypoint for the `qmk` command and `python -m qmk_cli`.
+
+This runs before anything else, so it only imports the standard library. Shell completion requests are answered from the completion index, without importing milc, when possible. When a `qmk daemon` is running the command is handed off to it, otherwise the full CLI is imported and run in this process.
+"""
+# This is imported first so it can time everything else.
+from qmk_cli import profiler  # noqa: F401
+
+import os
+import sys
+
+from qmk_cli import daemon
+
+
+def main():
+    """Run the command in `qmk daemon` if we can, or in this process if we can't.
+    """
+    if '_ARGCOMPLETE' in os.environ:
+        from qmk_cli import completion
+
+        if completion.complete():
+            sys.exit(0)
+
+    exit_code = daemon.forward()
+
+    if exit_code is not None:
+        sys.exit(exit_code)
+
+    from qmk_cli.script_qmk import main
+
+    main()
+
+
+if __name__ == '__main__':
+    # milc names the config file after argv[0], which is __main__.py when run with `python -m`
+    sys.argv[0] = 'qmk'
+    main()
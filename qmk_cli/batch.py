@@ -0,0 +1,148 @@
+"""Run many `qmk` commands from one warm process.
+
+`qmk batch FILE` reads one command line from each line of FILE. Blank lines and anything after a `#` are ignored, and the leading `qmk` is optional. Each command runs in a child forked from this process, the same way `qmk daemon` runs commands, up to `jobs` at a time. Like the daemon's children, each one re-imports qmk_cli, milc and the firmware's `qmk` package so it sees fresh state; only the third party dependencies they import are loaded once and shared. The output of every command is captured and handed back in one piece when it finishes.
+
+On platforms without fork() every command runs in its own `qmk` process instead.
+"""
+import os
+import selectors
+import shlex
+import sys
+import time
+
+from .daemon import prepare_child, run_main
+from .jobs import JobRunner
+
+
+class BatchError(ValueError):
+    """Raised when a batch file can't be parsed.
+    """
+
+
+class BatchCommand(object):
+    """One command from a batch file, and what happened when it ran.
+    """
+    def __init__(self, line_number, argv):
+        self.line_number = line_number
+        self.argv = argv
+        self.output = bytearray()
+        self.returncode = None
+        self.start = self.end = None
+        self.pid = self.fd = None
+
+    def __str__(self):
+        return shlex.join(['qmk', *self.argv])
+
+    @property
+    def seconds(self):
+        return self.end - self.start
+
+
+def parse_batch(lines):
+    """Returns a list of BatchCommands for lines.
+    """
+    commands = []
+
+    for line_number, line in enumerate(lines, 1):
+        try:
+            argv = shlex.split(line, comments=True)
+        except ValueError as e:
+            raise BatchError(f'Line {line_number}: {e}: {line.strip()}') from e
+
+        if argv[:1] == ['qmk']:
+            argv = argv[1:]
+
+        if argv:
+            commands.append(BatchCommand(line_number, argv))
+
+    return commands
+
+
+def _fork(command, env, cwd):
+    """Start command in a child forked from this process, with its output going to a pipe.
+    """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+
+    if pid == 0:
+        code = 255
+
+        try:
+            os.close(read_fd)
+            prepare_child()
+            code = run_main([sys.argv[0], *command.argv], env, cwd, (os.open(os.devnull, os.O_RDONLY), write_fd, os.dup(write_fd)))
+        finally:
+            os._exit(code)
+
+    os.close(write_fd)
+    command.pid = pid
+    command.fd = read_fd
+
+
+def _run_forked(commands, jobs, finished):
+    """Run commands in forked children, jobs at a time.
+    """
+    env = dict(os.environ)
+    cwd = os.environ.get('ORIG_CWD', os.getcwd())
+    waiting = iter(commands)
+    selector = selectors.DefaultSelector()
+
+    def start_next():
+        command = next(waiting, None)
+
+        if command:
+            command.start = time.monotonic()
+            _fork(command, env, cwd)
+            selector.register(command.fd, selectors.EVENT_READ, command)
+
+    for _ in range(jobs):
+        start_next()
+
+    while selector.get_map():
+        for key, _ in selector.select():
+            command = key.data
+            data = os.read(command.fd, 65536)
+
+            if data:
+                command.output += data
+                continue
+
+            selector.unregister(command.fd)
+            os.close(command.fd)
+            _, status = os.waitpid(command.pid, 0)
+            command.returncode = os.waitstatus_to_exitcode(status)
+            command.end = time.monotonic()
+            finished(command)
+            start_next()
+
+
+def _run_subprocess(commands, jobs, finished):
+    """Run each command in its own `qmk` process, jobs at a time.
+    """
+    batch_commands = {}
+
+    def job_finished(job):
+        command = batch_commands[job]
+        command.output = job.output
+        command.returncode = job.returncode
+        command.start, command.end = job.start, job.end
+        finished(command)
+
+    runner = JobRunner(jobs, finished=job_finished)
+
+    for command in commands:
+        job = runner.submit([sys.executable, '-m', 'qmk_cli', *command.argv], name=str(command), cwd=os.environ.get('ORIG_CWD'))
+        batch_commands[job] = command
+
+    runner.run()
+
+
+def run_batch(commands, jobs=1, finished=None):
+    """Run commands, jobs at a time, calling finished(command) as each one completes.
+    """
+    finished = finished or (lambda command: None)
+
+    if hasattr(os, 'fork'):
+        return _run_forked(commands, max(jobs, 1), finished)
+
+    return _run_subprocess(commands, max(jobs, 1), finished)
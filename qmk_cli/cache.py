@@ -0,0 +1,62 @@
+"""Helpers for the files qmk_cli keeps in its cache directory.
+
+Everything stored here can be regenerated, so every failure to read or write a cache file is treated as a cache miss rather than an error.
+
+The shell completion hook reads the cache before milc is imported, so this module only imports milc when it has something to log.
+"""
+import json
+import os
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+
+import platformdirs
+
+CACHE_DIR = Path(os.environ['QMK_CACHE_DIR'] if 'QMK_CACHE_DIR' in os.environ else platformdirs.user_cache_dir('qmk'))
+
+
+def fingerprint(path):
+    """Returns a `[inode, mtime_ns, size]` list for path, or None if it does not exist.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+
+    return [st.st_ino, st.st_mtime_ns, st.st_size]
+
+
+def read_cache(name):
+    """Returns the decoded contents of the JSON cache file `name`, or None if it is missing or unreadable.
+    """
+    try:
+        with open(CACHE_DIR / name, encoding='utf-8') as fd:
+            return json.load(fd)
+
+    except (OSError, ValueError):
+        return None
+
+
+def write_cache(name, data):
+    """Atomically replace the JSON cache file `name` with data.
+    """
+    tmpfile_name = None
+
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+
+        with NamedTemporaryFile(mode='w', dir=str(CACHE_DIR), prefix=f'.{name}.', delete=False, encoding='utf-8') as tmpfile:
+            tmpfile_name = tmpfile.name
+            json.dump(data, tmpfile)
+
+        os.replace(tmpfile_name, CACHE_DIR / name)
+        return True
+
+    except OSError as e:
+        from milc import cli
+
+        cli.log.debug('Could not write cache file %s: %s: %s', CACHE_DIR / name, e.__class__.__name__, e)
+
+        if tmpfile_name and os.path.exists(tmpfile_name):
+            os.unlink(tmpfile_name)
+
+        return False
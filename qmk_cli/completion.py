@@ -0,0 +1,510 @@
+"""Answer shell completion requests from a cached index.
+
+With argcomplete every press of tab runs `qmk` all the way through startup, including importing the firmware CLI, just to find out what it accepts. Instead we keep an index of every subcommand, option and the values they accept in the cache directory. When argcomplete runs `qmk` the entrypoint answers from the index before milc or qmk.cli are imported.
+
+The index is keyed by the qmk_cli version, the qmk_firmware it describes, $QMK_HOME and the commit qmk_firmware has checked out. It also watches the qmk config file, git's index, the keyboards directory and our own subcommand modules. If qmk_firmware had uncommitted changes when the index was built it goes stale after DIRTY_MAX_AGE seconds. A stale index is still used to answer, while a new one is built in the background by `python -m qmk_cli.completion`.
+
+Arguments whose completions depend on the rest of the command line, such as a keymap for the keyboard given with -kb, can't be cached. Completing one of those, or completing before there is an index, falls back to starting up completely. Set QMK_NO_COMPLETION_INDEX to always do that.
+"""
+import os
+import sys
+import time
+from pathlib import Path
+
+from argcomplete import CompletionFinder, split_line
+from argcomplete.completers import FilesCompleter
+
+from qmk_cli import __version__
+from qmk_cli.cache import CACHE_DIR, fingerprint, read_cache, write_cache
+
+COMPLETION_INDEX = 'completion.json'
+COMPLETION_LOCK = 'completion.lock'
+DIRTY_MAX_AGE = 60  # Seconds an index built from a qmk_firmware with uncommitted changes is trusted
+REBUILD_TIMEOUT = 300  # Seconds before we assume a rebuild that never finished has died
+FIRMWARE_MARKER = 'lib/python/qmk/cli/__init__.py'
+STATIC_COMPLETERS = ('qmk.keyboard.keyboard_completer',)  # Completers whose values don't depend on anything else on the command line
+
+
+class DynamicCompletionError(Exception):
+    """Raised when completing an argument whose values aren't in the index.
+    """
+
+
+def git_dir(repo):
+    """Returns the git directory for repo, following the .git file used by worktrees and submodules.
+    """
+    path = repo / '.git'
+
+    if path.is_file():
+        try:
+            gitdir = path.read_text(encoding='utf-8').strip()
+        except OSError:
+            return path
+
+        if gitdir.startswith('gitdir:'):
+            return (repo / gitdir[7:].strip()).resolve()
+
+    return path
+
+
+def git_head(repo):
+    """Returns the commit repo has checked out, or None if it isn't a git checkout.
+
+    This reads git's files directly rather than running git, which would cost more than the rest of answering a completion request.
+    """
+    path = git_dir(repo)
+
+    try:
+        head = (path / 'HEAD').read_text(encoding='utf-8').strip()
+    except OSError:
+        return None
+
+    if not head.startswith('ref:'):
+        return head
+
+    ref = head[4:].strip()
+    common_dir = path
+
+    try:
+        common_dir = (path / (path / 'commondir').read_text(encoding='utf-8').strip()).resolve()
+    except OSError:
+        pass
+
+    for ref_dir in (path, common_dir):
+        try:
+            return (ref_dir / ref).read_text(encoding='utf-8').strip()
+        except OSError:
+            pass
+
+    try:
+        for line in (common_dir / 'packed-refs').read_text(encoding='utf-8').splitlines():
+            sha, _, name = line.partition(' ')
+            if name == ref:
+                return sha
+
+    except OSError:
+        pass
+
+    return None
+
+
+def firmware_upwards():
+    """Returns the qmk_firmware containing the current directory, or None.
+    """
+    cwd = Path.cwd()
+
+    for path in (cwd, *cwd.parents):
+        if (path / FIRMWARE_MARKER).exists():
+            return path
+
+
+def index_key(qmk_firmware, qmk_home):
+    """Returns the key an index for qmk_firmware, found with $QMK_HOME set to qmk_home, must have to be current.
+    """
+    return [__version__, str(qmk_firmware), qmk_home, git_head(qmk_firmware)]
+
+
+def is_stale(index):
+    """Returns True if index no longer describes what `qmk` would do here.
+    """
+    qmk_firmware = firmware_upwards() or Path(index['key'][1])
+
+    if index['key'] != index_key(qmk_firmware, os.environ.get('QMK_HOME')):
+        return True
+
+    if index['dirty'] and time.time() - index['built'] > DIRTY_MAX_AGE:
+        return True
+
+    return any(fingerprint(path) != fp for path, fp in index['watched'])
+
+
+def rebuild():
+    """Start building a new index in the background, unless another rebuild is already running.
+    """
+    import subprocess
+
+    lock = CACHE_DIR / COMPLETION_LOCK
+
+    try:
+        if time.time() - os.stat(lock).st_mtime > REBUILD_TIMEOUT:
+            os.unlink(lock)
+    except OSError:
+        pass
+
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except OSError:
+        return
+
+    # Keep argcomplete and the profiler out of the rebuild, it has to start up like a normal `qmk` run.
+    env = {key: value for key, value in os.environ.items() if not key.startswith(('_ARGCOMPLETE', 'COMP_')) and key != 'QMK_PROFILE'}
+
+    try:
+        subprocess.Popen([sys.executable, '-m', 'qmk_cli.completion'], env=env, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+    except OSError:
+        os.unlink(lock)
+
+
+class CommandLine(object):
+    """Walks the index along the words before the cursor, the way argparse would walk its parsers.
+    """
+    def __init__(self, index):
+        self.values = index['values']
+        self.node = index['tree']
+        self.positional = 0  # Index of the positional the next word goes to
+        self.consumed = 0  # Words the current positional already has
+        self.pending = None  # Option still taking arguments
+        self.remaining = 0  # Arguments pending must still get
+        self.dashdash = False
+
+    def option(self, string):
+        """Returns the option in the current parser with the option string `string`.
+        """
+        for option in self.node['options']:
+            if string in option['strings']:
+                return option
+
+    def current_positional(self):
+        """Returns the positional the next word goes to, or None.
+        """
+        positionals = self.node['positionals']
+
+        if self.positional < len(positionals):
+            return positionals[self.positional]
+
+    def remaining_positionals(self):
+        """Returns the positional the next word goes to and every one after it.
+        """
+        return self.node['positionals'][self.positional:]
+
+    def feed(self, word):
+        """Account for a word before the cursor.
+        """
+        if self.pending and self._feed_pending(word):
+            return
+
+        if word == '--' and not self.dashdash:
+            self.dashdash = True
+
+        elif word.startswith('-') and word != '-' and not self.dashdash:
+            self._feed_option(word)
+
+        else:
+            self._feed_positional(word)
+
+    def _feed_pending(self, word):
+        """Returns True if word is an argument to the pending option.
+        """
+        nargs = self.pending['nargs']
+
+        if isinstance(nargs, int):
+            self.remaining -= 1
+
+            if not self.remaining:
+                self.pending = None
+
+            return True
+
+        if word.startswith('-') and word != '-':
+            self.pending = None
+            return False
+
+        if nargs == '?':
+            self.pending = None
+
+        self.remaining = 0
+        return True
+
+    def _feed_option(self, word):
+        string, equals, _ = word.partition('=')
+        option = self.option(string)
+
+        if not option and not word.startswith('--') and len(word) > 2:
+            # An argument stuck to a short option, eg `-j4`
+            option = self.option(word[:2])
+            equals = True
+
+        if not option:
+            return
+
+        if option['nargs'] != 0 and not equals:
+            self.pending = option
+            self.remaining = option['nargs'] if isinstance(option['nargs'], int) else 1 if option['nargs'] == '+' else 0
+
+    def _feed_positional(self, word):
+        positional = self.current_positional()
+
+        if not positional:
+            return
+
+        if 'subcommands' in positional:
+            if word in positional['subcommands']:
+                self.node = positional['subcommands'][word]
+                self.positional = self.consumed = 0
+
+            return
+
+        self.consumed += 1
+
+        if positional['nargs'] == '?' or (isinstance(positional['nargs'], int) and self.consumed >= positional['nargs']):
+            self.positional += 1
+            self.consumed = 0
+
+    def argument_values(self, argument, prefix):
+        """Returns {value: description} for the values of argument that start with prefix.
+        """
+        complete = argument['complete']
+
+        if complete == 'dynamic':
+            raise DynamicCompletionError(argument)
+
+        if complete == 'files':
+            return dict.fromkeys(FilesCompleter()(prefix), '')
+
+        if isinstance(complete, int):
+            description = argument['help'] if argument['choices'] else ''
+            return {value: description for value in self.values[complete] if value.startswith(prefix)}
+
+        return {}
+
+    def options(self, prefix):
+        """Returns {option string: help} for the options of the current parser that start with prefix.
+        """
+        completions = {}
+
+        for option in self.node['options']:
+            if option['hidden']:
+                continue
+
+            for string in option['strings']:
+                if string.startswith(prefix):
+                    completions[string] = option['help']
+
+        return completions
+
+    def completions(self, prefix):
+        """Returns {completion: description} for the word under the cursor, following argcomplete's rules.
+        """
+        is_option = prefix.startswith('-')
+
+        if self.pending and self.remaining and not is_option:
+            return self.argument_values(self.pending, prefix)
+
+        if is_option and '=' in prefix:
+            string, _, value = prefix.partition('=')
+            option = self.option(string)
+
+            if not option or option['nargs'] == 0:
+                return {}
+
+            return {f'{string}={completion}': description for completion, description in self.argument_values(option, value).items()}
+
+        completions = self.options(prefix) if is_option or not self.dashdash else {}
+
+        if is_option:
+            return completions
+
+        if self.pending:
+            completions.update(self.argument_values(self.pending, prefix))
+
+        # Like argcomplete we don't know how many words the user will give an open ended positional, so we complete the ones after it as well.
+        for positional in self.remaining_positionals():
+            if 'subcommands' in positional:
+                completions.update({name: description for name, description in positional['help'].items() if name.startswith(prefix)})
+            else:
+                completions.update(self.argument_values(positional, prefix))
+
+        return completions
+
+
+def write_completions(completions, prequote, last_wordbreak_pos):
+    """Send completions back to the shell the way argcomplete does.
+    """
+    finder = CompletionFinder()
+    finder._display_completions = completions
+    quoted = finder.quote_completions(list(completions), prequote, last_wordbreak_pos)
+    descriptions = finder._display_completions
+    ifs = os.environ.get('_ARGCOMPLETE_IFS', '\013')
+    dfs = os.environ.get('_ARGCOMPLETE_DFS')
+
+    if dfs:
+        quoted = [dfs.join((completion, (descriptions.get(completion) or '').replace(ifs, ' '))) for completion in quoted]
+
+    if os.environ.get('_ARGCOMPLETE_SHELL') == 'zsh':
+        quoted = [f'{completion}:{descriptions.get(completion)}' for completion in quoted]
+
+    filename = os.environ.get('_ARGCOMPLETE_STDOUT_FILENAME')
+
+    with (open(filename, 'w') if filename else os.fdopen(8, 'w')) as output:
+        output.write(ifs.join(quoted))
+
+
+def complete():
+    """Answer the argcomplete request in our environment from the index.
+
+    Returns False when the request has to be answered by starting up completely instead.
+    """
+    if 'QMK_NO_COMPLETION_INDEX' in os.environ:
+        return False
+
+    index = read_cache(COMPLETION_INDEX)
+
+    try:
+        if not index or is_stale(index):
+            rebuild()
+
+        if not index:
+            return False
+
+        prequote, prefix, _, words, last_wordbreak_pos = split_line(os.environ['COMP_LINE'], int(os.environ['COMP_POINT']))
+        command_line = CommandLine(index)
+
+        for word in words[int(os.environ['_ARGCOMPLETE']):]:
+            command_line.feed(word)
+
+        write_completions(command_line.completions(prefix), prequote, last_wordbreak_pos)
+
+    except DynamicCompletionError:
+        return False
+
+    except (KeyError, IndexError, TypeError, ValueError, OSError):
+        rebuild()
+        return False
+
+    return True
+
+
+def _value_list(values, value_ids, new_values):
+    """Add a list of values to the index's value table, returning its position.
+    """
+    new_values = tuple(str(value) for value in new_values)
+
+    if new_values not in value_ids:
+        value_ids[new_values] = len(values)
+        values.append(new_values)
+
+    return value_ids[new_values]
+
+
+def _describe_completion(parser, action, values, value_ids):
+    """Returns how to complete action's arguments: a position in the value table, 'files', 'dynamic', or None for nothing.
+    """
+    import argparse
+    from argcomplete.completers import ChoicesCompleter, SuppressCompleter
+
+    completer = getattr(action, 'completer', None)
+
+    if action.nargs == argparse.REMAINDER:
+        return 'dynamic'
+
+    if completer is None:
+        return 'files' if action.choices is None else _value_list(values, value_ids, action.choices)
+
+    if isinstance(completer, SuppressCompleter) and completer.suppress():
+        return None
+
+    if isinstance(completer, ChoicesCompleter):
+        return _value_list(values, value_ids, completer.choices)
+
+    if f'{getattr(completer, "__module__", "")}.{getattr(completer, "__qualname__", "")}' in STATIC_COMPLETERS:
+        try:
+            return _value_list(values, value_ids, completer(prefix='', action=action, parser=parser, parsed_args=argparse.Namespace()))
+        except Exception:
+            pass
+
+    return 'dynamic'
+
+
+def _describe_parser(parser, values, value_ids):
+    """Returns the index entry for an argparse parser and its subcommands.
+    """
+    import argparse
+
+    node = {'options': [], 'positionals': []}
+    formatter = parser._get_formatter()
+
+    for action in parser._actions:
+        try:
+            help_text = formatter._expand_help(action) if action.help and action.help != argparse.SUPPRESS else ''
+        except (KeyError, TypeError, ValueError):
+            help_text = action.help
+
+        if isinstance(action, argparse._SubParsersAction):
+            descriptions = {choice.dest: choice.help or '' for choice in action._choices_actions}
+            node['positionals'].append({
+                'nargs': action.nargs,
+                'subcommands': {
+                    name: _describe_parser(subparser, values, value_ids)
+                    for name, subparser in action.choices.items()
+                },
+                'help': {
+                    name: descriptions.get(name, '')
+                    for name in action.choices
+                },
+            })
+            continue
+
+        argument = {
+            'nargs': 1 if action.nargs is None else action.nargs,
+            'complete': _describe_completion(parser, action, values, value_ids) if action.nargs != 0 else None,
+            'choices': action.choices is not None,
+            'help': help_text,
+        }
+
+        if action.option_strings:
+            argument['strings'] = action.option_strings
+            argument['hidden'] = action.help == argparse.SUPPRESS
+            node['options'].append(argument)
+        else:
+            node['positionals'].append(argument)
+
+    return node
+
+
+def build_index():
+    """Start up the way `qmk` does and write an index of everything it accepts.
+    """
+    import subprocess
+
+    import milc
+
+    qmk_home = os.environ.get('QMK_HOME')
+    sys.argv = ['qmk']
+
+    from qmk_cli.script_qmk import load
+
+    qmk_firmware = load()
+    dirty = False
+
+    try:
+        status = subprocess.run(['git', 'status', '--porcelain'], cwd=qmk_firmware, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=REBUILD_TIMEOUT)
+        dirty = status.returncode == 0 and bool(status.stdout.strip())
+    except (OSError, subprocess.TimeoutExpired):
+        pass
+
+    subcommands_dir = Path(__file__).parent / 'subcommands'
+    watched = [milc.cli.milc.config_file, git_dir(qmk_firmware) / 'index', qmk_firmware / 'keyboards', *sorted(subcommands_dir.glob('*.py'))]
+    values, value_ids = [], {}
+
+    write_cache(
+        COMPLETION_INDEX,
+        {
+            'key': index_key(qmk_firmware, qmk_home),
+            'built': time.time(),
+            'dirty': dirty,
+            'watched': [[str(path), fingerprint(path)] for path in watched],
+            'tree': _describe_parser(milc.cli.milc._arg_parser, values, value_ids),
+            'values': values,
+        },
+    )
+
+
+if __name__ == '__main__':
+    try:
+        build_index()
+    finally:
+        try:
+            os.unlink(CACHE_DIR / COMPLETION_LOCK)
+        except OSError:
+            pass
@@ -0,0 +1,2 @@
+"""Support code for `qmk console`.
+"""
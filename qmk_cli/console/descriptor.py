@@ -0,0 +1,133 @@
+"""Identify QMK consoles from their HID report descriptor.
+
+Some versions of Linux don't report usage and usage_page through hidapi. For those we read the report descriptor from sysfs and parse it ourselves. Descriptors only change when a device does, so the results are cached per hidraw node and only rechecked after a hotplug event.
+"""
+import os
+
+CONSOLE_USAGE = (0xFF31, 0x0074)
+SYSFS_HIDRAW = '/sys/class/hidraw'
+
+# Item types and tags, see section 6.2.2 of the HID 1.11 specification
+MAIN = 0
+GLOBAL = 1
+LOCAL = 2
+COLLECTION = 0xA
+END_COLLECTION = 0xC
+USAGE_PAGE = 0x0
+PUSH = 0xA
+POP = 0xB
+USAGE = 0x0
+LONG_ITEM = 0xFE
+
+
+def top_level_usages(descriptor):
+    """Returns the (usage page, usage) of every top level collection in a HID report descriptor.
+    """
+    usages = []
+    local_usages = []
+    usage_page = 0
+    global_stack = []
+    depth = 0
+    offset = 0
+
+    while offset < len(descriptor):
+        prefix = descriptor[offset]
+
+        if prefix == LONG_ITEM:
+            if offset + 1 >= len(descriptor):
+                break
+
+            offset += 3 + descriptor[offset + 1]
+            continue
+
+        size = (0, 1, 2, 4)[prefix & 0x3]
+        item_type = (prefix >> 2) & 0x3
+        tag = prefix >> 4
+        value = int.from_bytes(descriptor[offset + 1:offset + 1 + size], 'little')
+        offset += 1 + size
+
+        if item_type == GLOBAL:
+            if tag == USAGE_PAGE:
+                usage_page = value
+            elif tag == PUSH:
+                global_stack.append(usage_page)
+            elif tag == POP and global_stack:
+                usage_page = global_stack.pop()
+
+        elif item_type == LOCAL:
+            if tag == USAGE:
+                local_usages.append((value >> 16, value & 0xFFFF) if size == 4 else (None, value))
+
+        elif item_type == MAIN:
+            if tag == COLLECTION:
+                if depth == 0 and local_usages:
+                    page, usage = local_usages[0]
+                    usages.append((usage_page if page is None else page, usage))
+
+                depth += 1
+
+            elif tag == END_COLLECTION:
+                depth = max(depth - 1, 0)
+
+            local_usages = []
+
+    return usages
+
+
+def is_console_descriptor(descriptor):
+    """Returns True if a report descriptor describes a QMK console.
+    """
+    return CONSOLE_USAGE in top_level_usages(descriptor)
+
+
+class DescriptorCache(object):
+    """Remembers which hidraw nodes are consoles.
+
+    Entries are keyed by node name and checked against the identity of the sysfs device behind the node, its resolved path and inode, but only after `invalidate()` has been called.
+    """
+    def __init__(self, sysfs=SYSFS_HIDRAW):
+        self.sysfs = sysfs
+        self.entries = {}
+        self.validated = set()
+
+    def invalidate(self):
+        """Recheck every node the next time it's looked up. Call this when devices may have changed.
+        """
+        self.validated.clear()
+
+    def identity(self, node):
+        """Returns a value identifying the device currently behind node, or None if it's gone.
+        """
+        device = os.path.join(self.sysfs, node, 'device')
+
+        try:
+            return os.path.realpath(device), os.stat(device).st_ino
+        except OSError:
+            return None
+
+    def is_console(self, node):
+        """Returns True if the hidraw node (eg `hidraw3`) is a QMK console.
+        """
+        entry = self.entries.get(node)
+
+        if entry and node in self.validated:
+            return entry[1]
+
+        identity = self.identity(node)
+
+        if identity is None:
+            self.entries.pop(node, None)
+            return False
+
+        if not entry or entry[0] != identity:
+            try:
+                with open(os.path.join(self.sysfs, node, 'device', 'report_descriptor'), 'rb') as fd:
+                    entry = (identity, is_console_descriptor(fd.read()))
+            except OSError:
+                return False
+
+            self.entries[node] = entry
+
+        self.validated.add(node)
+
+        return entry[1]
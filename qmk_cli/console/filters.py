@@ -0,0 +1,119 @@
+"""Choose which devices and lines `qmk console` shows.
+"""
+import re
+from fnmatch import translate
+
+SELECTOR_FIELDS = {
+    'manufacturer': 'manufacturer_string',
+    'product': 'product_string',
+    'serial': 'serial_number',
+}
+
+
+class SelectorError(ValueError):
+    """Raised when a device selector can't be parsed.
+    """
+
+
+def _pattern(pattern):
+    """Compile a case-insensitive shell-style wildcard pattern.
+    """
+    return re.compile(translate(pattern), re.IGNORECASE)
+
+
+class DeviceSelector(object):
+    """Matches devices against one selector.
+
+    Selectors are either `<vid>:<pid>[:<index>]`, where vid and pid may contain wildcards, or `<field>=<pattern>` where field is one of manufacturer, product or serial.
+    """
+    def __init__(self, selector):
+        self.selector = selector
+        self.index = None
+        self.fields = []
+
+        if '=' in selector:
+            field, _, pattern = selector.partition('=')
+
+            if field not in SELECTOR_FIELDS:
+                raise SelectorError(f'Unknown device field "{field}", expected one of: {", ".join(SELECTOR_FIELDS)}')
+
+            self.fields.append((SELECTOR_FIELDS[field], _pattern(pattern)))
+            return
+
+        parts = selector.split(':')
+
+        if len(parts) not in (2, 3):
+            raise SelectorError(f'Invalid format for device, expected "<vid>:<pid>[:<index>]" or "<field>=<pattern>" but got "{selector}".')
+
+        if len(parts) == 3:
+            if not parts[2].isdigit():
+                raise SelectorError(f'Device index must be a number! Got "{parts[2]}" instead.')
+
+            self.index = int(parts[2])
+
+            if self.index < 1:
+                raise SelectorError(f'Device index must be greater than 0! Got {self.index}')
+
+        self.fields.append(('vendor_id', _pattern(parts[0])))
+        self.fields.append(('product_id', _pattern(parts[1])))
+
+    def __str__(self):
+        return self.selector
+
+    def matches(self, hid_device):
+        """Returns True if hid_device, which must already have its index set, is selected.
+        """
+        if self.index is not None and hid_device['index'] != self.index:
+            return False
+
+        for field, pattern in self.fields:
+            value = hid_device.get(field)
+
+            if isinstance(value, int):
+                value = '%04X' % value
+
+            if not pattern.match(value or ''):
+                return False
+
+        return True
+
+
+def parse_device_selectors(spec):
+    """Parse a comma separated list of device selectors. Returns a list of DeviceSelector objects.
+    """
+    return [DeviceSelector(selector.strip()) for selector in spec.split(',') if selector.strip()]
+
+
+def device_selected(selectors, hid_device):
+    """Returns True if hid_device matches any of selectors, or there are no selectors.
+    """
+    return not selectors or any(selector.matches(hid_device) for selector in selectors)
+
+
+def _compile(patterns):
+    """Compile a list of regular expressions.
+
+    Each is compiled on its own, rather than joined into one alternation, so inline flags like `(?i)` and group references keep working.
+    """
+    return [re.compile(pattern) for pattern in patterns]
+
+
+class LineFilter(object):
+    """Decides whether a line is shown, based on --grep and --exclude.
+
+    Every pattern is compiled once, up front.
+    """
+    def __init__(self, grep=(), exclude=()):
+        self.grep = _compile(grep)
+        self.exclude = _compile(exclude)
+
+    def __bool__(self):
+        return bool(self.grep or self.exclude)
+
+    def __call__(self, text):
+        """Returns True if text should be shown.
+        """
+        if self.grep and not any(pattern.search(text) for pattern in self.grep):
+            return False
+
+        return not any(pattern.search(text) for pattern in self.exclude)
@@ -0,0 +1,264 @@
+"""Wait for USB and HID devices to come and go.
+
+On Linux we watch /dev and /dev/bus/usb with inotify, or listen for uevents on a netlink socket if inotify isn't available, and only re-enumerate devices when something changes. Everywhere else we fall back to polling.
+"""
+import ctypes
+import os
+import select
+import socket
+import struct
+import threading
+import time
+from platform import platform
+
+from milc import cli
+
+POLL_INTERVAL = 0.1  # How often the polling backend rescans
+RESCAN_INTERVAL = 5  # How often event driven backends rescan anyway, in case an event was missed
+
+
+class PollingHotplug(object):
+    """Fallback for platforms without device notifications. Asks for a rescan every POLL_INTERVAL seconds.
+    """
+    name = 'polling'
+    interval = POLL_INTERVAL
+    notifies = False
+
+    def __init__(self):
+        self._wakeup = threading.Event()
+
+    def wake(self):
+        """Make wait() return early. Safe to call from any thread.
+        """
+        self._wakeup.set()
+
+    def wait(self, timeout=None):
+        """Block until wake() is called or timeout seconds pass. Returns True if we were woken.
+        """
+        woken = self._wakeup.wait(self.interval if timeout is None else timeout)
+        self._wakeup.clear()
+
+        return woken
+
+    def close(self):
+        pass
+
+
+class EventHotplug(object):
+    """Base class for backends that get notified through a file descriptor.
+    """
+    interval = RESCAN_INTERVAL
+    notifies = True
+    followup_delays = ()  # Extra rescans, in seconds after an event, for devices that aren't usable yet when we hear about them
+
+    def __init__(self, fd):
+        self.fd = fd
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        self._followups = []
+        os.set_blocking(self._wakeup_r, False)
+        os.set_blocking(self._wakeup_w, False)
+
+    def fileno(self):
+        return self.fd
+
+    def wake(self):
+        """Make wait() return early. Safe to call from any thread.
+        """
+        try:
+            os.write(self._wakeup_w, b'\0')
+        except BlockingIOError:
+            pass  # The pipe is full, wait() will return anyway
+
+    def wait(self, timeout=None):
+        """Block until a relevant device is added or removed, wake() is called, or timeout seconds pass.
+
+        Returns False if we timed out without anything happening, True if devices may have changed.
+        """
+        deadline = time.monotonic() + (self.interval if timeout is None else timeout)
+
+        while True:
+            now = time.monotonic()
+
+            if any(followup <= now for followup in self._followups):
+                self._followups = [followup for followup in self._followups if followup > now]
+                return True
+
+            if deadline <= now:
+                return False
+
+            wait_until = min([deadline, *self._followups])
+
+            ready, _, _ = select.select([self.fd, self._wakeup_r], [], [], wait_until - now)
+
+            if self._wakeup_r in ready:
+                while True:
+                    try:
+                        os.read(self._wakeup_r, 512)
+                    except BlockingIOError:
+                        break
+
+                return True
+
+            if self.fd in ready and self.read_events():
+                now = time.monotonic()
+                self._followups.extend(now + delay for delay in self.followup_delays)
+                return True
+
+    def read_events(self):
+        """Consume pending events. Returns True if any of them were for a device we care about.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        for fd in (self.fd, self._wakeup_r, self._wakeup_w):
+            os.close(fd)
+
+
+class InotifyHotplug(EventHotplug):
+    """Watch for hidraw nodes in /dev and usb nodes in /dev/bus/usb being created, removed or having their permissions changed.
+
+    Watching the device nodes rather than listening for uevents means we hear about a device after udev has made it accessible.
+    """
+    name = 'inotify'
+
+    IN_ATTRIB = 0x00000004
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_ISDIR = 0x40000000
+    IN_CLOEXEC = 0o2000000
+    IN_NONBLOCK = 0o4000
+    EVENT = struct.Struct('iIII')
+    NODE_EVENTS = IN_ATTRIB | IN_CREATE | IN_DELETE | IN_MOVED_TO
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        fd = self._libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+        try:
+            super().__init__(fd)
+        except OSError:
+            os.close(fd)
+            raise
+
+        self._watches = {}
+
+        try:
+            self._add_watch('/dev', self.NODE_EVENTS)
+
+            if os.path.isdir('/dev/bus/usb'):
+                self._add_watch('/dev/bus/usb', self.IN_CREATE | self.IN_DELETE)
+
+                for bus in os.listdir('/dev/bus/usb'):
+                    self._add_watch(os.path.join('/dev/bus/usb', bus), self.NODE_EVENTS)
+
+        except OSError:
+            self.close()
+            raise
+
+    def _add_watch(self, path, mask):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f'inotify_add_watch failed for {path}')
+
+        self._watches[wd] = path
+
+    def read_events(self):
+        changed = False
+
+        while True:
+            try:
+                data = os.read(self.fd, 4096)
+            except BlockingIOError:
+                return changed
+
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = self.EVENT.unpack_from(data, offset)
+                name = data[offset + self.EVENT.size:offset + self.EVENT.size + length].rstrip(b'\0')
+                offset += self.EVENT.size + length
+                path = self._watches.get(wd)
+
+                if path == '/dev':
+                    changed |= name.startswith(b'hidraw')
+
+                elif path == '/dev/bus/usb':
+                    if mask & self.IN_CREATE and mask & self.IN_ISDIR:
+                        try:
+                            self._add_watch(os.path.join(path, os.fsdecode(name)), self.NODE_EVENTS)
+
+                        except OSError as e:
+                            # The bus may already be gone again, or we may be out of watches. Either way the rescan this triggers, and the periodic ones after it, still find its devices.
+                            cli.log.debug('%s: %s', e.__class__.__name__, e)
+
+                    changed = True
+
+                elif path:
+                    changed = True
+
+
+class UeventHotplug(EventHotplug):
+    """Listen for hidraw and usb uevents on a netlink socket.
+
+    When udev is running we listen to the events it sends after processing its rules. Without udev we get the raw kernel events, which can arrive before the device node is accessible, so we rescan a couple more times after each one.
+    """
+    name = 'netlink'
+
+    NETLINK_KOBJECT_UEVENT = 15
+    KERNEL_GROUP = 1
+    UDEV_GROUP = 2
+    SUBSYSTEMS = (b'SUBSYSTEM=hidraw\0', b'SUBSYSTEM=usb\0')
+
+    def __init__(self):
+        udev = os.path.exists('/run/udev/control')
+        self._sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, self.NETLINK_KOBJECT_UEVENT)
+
+        try:
+            self._sock.bind((0, self.UDEV_GROUP if udev else self.KERNEL_GROUP))
+            self._sock.setblocking(False)
+        except OSError:
+            self._sock.close()
+            raise
+
+        if not udev:
+            self.followup_delays = (0.5, 2)
+
+        try:
+            super().__init__(self._sock.fileno())
+        except OSError:
+            self._sock.close()
+            raise
+
+    def read_events(self):
+        changed = False
+
+        while True:
+            try:
+                data = self._sock.recv(16384)
+            except BlockingIOError:
+                return changed
+
+            changed |= any(subsystem in data for subsystem in self.SUBSYSTEMS)
+
+    def close(self):
+        os.close(self._wakeup_r)
+        os.close(self._wakeup_w)
+        self._sock.close()
+
+
+def open_hotplug():
+    """Returns the best hotplug backend available on this platform.
+    """
+    if 'linux' in platform().lower():
+        for backend in (InotifyHotplug, UeventHotplug):
+            try:
+                return backend()
+
+            except (AttributeError, OSError) as e:
+                cli.log.debug('Could not use %s for hotplug events: %s: %s', backend.name, e.__class__.__name__, e)
+
+    return PollingHotplug()
@@ -0,0 +1,43 @@
+"""Assemble console reports into lines.
+"""
+REPORT_SIZE = 32  # The size of QMK's console endpoint
+MAX_LINE_LENGTH = 64 * 1024  # Emit what we have if a line gets this long without a newline
+
+
+class LineAssembler(object):
+    """Collects raw console reports and returns each line once it is complete.
+
+    Reports are appended to a single bytearray. Only the newly added bytes are scanned for newlines, and each line is decoded exactly once, with undecodable bytes replaced rather than raising.
+    """
+    def __init__(self, encoding='utf-8'):
+        self.encoding = encoding
+        self.buffer = bytearray()
+
+    def feed(self, report):
+        """Add a report (any bytes-like object) and return a list of the lines it completed.
+        """
+        buffer = self.buffer
+        start = len(buffer)
+        buffer += report
+
+        # Reports are padded with NULs
+        if buffer.find(b'\0', start) != -1:
+            buffer[start:] = buffer[start:].replace(b'\0', b'')
+
+        lines = []
+        line_start = 0
+        newline = buffer.find(b'\n', start)
+
+        while newline != -1:
+            lines.append(buffer[line_start:newline].decode(self.encoding, errors='replace'))
+            line_start = newline + 1
+            newline = buffer.find(b'\n', line_start)
+
+        if len(buffer) - line_start >= MAX_LINE_LENGTH:
+            lines.append(buffer[line_start:].decode(self.encoding, errors='replace'))
+            line_start = len(buffer)
+
+        if line_start:
+            del buffer[:line_start]
+
+        return lines
@@ -0,0 +1,176 @@
+"""Output formats for `qmk console`.
+
+Lines are formatted as they arrive but only written out when the reader calls `flush()`, which it does once for every batch of reports it reads. The per-device part of each line is formatted once, when the device connects.
+"""
+import json
+import sys
+import time
+from threading import Lock
+
+from milc.ansi import ansi_colors, format_ansi
+
+FORMATS = ('pretty', 'raw', 'json', 'jsonl')
+
+
+class ConsoleWriter(object):
+    """Base class for output formats. Subclasses implement `identity()` and `format()`.
+    """
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self.pending = []
+        self.lock = Lock()
+
+    def identity(self, hid_device):
+        """Returns the preformatted part of every line from hid_device.
+        """
+        return None
+
+    def format(self, identity, text, timestamp=None):
+        """Returns the output for one line of text. timestamp is only passed for lines that were not received just now.
+        """
+        raise NotImplementedError
+
+    def write(self, identity, text, timestamp=None):
+        """Queue a line of text from the device described by identity.
+        """
+        line = self.format(identity, text, timestamp)
+
+        with self.lock:
+            self.pending.append(line)
+
+    def flush(self):
+        """Write every queued line to our stream.
+        """
+        with self.lock:
+            pending, self.pending = self.pending, []
+
+        if pending:
+            self.stream.write(''.join(pending))
+            self.stream.flush()
+
+    def close(self):
+        self.flush()
+
+
+class PrettyWriter(ConsoleWriter):
+    """Colorized, human readable output.
+    """
+    def __init__(self, numeric=False, timestamp=False, datetime_fmt='%Y-%m-%d %H:%M:%S', color=True, stream=None):
+        super().__init__(stream)
+        self.numeric = numeric
+        self.timestamp = timestamp
+        self.datetime_fmt = datetime_fmt
+        self.color = color and self.stream.isatty()
+        self.reset = ansi_colors['style_reset_all'] if self.color else ''
+        self.ts_format = self.ansi('{style_dim}{fg_green}%s{style_reset_all} ')
+
+    def ansi(self, text):
+        """Render milc's color tokens in text, or strip them if color is off.
+        """
+        if not self.color:
+            for token in ansi_colors:
+                text = text.replace('{%s}' % token, '')
+
+            return text
+
+        return format_ansi(text)
+
+    def identity(self, hid_device):
+        if self.numeric:
+            identifier = '%04X:%04X' % (hid_device['vendor_id'], hid_device['product_id'])
+        else:
+            identifier = '%s:%s' % (hid_device['manufacturer_string'], hid_device['product_string'])
+
+        return self.ansi('%s%s:%d{style_reset_all}: ' % (hid_device['color'], identifier, hid_device['index']))
+
+    def format(self, identity, text, timestamp=None):
+        ts = self.ts_format % time.strftime(self.datetime_fmt, time.localtime(timestamp)) if self.timestamp else ''
+
+        return f'{ts}{identity}{text}{self.reset}\n'
+
+
+class RawWriter(ConsoleWriter):
+    """Just the text the devices sent.
+    """
+    def format(self, identity, text, timestamp=None):
+        return text + '\n'
+
+
+class JsonLinesWriter(ConsoleWriter):
+    """One JSON object per line, with a timestamp, the device and the text.
+
+    Live lines are timestamped with a monotonic clock, replayed lines with the time they were recorded.
+    """
+    def identity(self, hid_device):
+        return json.dumps({
+            'vendor_id': hid_device['vendor_id'],
+            'product_id': hid_device['product_id'],
+            'index': hid_device['index'],
+            'manufacturer': hid_device['manufacturer_string'],
+            'product': hid_device['product_string'],
+            'serial': hid_device.get('serial_number'),
+        })
+
+    def format(self, identity, text, timestamp=None):
+        return '{"ts": %.6f, "device": %s, "text": %s}\n' % (time.monotonic() if timestamp is None else timestamp, identity, json.dumps(text))
+
+
+class JsonWriter(JsonLinesWriter):
+    """A single JSON array, written as the lines arrive.
+    """
+    def __init__(self, stream=None):
+        super().__init__(stream)
+        self.separator = '[\n'
+
+    def write(self, identity, text, timestamp=None):
+        line = self.format(identity, text, timestamp)
+
+        with self.lock:
+            self.pending.append(self.separator + line[:-1])
+            self.separator = ',\n'
+
+    def close(self):
+        with self.lock:
+            self.pending.append('[\n]\n' if self.separator == '[\n' else '\n]\n')
+
+        self.flush()
+
+
+class MultiWriter(ConsoleWriter):
+    """Sends every line to several writers.
+    """
+    def __init__(self, writers):
+        self.writers = writers
+
+    def identity(self, hid_device):
+        return [writer.identity(hid_device) for writer in self.writers]
+
+    def write(self, identity, text, timestamp=None):
+        for writer, writer_identity in zip(self.writers, identity):
+            writer.write(writer_identity, text, timestamp)
+
+    def flush(self):
+        for writer in self.writers:
+            writer.flush()
+
+    def close(self):
+        for writer in self.writers:
+            writer.close()
+
+
+def open_writer(output_format, numeric=False, timestamp=False, datetime_fmt='%Y-%m-%d %H:%M:%S', color=True, stream=None):
+    """Returns a writer for output_format.
+    """
+    if output_format == 'pretty':
+        return PrettyWriter(numeric, timestamp, datetime_fmt, color, stream)
+
+    if output_format == 'raw':
+        return RawWriter(stream)
+
+    if output_format == 'json':
+        return JsonWriter(stream)
+
+    if output_format == 'jsonl':
+        return JsonLinesWriter(stream)
+
+    raise ValueError(f'Unknown output format: {output_format}')
@@ -0,0 +1,102 @@
+"""Read from many console devices in a single thread.
+
+On Linux hidapi's hidraw backend gives us paths to /dev/hidraw* nodes, which we can open ourselves and wait on with select(). Every such device is read by one ConsoleReader thread instead of a thread per device. Devices without a pollable file descriptor are still read by their own thread.
+"""
+import os
+import selectors
+from queue import Empty, SimpleQueue
+from threading import Thread
+
+from milc import cli
+
+
+def is_pollable(path):
+    """Returns True if path is a device node we can open and select() on ourselves.
+    """
+    return hasattr(os, 'O_NONBLOCK') and os.fsdecode(path).startswith('/dev/hidraw')
+
+
+def open_pollable(hid, path):
+    """Returns a non-blocking file descriptor for reading reports from path, or None if it can't be polled.
+
+    hid is the backend returned by import_hid(), which may know how to open its own devices.
+    """
+    if hasattr(hid, 'open_pollable'):
+        return hid.open_pollable(path)
+
+    if is_pollable(path):
+        return os.open(os.fsdecode(path), os.O_RDONLY | os.O_NONBLOCK)
+
+    return None
+
+
+class ConsoleReader(object):
+    """Reads every added device from a single background thread.
+
+    Devices must provide `fileno()`, `read_ready()`, which reads everything available and returns False once the device has gone away, and `close()`. `on_batch` is called after each round of reads, so output can be written out in one go.
+    """
+    def __init__(self, on_disconnect=None, on_batch=None):
+        self.on_disconnect = on_disconnect
+        self.on_batch = on_batch
+        self.selector = selectors.DefaultSelector()
+        self._pending = SimpleQueue()
+        self._thread = None
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        os.set_blocking(self._wakeup_r, False)
+        self.selector.register(self._wakeup_r, selectors.EVENT_READ)
+
+    def add(self, device):
+        """Start reading from device. Safe to call from any thread.
+        """
+        self._pending.put(device)
+        os.write(self._wakeup_w, b'\0')
+
+        if not self._thread:
+            self._thread = Thread(target=self.run_forever, daemon=True)
+            self._thread.start()
+
+    def _register_pending(self):
+        """Drain the wakeup pipe and start watching newly added devices.
+        """
+        while True:
+            try:
+                os.read(self._wakeup_r, 512)
+            except BlockingIOError:
+                break
+
+        while True:
+            try:
+                device = self._pending.get_nowait()
+            except Empty:
+                return
+
+            self.selector.register(device.fileno(), selectors.EVENT_READ, device)
+
+    def _remove(self, device):
+        """Stop reading from a device that has gone away.
+        """
+        self.selector.unregister(device.fileno())
+        device.close()
+
+        if self.on_disconnect:
+            self.on_disconnect()
+
+    def run_forever(self):
+        while True:
+            for key, _ in self.selector.select():
+                if key.data is None:
+                    self._register_pending()
+                    continue
+
+                try:
+                    connected = key.data.read_ready()
+
+                except Exception as e:
+                    cli.log.error('Error reading from %s: %s: %s', key.data, e.__class__.__name__, e)
+                    connected = False
+
+                if not connected:
+                    self._remove(key.data)
+
+            if self.on_batch:
+                self.on_batch()
@@ -0,0 +1,149 @@
+"""Record console sessions to disk and read them back.
+
+A recording is a header followed by records, each of which is a fixed size header and a payload:
+
+    type (u8), device (u16), time in ns since the epoch (u64), payload length (u16)
+
+DEVICE records carry a JSON description of a device, and are written each time it connects, before its first report. A device that reconnects gets back the id it had before, unless another device with the same description is using it. REPORT records carry the raw report as it was read from the device. Files are only ever appended to. When a file reaches its size limit it is rotated to FILE.1, FILE.2 and so on, and the new file starts by describing every connected device again so that each file can be replayed on its own.
+"""
+import json
+import mmap
+import os
+import struct
+import time
+from threading import Lock
+
+MAGIC = b'QMKCON1\n'
+RECORD = struct.Struct('<BHQH')
+DEVICE = 1
+REPORT = 2
+MAX_DEVICES = 0x10000  # Device ids are a u16
+IDENTITY_KEYS = ('vendor_id', 'product_id', 'index', 'manufacturer_string', 'product_string', 'serial_number')
+
+
+class RecordingError(Exception):
+    """Raised when a recording can't be read or written.
+    """
+
+
+class Recorder(object):
+    """Appends every report we receive to a recording.
+    """
+    def __init__(self, path, max_size=64 * 1024 * 1024, keep=5):
+        self.path = path
+        self.max_size = max_size
+        self.keep = keep
+        self.devices = {}  # DEVICE payload for each device id we've handed out
+        self.connected = set()
+        self.lock = Lock()
+        self.file = None
+        self.size = 0
+        self._open()
+
+    def _open(self):
+        """Open our file for appending, writing the header if it's new.
+        """
+        self.file = open(self.path, 'ab')
+        self.size = self.file.tell()
+
+        if not self.size:
+            self.file.write(MAGIC)
+            self.size = len(MAGIC)
+
+    def _rotate(self):
+        """Move the current file aside and start a new one.
+        """
+        self.file.close()
+
+        for n in range(self.keep - 1, 0, -1):
+            if os.path.exists(f'{self.path}.{n}'):
+                os.replace(f'{self.path}.{n}', f'{self.path}.{n + 1}')
+
+        if self.keep:
+            os.replace(self.path, f'{self.path}.1')
+        else:
+            os.unlink(self.path)
+
+        self._open()
+
+        for device_id in sorted(self.connected):
+            self._write(DEVICE, device_id, self.devices[device_id])
+
+    def _write(self, record_type, device_id, payload, timestamp=None):
+        self.file.write(RECORD.pack(record_type, device_id, timestamp or time.time_ns(), len(payload)))
+        self.file.write(payload)
+        self.size += RECORD.size + len(payload)
+
+    def add_device(self, hid_device):
+        """Describe a newly connected device. Returns the id to pass to `write()` and `remove_device()`.
+        """
+        payload = json.dumps({key: hid_device.get(key) for key in IDENTITY_KEYS}).encode('utf-8')
+
+        with self.lock:
+            device_id = next((device_id for device_id, seen in self.devices.items() if seen == payload and device_id not in self.connected), len(self.devices))
+
+            if device_id >= MAX_DEVICES:
+                raise RecordingError(f'Can not record more than {MAX_DEVICES} different devices.')
+
+            self.devices[device_id] = payload
+            self.connected.add(device_id)
+            self._write(DEVICE, device_id, payload)
+
+        return device_id
+
+    def remove_device(self, device_id):
+        """Forget that a device is connected. Its id is reused if it comes back.
+        """
+        with self.lock:
+            self.connected.discard(device_id)
+
+    def write(self, device_id, report):
+        """Record a report received from a device.
+        """
+        timestamp = time.time_ns()
+
+        with self.lock:
+            if self.size + RECORD.size + len(report) > self.max_size:
+                self._rotate()
+
+            self._write(REPORT, device_id, report, timestamp)
+
+    def flush(self):
+        with self.lock:
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+def read_recording(path):
+    """Yields a `(type, device, timestamp_ns, payload)` tuple for every record in a recording.
+
+    DEVICE payloads are decoded to a dict, REPORT payloads are bytes. The file is memory mapped rather than read in, and a record cut short by a crash ends the recording.
+    """
+    with open(path, 'rb') as fd:
+        if fd.read(len(MAGIC)) != MAGIC:
+            raise RecordingError(f'{path} is not a qmk console recording.')
+
+        if os.fstat(fd.fileno()).st_size == len(MAGIC):
+            return
+
+        with mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            offset = len(MAGIC)
+            end = len(data)
+
+            while offset + RECORD.size <= end:
+                record_type, device_id, timestamp, length = RECORD.unpack_from(data, offset)
+                offset += RECORD.size
+
+                if offset + length > end:
+                    break
+
+                payload = data[offset:offset + length]
+                offset += length
+
+                if record_type == DEVICE:
+                    payload = json.loads(payload.decode('utf-8'))
+
+                yield record_type, device_id, timestamp, payload
@@ -0,0 +1,87 @@
+"""Decide when `qmk console` rescans for devices.
+
+Each source of devices (HID consoles, bootloaders) is scanned on its own schedule. A source that keeps finding nothing new backs off towards its maximum interval, and drops back to its minimum as soon as something changes or a hotplug event arrives. After a console disconnects we can also burst, scanning a source rapidly for a while, because a keyboard that just dropped off is probably about to show up as a bootloader.
+"""
+import time
+
+BACKOFF = 1.5  # Multiply a source's interval by this every time a scan finds no changes
+BURST_INTERVAL = 0.1  # How often to scan a bursting source
+BURST_DURATION = 5  # How long a burst lasts, in seconds
+
+
+class ScanSource(object):
+    """Something we scan for devices. `scan()` returns True if anything changed.
+    """
+    def __init__(self, name, scan, min_interval, max_interval):
+        self.name = name
+        self.scan = scan
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.interval = min_interval
+        self.next_scan = 0
+        self.burst_until = 0
+
+    def run(self, now):
+        """Scan and work out when to scan next.
+        """
+        if self.scan() or now < self.burst_until:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * BACKOFF, self.max_interval)
+
+        self.next_scan = now + (min(BURST_INTERVAL, self.interval) if now < self.burst_until else self.interval)
+
+    def wake(self, now):
+        """Scan as soon as possible, starting again from the minimum interval.
+        """
+        self.interval = self.min_interval
+        self.next_scan = now
+
+    def burst(self, now, duration=BURST_DURATION):
+        """Scan rapidly for the next duration seconds.
+        """
+        self.burst_until = now + duration
+        self.next_scan = now
+
+
+class ScanScheduler(object):
+    """Runs each ScanSource when it is due.
+    """
+    def __init__(self):
+        self.sources = {}
+
+    def add(self, name, scan, min_interval, max_interval):
+        self.sources[name] = ScanSource(name, scan, min_interval, max_interval)
+
+        return self.sources[name]
+
+    def run_due(self):
+        """Scan every source that is due.
+        """
+        for source in self.sources.values():
+            now = time.monotonic()
+
+            if source.next_scan <= now:
+                source.run(now)
+
+    def timeout(self):
+        """Returns the number of seconds until the next scan is due.
+        """
+        if not self.sources:
+            return None
+
+        return max(min(source.next_scan for source in self.sources.values()) - time.monotonic(), 0)
+
+    def wake(self):
+        """Make every source due now.
+        """
+        now = time.monotonic()
+
+        for source in self.sources.values():
+            source.wake(now)
+
+    def burst(self, name):
+        """Start a burst of scans for the source called name, if we have one.
+        """
+        if name in self.sources:
+            self.sources[name].burst(time.monotonic())
@@ -0,0 +1,233 @@
+"""Share console output with other programs over a socket.
+
+`qmk console --serve ADDRESS` reads each device once and sends everything it prints to every client connected to ADDRESS, which is either `unix:/path/to/socket` or `tcp:host:port`. Each client has its own bounded queue. When a client falls too far behind, new output for it is dropped and counted rather than slowing down everything else.
+
+A FanoutServer is used as the stream of a ConsoleWriter, so clients get output in any of the usual formats.
+"""
+import os
+import selectors
+import socket
+import stat
+from collections import deque
+from threading import Lock, Thread
+
+from milc import cli
+
+QUEUE_SIZE = 1024 * 1024  # Bytes of output to hold for each client before dropping
+
+
+class ServerAddressError(ValueError):
+    """Raised when a --serve address can't be parsed.
+    """
+
+
+def parse_address(address):
+    """Returns a (family, sockaddr) tuple for a `unix:PATH` or `tcp:HOST:PORT` address.
+    """
+    kind, _, rest = address.partition(':')
+
+    if kind == 'unix' and rest:
+        if not hasattr(socket, 'AF_UNIX'):
+            raise ServerAddressError('unix sockets are not supported on this platform.')
+
+        return socket.AF_UNIX, rest
+
+    if kind == 'tcp':
+        host, _, port = rest.rpartition(':')
+
+        if host and port.isdigit():
+            host = host.strip('[]')
+            family = socket.AF_INET6 if ':' in host else socket.AF_INET
+
+            return family, (host, int(port))
+
+    raise ServerAddressError(f'Invalid address "{address}", expected unix:/path/to/socket or tcp:host:port')
+
+
+class Client(object):
+    """A connected client and the output waiting to be sent to it.
+    """
+    def __init__(self, sock, name):
+        self.sock = sock
+        self.name = name
+        self.queue = deque()
+        self.queued = 0
+        self.sending = None
+        self.dropped = 0
+        self.waiting = False  # True when we're waiting for the socket to become writable
+
+    def push(self, data, lines, limit):
+        """Queue data to be sent. Returns False if it was dropped because the queue is full.
+        """
+        if self.queued + len(data) > limit:
+            self.dropped += lines
+            return False
+
+        self.queue.append(data)
+        self.queued += len(data)
+
+        return True
+
+    def send(self):
+        """Send as much queued data as the socket will take. Returns False if the client has gone away.
+        """
+        while self.sending or self.queue:
+            if not self.sending:
+                self.sending = memoryview(self.queue.popleft())
+
+            try:
+                sent = self.sock.send(self.sending)
+            except BlockingIOError:
+                return True
+            except OSError:
+                return False
+
+            self.queued -= sent
+            self.sending = self.sending[sent:] or None
+
+        return True
+
+
+class FanoutServer(object):
+    """Accepts clients and broadcasts everything written to it to all of them, from a background thread.
+    """
+    def __init__(self, address, queue_size=QUEUE_SIZE):
+        self.address = address
+        self.queue_size = queue_size
+        self.family, self.sockaddr = parse_address(address)
+        self.clients = {}
+        self.lock = Lock()
+        self.selector = selectors.DefaultSelector()
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self._wakeup_w.setblocking(False)
+        self.listener = self._listen()
+        self.selector.register(self.listener, selectors.EVENT_READ, 'accept')
+        self.selector.register(self._wakeup_r, selectors.EVENT_READ, 'wakeup')
+        self._thread = Thread(target=self.run_forever, name='console server', daemon=True)
+        self._thread.start()
+
+    def _listen(self):
+        if self.family == socket.AF_UNIX and os.path.exists(self.sockaddr):
+            if not stat.S_ISSOCK(os.stat(self.sockaddr).st_mode):
+                raise ServerAddressError(f'{self.sockaddr} exists and is not a socket.')
+
+            os.unlink(self.sockaddr)
+
+        listener = socket.socket(self.family, socket.SOCK_STREAM)
+
+        try:
+            if self.family != socket.AF_UNIX:
+                listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+            listener.bind(self.sockaddr)
+            listener.listen(16)
+            listener.setblocking(False)
+
+        except OSError:
+            listener.close()
+            raise
+
+        return listener
+
+    def isatty(self):
+        return False
+
+    def write(self, text):
+        """Queue text for every client.
+        """
+        data = text.encode('utf-8')
+        lines = data.count(b'\n')
+
+        with self.lock:
+            for client in self.clients.values():
+                dropped = client.dropped
+
+                if not client.push(data, lines, self.queue_size) and not dropped:
+                    cli.log.warning('Console client %s is not keeping up, dropping output for it.', client.name)
+
+        try:
+            self._wakeup_w.send(b'\0')
+        except BlockingIOError:
+            pass  # Already woken
+
+    def flush(self):
+        pass
+
+    def _accept(self):
+        try:
+            sock, peer = self.listener.accept()
+        except BlockingIOError:
+            return
+
+        sock.setblocking(False)
+        name = ':'.join(map(str, peer[:2])) if isinstance(peer, tuple) else f'{self.address}#{sock.fileno()}'
+        self.selector.register(sock, selectors.EVENT_READ, 'client')
+
+        with self.lock:
+            self.clients[sock] = Client(sock, name)
+
+        cli.log.info('Console client connected: %s', name)
+
+    def _disconnect(self, sock):
+        self.selector.unregister(sock)
+
+        with self.lock:
+            client = self.clients.pop(sock)
+
+        sock.close()
+
+        if client.dropped:
+            cli.log.info('Console client disconnected: %s (%d lines dropped)', client.name, client.dropped)
+        else:
+            cli.log.info('Console client disconnected: %s', client.name)
+
+    def _send_all(self):
+        """Send queued output to every client, and wait for writability on those we couldn't finish.
+        """
+        with self.lock:
+            clients = list(self.clients.values())
+
+        for client in clients:
+            with self.lock:
+                connected = client.send()
+                pending = bool(client.sending or client.queue)
+
+            if not connected:
+                self._disconnect(client.sock)
+
+            elif pending != client.waiting:
+                client.waiting = pending
+                self.selector.modify(client.sock, selectors.EVENT_READ | (selectors.EVENT_WRITE if pending else 0), 'client')
+
+    def run_forever(self):
+        while True:
+            for key, events in self.selector.select():
+                if key.data == 'accept':
+                    self._accept()
+
+                elif key.data == 'wakeup':
+                    try:
+                        self._wakeup_r.recv(4096)
+                    except BlockingIOError:
+                        pass
+
+                elif events & selectors.EVENT_READ:
+                    # Clients don't send us anything, so readable means closed, or data we ignore
+                    try:
+                        data = key.fileobj.recv(4096)
+                    except BlockingIOError:
+                        continue
+                    except OSError:
+                        data = b''
+
+                    if not data:
+                        self._disconnect(key.fileobj)
+
+            self._send_all()
+
+    def close(self):
+        self.listener.close()
+
+        if self.family == socket.AF_UNIX and os.path.exists(self.sockaddr):
+            os.unlink(self.sockaddr)
@@ -0,0 +1,259 @@
+"""Simulated console devices, for testing and benchmarking `qmk console` without hardware.
+
+Set QMK_CONSOLE_BACKEND=simulated to use these instead of hidapi and pyusb. QMK_CONSOLE_SIMULATE configures them as comma separated key=value pairs:
+
+    devices       Number of consoles (Default: 1)
+    rate          Lines per second from each console (Default: 10)
+    report_size   Size of each report (Default: 32)
+    line_length   Length of each line, including the newline (Default: 64)
+    lifetime      Seconds a console stays connected before dropping off, 0 for forever (Default: 0)
+    downtime      Seconds a console stays away after dropping off (Default: 1)
+    bootloader    1 to have consoles show up as a bootloader while they're away (Default: 0)
+
+Every line is `<device> <sequence> <CLOCK_MONOTONIC ns>` padded with dots, so a reader can detect lost lines and measure latency. Like hidraw, reports that don't fit in the device's buffer are dropped rather than blocking.
+"""
+import os
+import select
+import socket
+import threading
+import time
+from functools import lru_cache
+from types import SimpleNamespace
+
+SIMULATED_VID = 0xFEED
+BOOTLOADER_ID = (0x03EB, 0x2FF4)  # atmel-dfu: ATmega32U4
+DEFAULTS = {
+    'devices': 1,
+    'rate': 10.0,
+    'report_size': 32,
+    'line_length': 64,
+    'lifetime': 0.0,
+    'downtime': 1.0,
+    'bootloader': 0,
+}
+
+
+class SimulatedHIDError(Exception):
+    """Raised when reading from a simulated device that has gone away.
+    """
+
+
+def parse_config(spec):
+    """Parse a QMK_CONSOLE_SIMULATE string into a dict.
+    """
+    config = DEFAULTS.copy()
+
+    for item in filter(None, spec.split(',')):
+        key, _, value = item.partition('=')
+        key = key.strip()
+
+        if key not in DEFAULTS:
+            raise ValueError(f'Unknown simulated console setting: {key}')
+
+        config[key] = type(DEFAULTS[key])(value)
+
+    return config
+
+
+class SimulatedConsole(object):
+    """One simulated keyboard, which may be connected, away, or in its bootloader.
+    """
+    def __init__(self, number, config):
+        self.number = number
+        self.config = config
+        self.path = b'sim:%d' % number
+        self.reader = None
+        self.writer = None
+        self.sequence = 0
+        self.next_line = 0
+        self.next_change = 0
+        self.dropped = 0
+        self.info = {
+            'path': self.path,
+            'vendor_id': SIMULATED_VID,
+            'product_id': number + 1,
+            'serial_number': f'SIM{number:04d}',
+            'release_number': 1,
+            'manufacturer_string': 'QMK',
+            'product_string': f'Simulated Console {number}',
+            'usage_page': 0xFF31,
+            'usage': 0x0074,
+            'interface_number': 1,
+        }
+
+    @property
+    def connected(self):
+        return self.writer is not None
+
+    def connect(self, now):
+        self.reader, self.writer = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        self.writer.setblocking(False)
+        self.next_line = now
+        self.next_change = now + self.config['lifetime'] if self.config['lifetime'] else float('inf')
+
+    def disconnect(self, now):
+        self.writer.close()
+        self.reader.close()
+        self.reader = self.writer = None
+        self.next_change = now + self.config['downtime']
+
+    def send_line(self):
+        """Send the next line, split into reports.
+        """
+        report_size = self.config['report_size']
+        line = b'%d %d %d ' % (self.number, self.sequence, time.monotonic_ns())
+        line = line.ljust(self.config['line_length'] - 1, b'.') + b'\n'
+        self.sequence += 1
+
+        for start in range(0, len(line), report_size):
+            try:
+                self.writer.send(line[start:start + report_size].ljust(report_size, b'\0'))
+            except BlockingIOError:
+                self.dropped += 1
+
+
+class SimulatedDevice(object):
+    """Stands in for `hid.Device`.
+    """
+    def __init__(self, console):
+        if not console.connected:
+            raise SimulatedHIDError(f'{console.path} is not connected')
+
+        self.sock = console.reader.dup()
+
+    def read(self, size, timeout=None):
+        ready, _, _ = select.select([self.sock], [], [], None if timeout is None else timeout / 1000)
+
+        if not ready:
+            return b''
+
+        report = self.sock.recv(size)
+
+        if not report:
+            raise SimulatedHIDError('Device disconnected')
+
+        return report
+
+    def close(self):
+        self.sock.close()
+
+
+class SimulatedUsbDevice(object):
+    """Stands in for `usb.core.Device`.
+    """
+    def __init__(self, console):
+        self.idVendor, self.idProduct = BOOTLOADER_ID
+        self.address = 100 + console.number
+
+
+class Simulator(object):
+    """Drives every simulated console from a single background thread.
+    """
+    def __init__(self, config):
+        now = time.monotonic()
+        self.config = config
+        self.lock = threading.Lock()
+        self.consoles = [SimulatedConsole(number, config) for number in range(config['devices'])]
+
+        for console in self.consoles:
+            console.connect(now)
+
+        threading.Thread(target=self.run_forever, name='console simulator', daemon=True).start()
+
+    def console(self, path):
+        for console in self.consoles:
+            if console.path == path:
+                return console
+
+        raise SimulatedHIDError(f'No such device: {path}')
+
+    def run_forever(self):
+        interval = 1 / self.config['rate'] if self.config['rate'] else float('inf')
+
+        while True:
+            now = time.monotonic()
+            next_event = now + 1
+
+            with self.lock:
+                for console in self.consoles:
+                    if console.next_change <= now:
+                        if console.connected:
+                            console.disconnect(now)
+                        else:
+                            console.connect(now)
+
+                    if console.connected:
+                        while console.next_line <= now:
+                            console.send_line()
+                            console.next_line += interval
+
+                        next_event = min(next_event, console.next_line)
+
+                    next_event = min(next_event, console.next_change)
+
+            time.sleep(max(next_event - time.monotonic(), 0))
+
+    def enumerate(self, vendor_id=0, product_id=0):
+        """Stands in for `hid.enumerate()`.
+        """
+        with self.lock:
+            return [console.info.copy() for console in self.consoles if console.connected]
+
+    def open_device(self, path):
+        with self.lock:
+            return SimulatedDevice(self.console(path))
+
+    def open_pollable(self, path):
+        """Returns a non-blocking file descriptor that reads reports from path.
+        """
+        with self.lock:
+            console = self.console(path)
+
+            if not console.connected:
+                raise SimulatedHIDError(f'{path} is not connected')
+
+            fd = os.dup(console.reader.fileno())
+
+        os.set_blocking(fd, False)
+
+        return fd
+
+    def find(self, find_all=False, custom_match=None, **kwargs):
+        """Stands in for `usb.core.find()`.
+        """
+        with self.lock:
+            devices = [SimulatedUsbDevice(console) for console in self.consoles if self.config['bootloader'] and not console.connected]
+
+        if custom_match:
+            devices = [device for device in devices if custom_match(device)]
+
+        if find_all:
+            return devices
+
+        return devices[0] if devices else None
+
+
+@lru_cache(maxsize=None)
+def simulator():
+    """Returns the simulator, starting it the first time we're called.
+    """
+    return Simulator(parse_config(os.environ.get('QMK_CONSOLE_SIMULATE', '')))
+
+
+def simulated_hid():
+    """Returns an object that can be used in place of the `hid` module.
+    """
+    sim = simulator()
+
+    return SimpleNamespace(
+        enumerate=sim.enumerate,
+        Device=lambda path: sim.open_device(path),
+        HIDException=SimulatedHIDError,
+        open_pollable=sim.open_pollable,
+    )
+
+
+def simulated_usb_core():
+    """Returns an object that can be used in place of the `usb.core` module.
+    """
+    return SimpleNamespace(find=simulator().find)
@@ -0,0 +1,543 @@
+"""Run `qmk` commands in a warm, pre-imported process.
+
+`qmk daemon` imports everything a command needs (milc, the firmware CLI and its dependencies) and then listens on a per-user unix socket. When the socket exists the `qmk` entrypoint connects to it and sends its argv, environment, cwd and stdin/stdout/stderr file descriptors instead of starting up itself. The daemon forks a child for each request, which swaps in the caller's state and runs the command exactly as `qmk` would have. If no daemon is running, or anything goes wrong before the command starts, the caller runs the command itself.
+
+Every request carries a handshake describing the caller's qmk_cli version, python interpreter and subcommand modules. The daemon refuses requests from a different installation, and reloads itself when the caller has seen subcommand modules the daemon has not. It also refuses `qmk daemon` itself, which always runs in its own process.
+
+Children re-import qmk_cli, milc and the firmware's `qmk` package so that every command sees its own cwd, environment and arguments. Everything else they import, most importantly the firmware's third party dependencies, is already loaded. When qmk_cli or qmk_firmware's python sources change the daemon replaces itself with a fresh process.
+
+The client side of this module runs before anything else, so it only uses the standard library.
+"""
+import json
+import os
+import signal
+import socket
+import struct
+import sys
+import time
+from pathlib import Path
+
+from . import __version__
+
+RELOAD_CHECK_INTERVAL = 1  # Seconds between checks for changed source files
+REQUEST_TIMEOUT = 5  # Seconds a client has to send its request before we give up on it
+RELOADED_MODULES = ('milc', 'qmk', 'qmk_cli')
+KEPT_MODULES = ('qmk_cli', 'qmk_cli.__main__', 'qmk_cli.daemon')
+FORWARDED_SIGNALS = ('SIGINT', 'SIGTERM', 'SIGHUP', 'SIGQUIT')
+MODULES_CHANGED = 'subcommand modules have changed'
+ORIGINAL_SYS_PATH = list(sys.path)
+
+
+class DaemonError(Exception):
+    """Raised when the daemon can't be started or stopped.
+    """
+
+
+def supported():
+    """Returns True if this platform supports `qmk daemon`.
+    """
+    return hasattr(socket, 'AF_UNIX') and hasattr(socket, 'send_fds') and hasattr(os, 'fork')
+
+
+def socket_path():
+    """Returns the path to the daemon's socket.
+    """
+    if 'QMK_DAEMON_SOCKET' in os.environ:
+        return Path(os.environ['QMK_DAEMON_SOCKET'])
+
+    if 'XDG_RUNTIME_DIR' in os.environ:
+        return Path(os.environ['XDG_RUNTIME_DIR'], 'qmk', 'daemon.sock')
+
+    return Path(os.environ.get('TMPDIR', '/tmp'), f'qmk-{os.getuid()}', 'daemon.sock')
+
+
+def pid_path():
+    """Returns the path to the file holding the daemon's pid.
+    """
+    return socket_path().with_suffix('.pid')
+
+
+def _private_dir(path):
+    """Returns True if path is a directory that only we can access.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+
+    return st.st_uid == os.getuid() and not st.st_mode & 0o077
+
+
+def _send(sock, message, fds=()):
+    """Send a length-prefixed JSON message, optionally passing file descriptors along with it.
+    """
+    data = json.dumps(message).encode('utf-8')
+    frame = struct.pack('!I', len(data)) + data
+
+    if fds:
+        sent = socket.send_fds(sock, [frame], fds)
+        frame = frame[sent:]
+
+    if frame:
+        sock.sendall(frame)
+
+
+def _recv_exactly(sock, size, data=b''):
+    """Read from sock until we have size bytes.
+    """
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError('Connection closed by peer')
+        data += chunk
+
+    return data
+
+
+def _recv(sock, maxfds=0):
+    """Receive a message sent by _send(). Returns a (message, fds) tuple.
+    """
+    fds = []
+
+    if maxfds:
+        header, fds, _, _ = socket.recv_fds(sock, 4, maxfds)
+    else:
+        header = b''
+
+    try:
+        size = struct.unpack('!I', _recv_exactly(sock, 4, header))[0]
+        message = json.loads(_recv_exactly(sock, size).decode('utf-8'))
+    except BaseException:
+        for fd in fds:
+            os.close(fd)
+        raise
+
+    return message, fds
+
+
+def _manifest_fingerprint():
+    """Returns a value that changes whenever a subcommand module, or the manifest describing them, changes.
+    """
+    package = Path(__file__).parent
+    fingerprint = []
+
+    for path in [package / 'manifest.py', *sorted((package / 'subcommands').glob('*.py'))]:
+        try:
+            st = os.stat(path)
+            fingerprint.append([path.name, st.st_ino, st.st_mtime_ns, st.st_size])
+        except OSError:
+            fingerprint.append([path.name, None])
+
+    return fingerprint
+
+
+def handshake():
+    """Returns what a client and the daemon must agree on before the daemon runs the client's command.
+    """
+    return {'version': __version__, 'executable': sys.executable, 'manifest': _manifest_fingerprint()}
+
+
+def connect():
+    """Returns a socket connected to the running daemon, or None.
+    """
+    path = socket_path()
+
+    if not supported() or not _private_dir(path.parent):
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(str(path))
+    except OSError:
+        sock.close()
+        return None
+
+    return sock
+
+
+def forward(argv=None):
+    """Run a command in the running daemon.
+
+    Returns the command's exit code, or None if it has to be run in this process instead.
+    """
+    if argv is None:
+        argv = sys.argv
+
+    if 'QMK_NO_DAEMON' in os.environ or '_ARGCOMPLETE' in os.environ:
+        return None
+
+    sock = connect()
+    if not sock:
+        return None
+
+    with sock:
+        try:
+            for fd in (0, 1, 2):
+                os.fstat(fd)
+
+            _send(sock, {'argv': argv, 'cwd': os.getcwd(), 'env': dict(os.environ), 'handshake': handshake()}, (0, 1, 2))
+            reply, _ = _recv(sock)
+
+        except (OSError, ValueError):
+            return None
+
+        if 'pid' not in reply:
+            # Refused, see _check_request()
+            return None
+
+        return _wait_for_exit(sock, reply['pid'])
+
+
+def _wait_for_exit(sock, pid):
+    """Pass our signals on to the process running our command, and anything it started, and return its exit code when it finishes.
+    """
+    def forward_signal(signum, frame):
+        try:
+            os.killpg(pid, signum)
+        except OSError:
+            try:
+                os.kill(pid, signum)
+            except OSError:
+                pass
+
+    handlers = {}
+    for name in FORWARDED_SIGNALS:
+        signum = getattr(signal, name, None)
+        if signum is not None:
+            handlers[signum] = signal.signal(signum, forward_signal)
+
+    try:
+        reply, _ = _recv(sock)
+        return reply['exit']
+
+    except (OSError, ValueError, KeyError):
+        print('qmk: lost connection to qmk daemon while running the command.', file=sys.stderr)
+        return 255
+
+    finally:
+        for signum, handler in handlers.items():
+            signal.signal(signum, handler)
+
+
+def stop():
+    """Stop the running daemon. Returns the pid we signalled.
+    """
+    try:
+        pid = int(pid_path().read_text())
+        os.kill(pid, signal.SIGTERM)
+    except (OSError, ValueError) as e:
+        raise DaemonError(f'Could not stop qmk daemon: {e}') from e
+
+    return pid
+
+
+def _source_files():
+    """Yields the source files that trigger a reload when they change.
+    """
+    roots = [Path(__file__).parent]
+
+    if 'QMK_HOME' in os.environ:
+        qmk_firmware = Path(os.environ['QMK_HOME'])
+        roots.append(qmk_firmware / 'lib/python')
+        yield qmk_firmware / 'requirements.txt'
+
+    for root in roots:
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = [d for d in dirnames if d != '__pycache__']
+            yield dirpath
+            for filename in filenames:
+                if filename.endswith('.py'):
+                    yield os.path.join(dirpath, filename)
+
+
+def _source_fingerprint():
+    """Returns a value that changes whenever one of our source files changes.
+    """
+    fingerprint = []
+
+    for path in _source_files():
+        try:
+            st = os.stat(path)
+            fingerprint.append((str(path), st.st_ino, st.st_mtime_ns, st.st_size))
+        except OSError:
+            fingerprint.append((str(path), None))
+
+    return fingerprint
+
+
+def _reap_children():
+    """Collect the exit status of finished children so they don't linger as zombies.
+    """
+    while True:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+
+        if pid == 0:
+            return
+
+
+def _exit_code(code):
+    """Convert the argument to SystemExit into an exit status.
+    """
+    if code is None:
+        return 0
+
+    if isinstance(code, int):
+        return code
+
+    print(code, file=sys.stderr)
+    return 1
+
+
+def _reset_modules():
+    """Forget the modules whose state depends on the command being run, so they are imported fresh.
+    """
+    for name in list(sys.modules):
+        if name not in KEPT_MODULES and any(name == prefix or name.startswith(prefix + '.') for prefix in RELOADED_MODULES):
+            del sys.modules[name]
+
+
+def _reset_output():
+    """Drop the log handlers and colorama wrapping set up around our old stdio, and wrap the new one the way a fresh process would.
+    """
+    import logging
+
+    for handler in logging.root.handlers[:]:
+        logging.root.removeHandler(handler)
+        handler.close()
+
+    # halo and log_symbols call colorama.init() when imported, before milc picks up sys.stderr. They are already imported here, so do it for them.
+    colorama = sys.modules.get('colorama')
+
+    if colorama:
+        colorama.initialise.atexit_done = False  # prepare_child() dropped its atexit hook
+        colorama.init(autoreset=True)
+
+
+def prepare_child():
+    """Undo the parts of our state a freshly forked child running a command must not inherit.
+    """
+    import atexit
+
+    atexit._clear()
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    for name in ('SIGTERM', 'SIGCHLD', 'SIGHUP'):
+        signal.signal(getattr(signal, name), signal.SIG_DFL)
+
+
+def run_main(argv, env, cwd, fds):
+    """Run a command in this freshly forked child, as `qmk` would have with argv, env and cwd. The three fds become its stdin, stdout and stderr, and are closed.
+
+    Returns the exit code.
+    """
+    import atexit
+    import traceback
+
+    # Take on the caller's stdio, environment and working directory
+    for target, fd in enumerate(fds):
+        os.dup2(fd, target)
+        os.close(fd)
+
+    sys.stdin = open(0, 'r', closefd=False)
+    sys.stdout = open(1, 'w', closefd=False)
+    sys.stderr = open(2, 'w', buffering=1, errors='backslashreplace', closefd=False)
+    os.environ.clear()
+    os.environ.update(env)
+    os.chdir(cwd)
+    sys.argv = argv
+    sys.path[:] = ORIGINAL_SYS_PATH
+    _reset_output()
+    _reset_modules()
+
+    try:
+        from qmk_cli.script_qmk import main
+        main()
+        code = 0
+
+    except SystemExit as e:
+        code = _exit_code(e.code)
+
+    except KeyboardInterrupt:
+        code = 128 + signal.SIGINT
+
+    except BaseException:
+        traceback.print_exc()
+        code = 255
+
+    try:
+        atexit._run_exitfuncs()
+        sys.stdout.flush()
+        sys.stderr.flush()
+    except OSError:
+        pass  # Whoever is reading our output has gone away
+
+    return code
+
+
+def _run_request(conn, request, fds):
+    """Run a command in a freshly forked child. Returns the exit code.
+
+    The child leads its own process group, so the signals the client forwards also reach whatever the command starts.
+    """
+    prepare_child()
+    os.setpgid(0, 0)
+    _send(conn, {'pid': os.getpid()})
+    code = 255
+
+    try:
+        code = run_main(request['argv'], request['env'], request['cwd'], fds)
+    finally:
+        _send(conn, {'exit': code})
+
+    return code
+
+
+def _reload():
+    """Replace this process with a fresh daemon.
+    """
+    for path in (socket_path(), pid_path()):
+        if path.exists():
+            path.unlink()
+
+    os.execv(sys.executable, [sys.executable, '-m', 'qmk_cli', *sys.argv[1:]])
+
+
+def _listen():
+    """Create the daemon's socket and return it.
+    """
+    path = socket_path()
+    path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+
+    if not _private_dir(path.parent):
+        raise DaemonError(f'{path.parent} must be owned by you and not accessible to anyone else.')
+
+    sock = connect()
+    if sock:
+        sock.close()
+        raise DaemonError(f'qmk daemon is already running on {path}')
+
+    if path.exists() or path.is_symlink():
+        path.unlink()
+
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(str(path))
+    os.chmod(path, 0o600)
+    listener.listen(64)
+    pid_path().write_text(str(os.getpid()))
+
+    return listener
+
+
+def _check_request(request, expected):
+    """Returns why the daemon can't run request, or None if it can.
+    """
+    from .manifest import peek_subcommand
+
+    theirs = request.get('handshake') or {}
+
+    for key in ('version', 'executable'):
+        if theirs.get(key) != expected[key]:
+            return f'{key} {theirs.get(key)!r} does not match ours, {expected[key]!r}'
+
+    if theirs.get('manifest') != expected['manifest']:
+        return MODULES_CHANGED
+
+    if peek_subcommand(request['argv'][1:]) == 'daemon':
+        return 'qmk daemon runs in its own process'
+
+    return None
+
+
+def serve(log):
+    """Run the daemon until we're told to stop.
+    """
+    import selectors
+
+    if not supported():
+        raise DaemonError('qmk daemon is not supported on this platform.')
+
+    # Every command imports these, get them loaded now
+    import milc.questions  # noqa: F401
+
+    def stop_serving(signum, frame):
+        raise SystemExit(0)
+
+    listener = _listen()
+    expected = handshake()
+    sources = _source_fingerprint()
+    sources_checked = time.monotonic()
+    selector = selectors.DefaultSelector()
+    selector.register(listener, selectors.EVENT_READ)
+    signal.signal(signal.SIGTERM, stop_serving)
+    signal.signal(signal.SIGHUP, stop_serving)
+    log.info('Listening on %s', socket_path())
+
+    try:
+        while True:
+            ready = selector.select(RELOAD_CHECK_INTERVAL)
+            _reap_children()
+
+            if time.monotonic() - sources_checked >= RELOAD_CHECK_INTERVAL:
+                sources_checked = time.monotonic()
+
+                if _source_fingerprint() != sources:
+                    log.info('Source files have changed, reloading.')
+                    listener.close()
+                    _reload()
+
+            if not ready:
+                continue
+
+            conn, _ = listener.accept()
+
+            try:
+                # Don't let a client that never sends its request hold up everyone else
+                conn.settimeout(REQUEST_TIMEOUT)
+                request, fds = _recv(conn, 3)
+                conn.settimeout(None)
+            except (OSError, ValueError) as e:
+                log.debug('Bad request: %s: %s', e.__class__.__name__, e)
+                conn.close()
+                continue
+
+            refused = _check_request(request, expected)
+
+            if refused:
+                log.debug('Refused %s: %s', request.get('argv'), refused)
+
+                for fd in fds:
+                    os.close(fd)
+
+                try:
+                    _send(conn, {'refused': refused})
+                except OSError:
+                    pass
+
+                conn.close()
+
+                if refused == MODULES_CHANGED:
+                    log.info('Subcommand modules have changed, reloading.')
+                    listener.close()
+                    _reload()
+
+                continue
+
+            if os.fork() == 0:
+                code = 255
+                try:
+                    selector.close()
+                    listener.close()
+                    code = _run_request(conn, request, fds)
+                finally:
+                    os._exit(code)
+
+            for fd in fds:
+                os.close(fd)
+
+            conn.close()
+
+    finally:
+        socket_path().unlink(missing_ok=True)
+        pid_path().unlink(missing_ok=True)
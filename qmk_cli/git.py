@@ -1,40 +1,454 @@
 """Helpers for working with git.
 """
+import os
+import re
 import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from milc import cli
 
+from .progress import GitProgress, display, stall_retries, stall_timeout, stats, stream
+
 default_repo = 'qmk_firmware'
 default_fork = 'qmk/' + default_repo
 default_branch = 'master'
 
 
-def git_clone(url, destination, branch):
+def in_ci():
+    """Returns True when we appear to be running in a throwaway CI environment.
+    """
+    return os.environ.get('CI', '').lower() not in ('', '0', 'false', 'no')
+
+
+def fetch_jobs():
+    """Returns the default number of submodules or mirrors to fetch in parallel.
+
+    Fetching is mostly waiting on the network, so we use more jobs than we have CPUs.
+    """
+    return min(max((os.cpu_count() or 1) * 2, 4), 16)
+
+
+def clone_arguments(func):
+    """Decorator that adds the arguments controlling how qmk_firmware is cloned to a subcommand.
+
+    These are not arg_only, so they can also be set with `qmk config <subcommand>.<option>=<value>`.
+    """
+    arguments = (
+        cli.argument('--depth', type=int, help='Only fetch this many commits of history, 0 for all of it. Default: 1 when $CI is set, otherwise 0'),
+        cli.argument('--filter', help='Partial clone filter to pass to git, such as blob:none to fetch file contents on demand.'),
+        cli.argument('--shallow-submodules', action='store_boolean', default=None, help='shallow clones of submodules. Default: enabled when $CI is set'),
+        cli.argument('-j', '--jobs', type=int, help='Number of submodules to fetch in parallel. Default: %d' % fetch_jobs()),
+        cli.argument('--mirror', action='store_boolean', help='Keep local mirrors of everything cloned and clone from them, see `qmk mirror`.'),
+        cli.argument('--stats', help='Write a JSON summary of how long each git phase took for each repository to this file, or - for stdout.'),
+    )
+
+    for argument in arguments:
+        func = argument(func)
+
+    return func
+
+
+def clone_options(config):
+    """Returns keyword arguments for git_clone() from a subcommand's config section, filling in defaults.
+    """
+    ci = in_ci()
+
+    return {
+        'depth': int(config.depth) if config.depth is not None else (1 if ci else 0),
+        'filter': config.filter or None,
+        'shallow_submodules': bool(config.shallow_submodules) if config.shallow_submodules is not None else ci,
+        'jobs': int(config.jobs) if config.jobs else fetch_jobs(),
+        'mirror': bool(config.mirror),
+    }
+
+
+def write_stats(config):
+    """Write the summary asked for with `--stats`, if any.
+    """
+    if config.stats:
+        stats.write(config.stats)
+
+
+def run_git(args, cwd=None, label=None, retries=0):
+    """Run git with args, showing its output and progress. Returns True if it succeeded.
+
+    Commands run with `--progress` that stop making progress are stopped, and run again up to retries times. Only pass retries for commands that are safe to repeat. Commands without `--progress` print nothing while they work, so they are never stopped.
+    """
+    command = ['git', *args]
+    name = ' '.join(args[:2]) if args[0] == 'submodule' else args[0]
+    timeout = stall_timeout() if '--progress' in args else 0
+    cli.log.debug('Git command: %s', command)
+
+    for attempt in range(retries + 1):
+        progress = GitProgress(label or str(cwd or '.'), name, display, stats, timeout)
+
+        try:
+            p = subprocess.Popen(command, cwd=cwd, stderr=subprocess.STDOUT, stdout=subprocess.PIPE)
+            stalled = stream(p, progress)
+
+        except Exception as e:
+            git_cmd = ' '.join([s.replace(' ', r'\ ') for s in command])
+
+            cli.log.error("Could not run '%s': %s: %s", git_cmd, e.__class__.__name__, e)
+            return False
+
+        if not stalled:
+            break
+
+        cli.log.warning('git %s for %s made no progress for %d seconds, %s', name, progress.run.repo, progress.stall_timeout, 'trying again.' if attempt < retries else 'giving up.')
+
+    if p.returncode != 0:
+        cli.log.error('git %s exited %d', name, p.returncode)
+        return False
+
+    return True
+
+
+def git_output(args, cwd=None):
+    """Run git with args and return what it printed, or None if it failed.
+    """
+    try:
+        result = subprocess.run(['git', *args], cwd=cwd, stdin=subprocess.DEVNULL, capture_output=True, encoding='utf-8')
+    except OSError as e:
+        cli.log.debug('Could not run git %s: %s', args[0], e)
+        return None
+
+    if result.returncode != 0:
+        return None
+
+    return result.stdout
+
+
+def is_shallow(repo):
+    """Returns True if repo is a shallow clone.
+    """
+    return (git_output(['rev-parse', '--is-shallow-repository'], cwd=repo) or '').strip() == 'true'
+
+
+def fetch_depth(repo, depth):
+    """Returns the --depth argument to fetch into repo with, if any.
+
+    Fetching with --depth into a full clone makes it shallow, so depth only applies to clones that are shallow already.
+    """
+    if depth and is_shallow(repo):
+        return [f'--depth={depth}']
+
+    return []
+
+
+def submodules(repo):
+    """Returns a list of (url, path) tuples for the initialized submodules of repo.
+    """
+    paths = git_output(['config', '--file', '.gitmodules', '--get-regexp', r'^submodule\..*\.path$'], cwd=repo) or ''
+    found = []
+
+    for line in paths.splitlines():
+        key, _, path = line.partition(' ')
+        url = git_output(['config', '--get', key[:-len('.path')] + '.url'], cwd=repo)
+
+        if url:
+            found.append((url.strip(), path))
+
+    return found
+
+
+def update_submodule_from_mirror(repo, url, path, depth=0):
+    """Check out one submodule of repo, borrowing objects from its mirror, and then its own submodules.
+    """
+    from qmk_cli.mirror import reference
+
+    git_update = ['submodule', 'update', '--init', '--progress']
+    mirror = reference(url)
+
+    if mirror:
+        git_update.extend(['--reference', str(mirror), '--dissociate'])
+
+    if depth:
+        git_update.append(f'--depth={depth}')
+
+    if not run_git([*git_update, '--', path], cwd=repo, label=os.path.join(repo, path), retries=stall_retries()):
+        return False
+
+    return submodule_update_from_mirrors(os.path.join(repo, path), depth)
+
+
+def submodule_update_from_mirrors(repo, depth=0, jobs=None, paths=None):
+    """Check out the submodules of repo, or just those in paths, recursively, borrowing objects from their mirrors.
+
+    `git submodule update` only takes a single --reference, so each submodule is updated on its own, jobs at a time.
+    """
+    if not run_git(['submodule', 'init'], cwd=repo):
+        return False
+
+    # Not a JobRunner: each update is run_git() with its retries and progress display, not a bare command whose output we collect
+    with ThreadPoolExecutor(jobs or fetch_jobs()) as executor:
+        results = [executor.submit(update_submodule_from_mirror, repo, url, path, depth) for url, path in submodules(repo) if paths is None or path in paths]
+
+    return all(result.result() for result in results)
+
+
+def git_clone(url, destination, branch, depth=0, filter=None, shallow_submodules=False, jobs=None, mirror=False):
+    """Clone url and its submodules to destination.
+
+    With mirror, the mirrors of url and its submodules are refreshed first and the clone borrows objects from them.
+    """
     git_clone = [
-        'git',
         'clone',
-        '--recurse-submodules',
+        '--progress',
         '--branch=' + branch,
-        url,
-        str(destination),
     ]
-    cli.log.debug('Git clone command: %s', git_clone)
 
-    try:
-        with subprocess.Popen(git_clone, stderr=subprocess.STDOUT, stdout=subprocess.PIPE, bufsize=1, universal_newlines=True, encoding='utf-8') as p:
-            for line in p.stdout:
-                print(line, end='')
+    if mirror:
+        from qmk_cli.mirror import reference, refresh_mirrors  # qmk_cli.mirror imports this module
+
+        if refresh_mirrors([url], jobs):
+            cli.log.warning('Could not update every mirror, anything missing will be fetched from its origin.')
+
+        mirror_path = reference(url)
+
+        if mirror_path:
+            git_clone.extend(['--reference-if-able', str(mirror_path), '--dissociate'])
+
+    else:
+        git_clone.append('--recurse-submodules')
+
+    if depth:
+        git_clone.append(f'--depth={depth}')
+
+    if filter:
+        git_clone.append(f'--filter={filter}')
 
-    except Exception as e:
-        git_cmd = ' '.join([s.replace(' ', r'\ ') for s in git_clone])
+    if shallow_submodules:
+        git_clone.append('--shallow-submodules')
 
-        cli.log.error("Could not run '%s': %s: %s", git_cmd, e.__class__.__name__, e)
+    if jobs:
+        git_clone.append(f'--jobs={jobs}')
+
+    # Not retried: a stopped clone can leave a checkout behind that another attempt can't clone into
+    if not run_git([*git_clone, url, str(destination)], label=str(destination)):
         return False
 
-    if p.returncode == 0:
-        cli.log.info('Successfully cloned %s to %s!', url, destination)
-        return True
+    if mirror and not submodule_update_from_mirrors(str(destination), 1 if shallow_submodules else 0, jobs):
+        return False
+
+    cli.log.info('Successfully cloned %s to %s!', url, destination)
+    return True
+
+
+def submodule_update(repo, depth=0, jobs=None, mirror=False, paths=None):
+    """Bring the submodules of an existing checkout, or just those in paths, up to date, only fetching what is missing.
+    """
+    paths_args = ['--', *paths] if paths is not None else []
+
+    if not run_git(['submodule', 'sync', '--recursive', *paths_args], cwd=repo):
+        return False
+
+    if mirror:
+        return submodule_update_from_mirrors(str(repo), depth, jobs, paths)
+
+    git_update = ['submodule', 'update', '--init', '--recursive', '--progress']
+
+    if depth:
+        git_update.append(f'--depth={depth}')
+
+    if jobs:
+        git_update.append(f'--jobs={jobs}')
 
+    return run_git([*git_update, *paths_args], cwd=repo, retries=stall_retries())
+
+
+def stale_submodules(repo):
+    """Returns the paths of the submodules of repo that are missing, or not checked out at the commit repo records for them.
+    """
+    status = git_output(['submodule', 'status'], cwd=repo) or ''
+
+    return [line[1:].split(' ', 2)[1] for line in status.splitlines() if line[:1] in ('-', '+', 'U')]
+
+
+def same_url(url1, url2):
+    """Returns True if two git urls point at the same repository.
+    """
+    def normalize(url):
+        url = url.rstrip('/')
+        return url[:-4] if url.endswith('.git') else url
+
+    return normalize(url1) == normalize(url2)
+
+
+def add_remote(repo, url):
+    """Returns the name of the remote of repo that points at url, adding one named after the owner of url if there isn't one yet.
+    """
+    remotes = {}
+
+    for line in (git_output(['remote', '-v'], cwd=repo) or '').splitlines():
+        name, remote_url, *_ = line.split()
+        remotes[name] = remote_url
+
+    for name, remote_url in remotes.items():
+        if same_url(remote_url, url):
+            return name
+
+    owner = url.rstrip('/').split('/')[-2] if url.count('/') > 1 else 'fork'
+    name = owner = re.sub(r'[^A-Za-z0-9._-]+', '-', owner) or 'fork'
+    suffix = 1
+
+    while name in remotes:
+        suffix += 1
+        name = f'{owner}{suffix}'
+
+    if not run_git(['remote', 'add', name, url], cwd=repo):
+        return None
+
+    cli.log.info('Added %s as remote %s.', url, name)
+    return name
+
+
+def fetch_branch(repo, url, branch, depth=0):
+    """Fetch branch of url into repo. Returns the remote-tracking ref it was fetched to, or None if that failed.
+    """
+    remote = add_remote(repo, url)
+
+    if not remote:
+        return None
+
+    git_fetch = ['fetch', '--progress', remote, f'+refs/heads/{branch}:refs/remotes/{remote}/{branch}', *fetch_depth(repo, depth)]
+
+    if not run_git(git_fetch, cwd=repo, retries=stall_retries()):
+        return None
+
+    return f'{remote}/{branch}'
+
+
+def lost_commits(repo, branch, ref):
+    """Returns the commits `switch_fork(repo, ref, branch)` would throw away, as `hash subject` lines, or None if that can't be worked out.
+
+    Those are the commits on the local branch, and on a detached HEAD, that neither ref nor any other branch or tag contains.
+    """
+    tips = []
+
+    if git_output(['rev-parse', '--verify', '--quiet', f'refs/heads/{branch}'], cwd=repo) is not None:
+        tips.append(f'refs/heads/{branch}')
+
+    if git_output(['symbolic-ref', '--quiet', 'HEAD'], cwd=repo) is None:
+        tips.append('HEAD')
+
+    if not tips:
+        return []
+
+    output = git_output(['log', '--format=%h %s', *tips, '--not', ref, f'--exclude={branch}', '--branches', '--remotes', '--tags'], cwd=repo)
+
+    return None if output is None else output.splitlines()
+
+
+def switch_fork(repo, ref, branch, shallow_submodules=False, jobs=None, mirror=False):
+    """Reset branch of the existing clone at repo to ref, as fetched by fetch_branch(), and check it out.
+
+    Forks share almost all of their history, so fetching ref only downloads the objects repo is missing. Uncommitted changes to tracked files are discarded, untracked files are left alone. Commits on branch that ref doesn't contain are lost, so check lost_commits() first.
+    """
+    if not run_git(['checkout', '--force', '-B', branch, '--track', ref], cwd=repo):
+        return False
+
+    if not submodule_update(repo, 1 if shallow_submodules else 0, jobs, mirror):
+        return False
+
+    cli.log.info('Switched %s to %s!', repo, ref)
+    return True
+
+
+def worktree_add(repo, destination, url, branch, depth=0, shallow_submodules=False, jobs=None, mirror=False):
+    """Check out branch of url to destination as a worktree of the existing clone at repo, sharing its objects.
+    """
+    ref = fetch_branch(repo, url, branch, depth)
+
+    if not ref:
+        return False
+
+    git_worktree = ['worktree', 'add']
+
+    if git_output(['rev-parse', '--verify', '--quiet', f'refs/heads/{branch}'], cwd=repo) is None:
+        git_worktree.extend(['--track', '-b', branch])
     else:
-        cli.log.error('git clone exited %d', p.returncode)
+        # The branch already exists in repo, and is probably checked out there
+        git_worktree.append('--detach')
+
+    if not run_git([*git_worktree, str(destination), ref], cwd=repo):
+        return False
+
+    if not submodule_update(destination, 1 if shallow_submodules else 0, jobs, mirror):
+        return False
+
+    cli.log.info('Successfully added a worktree for %s %s at %s!', url, branch, destination)
+    return True
+
+
+def update_checkout(repo, shallow_submodules=False, jobs=None, mirror=False):
+    """Fast-forward the existing clone at repo to its upstream branch, and update only the submodules that changed.
+
+    The fetch never passes --depth: a full clone would become shallow, and a shallow one would lose the merge base the fast-forward needs. Without it git only fetches the new commits, so a shallow clone stays shallow and a full one stays full.
+
+    Reports what changed and how long each phase took. Returns False if repo could not be updated, including when it has diverged from its upstream.
+    """
+    timings = {}
+    start = time.monotonic()
+    branch = (git_output(['symbolic-ref', '--quiet', '--short', 'HEAD'], cwd=repo) or '').strip()
+
+    if not branch:
+        cli.log.error('%s is not on a branch, not updating it.', repo)
+        return False
+
+    remote = (git_output(['config', '--get', f'branch.{branch}.remote'], cwd=repo) or '').strip()
+    merge = (git_output(['config', '--get', f'branch.{branch}.merge'], cwd=repo) or '').strip()
+
+    if not remote or not merge:
+        cli.log.error('Branch %s has no upstream branch to update from.', branch)
+        return False
+
+    git_fetch = ['fetch', '--progress', '--no-recurse-submodules', remote, merge]
+
+    old = git_output(['rev-parse', 'HEAD'], cwd=repo)
+
+    if old is None:
+        cli.log.error('Could not find the current commit of %s, not updating it.', repo)
         return False
+
+    old = old.strip()
+
+    if not run_git(git_fetch, cwd=repo, retries=stall_retries()):
+        return False
+
+    timings['fetch'] = time.monotonic() - start
+
+    if not run_git(['merge', '--ff-only', 'FETCH_HEAD'], cwd=repo):
+        cli.log.error('Could not fast-forward %s to %s %s. Commit, stash or rebase your changes and try again.', branch, remote, merge)
+        return False
+
+    new = git_output(['rev-parse', 'HEAD'], cwd=repo)
+
+    if new is None:
+        cli.log.error('Could not find the commit %s was updated to.', repo)
+        return False
+
+    new = new.strip()
+    timings['merge'] = time.monotonic() - start - sum(timings.values())
+
+    stale = stale_submodules(repo)
+
+    if stale and not submodule_update(repo, 1 if shallow_submodules else 0, jobs, mirror, stale):
+        return False
+
+    timings['submodules'] = time.monotonic() - start - sum(timings.values())
+
+    if old == new:
+        cli.log.info('%s is already up to date with %s.', branch, remote)
+    else:
+        commits = (git_output(['rev-list', '--count', f'{old}..{new}'], cwd=repo) or '?').strip()
+        stats = (git_output(['diff', '--shortstat', old, new], cwd=repo) or '').strip() or 'no file changes'
+        cli.log.info('Updated %s from %s to %s: %s commits, %s', branch, old[:10], new[:10], commits, stats)
+
+    for path in stale:
+        cli.log.info('Updated submodule %s', path)
+
+    cli.log.info('Finished in %.1fs (%s)', time.monotonic() - start, ', '.join(f'{phase} {seconds:.1f}s' for phase, seconds in timings.items()))
+
+    return True
@@ -5,11 +5,21 @@ import sys
 import stat
 import json
 import shutil
+import time
 from functools import lru_cache
 from pathlib import Path
 
 from milc import cli
 
+from . import __version__
+from .cache import fingerprint, read_cache, write_cache
+
+DISCOVERY_CACHE = 'discovery.json'
+DISCOVERY_CACHE_ENTRIES = 64
+DISCOVERY_RACY_NS = 2 * 1000 * 1000 * 1000  # Paths modified this recently may change again without a visible mtime change
+FIRMWARE_MARKERS = ('lib/python/qmk/cli/__init__.py',)
+USERSPACE_MARKERS = ('qmk.json',)
+
 
 def AbsPath(arg):  # noqa: N802
     """Resolve relative paths to the original working directory.
@@ -59,14 +69,24 @@ def find_qmk_firmware():
 
     This function returns the path to qmk_firmware, or the default location if one does not exist.
     """
-    if in_qmk_firmware():
-        return in_qmk_firmware()
+    return cached_discovery('qmk_firmware', 'QMK_HOME', cli.config.user.qmk_home, _find_qmk_firmware)
+
+
+def _find_qmk_firmware(watched):
+    """Does the work for find_qmk_firmware(), appending every path the result depends on to watched.
+    """
+    qmk_firmware = find_upwards(is_qmk_firmware, FIRMWARE_MARKERS, watched)
+    if qmk_firmware:
+        return qmk_firmware
 
     if cli.config.user.qmk_home:
-        return Path(cli.config.user.qmk_home).expanduser().resolve()
+        path = Path(cli.config.user.qmk_home).expanduser()
+        watched.append(path)
+        return path.resolve()
 
     if 'QMK_HOME' in os.environ:
         path = Path(os.environ['QMK_HOME']).expanduser()
+        watched.append(path)
         if path.exists():
             return path.resolve()
         return path
@@ -78,14 +98,7 @@ def find_qmk_firmware():
 def in_qmk_firmware():
     """Returns the path to the qmk_firmware we are currently in, or None if we are not inside qmk_firmware.
     """
-    cur_dir = Path.cwd()
-    while len(cur_dir.parents) > 0:
-        if is_qmk_firmware(cur_dir):
-            return cur_dir
-
-        # Move up a directory before the next iteration
-        cur_dir = cur_dir / '..'
-        cur_dir = cur_dir.resolve()
+    return find_upwards(is_qmk_firmware, FIRMWARE_MARKERS)
 
 
 def is_qmk_userspace(qmk_userspace):
@@ -105,17 +118,27 @@ def is_qmk_userspace(qmk_userspace):
 def find_qmk_userspace():
     """Look for qmk_userspace in the usual places.
     """
-    if in_qmk_userspace():
-        return in_qmk_userspace()
+    return cached_discovery('qmk_userspace', 'QMK_USERSPACE', cli.config.user.overlay_dir, _find_qmk_userspace)
+
+
+def _find_qmk_userspace(watched):
+    """Does the work for find_qmk_userspace(), appending every path the result depends on to watched.
+    """
+    qmk_userspace = find_upwards(is_qmk_userspace, USERSPACE_MARKERS, watched)
+    if qmk_userspace:
+        return qmk_userspace
 
     if 'QMK_USERSPACE' in os.environ:
         path = Path(os.environ['QMK_USERSPACE']).expanduser()
+        watched.append(path)
         if path.exists():
             return path.resolve()
         return path
 
     if cli.config.user.overlay_dir:
-        return Path(cli.config.user.overlay_dir).expanduser().resolve()
+        path = Path(cli.config.user.overlay_dir).expanduser()
+        watched.append(path)
+        return path.resolve()
 
     return Path.home() / 'qmk_userspace'
 
@@ -124,11 +147,80 @@ def find_qmk_userspace():
 def in_qmk_userspace():
     """Returns the path to the qmk_userspace we are currently in, or None if we are not inside qmk_userspace.
     """
+    return find_upwards(is_qmk_userspace, USERSPACE_MARKERS)
+
+
+def find_upwards(is_match, markers=(), watched=None):
+    """Walk up from the current directory and return the first directory for which is_match() is True.
+
+    When watched is a list every directory we visit is appended to it, which is enough to notice markers being created or removed. Markers can also change without their directory changing, so we add the markers of the directory we return, and any that already exist below it.
+    """
     cur_dir = Path.cwd()
     while len(cur_dir.parents) > 0:
-        if is_qmk_userspace(cur_dir):
+        if is_match(cur_dir):
+            if watched is not None:
+                watched.append(cur_dir)
+                watched.extend(cur_dir / marker for marker in markers)
+
             return cur_dir
 
-        # Move up a directory before the next iteration
-        cur_dir = cur_dir / '..'
-        cur_dir = cur_dir.resolve()
+        if watched is not None:
+            watched.append(cur_dir)
+            watched.extend(path for path in (cur_dir / marker for marker in markers) if path.exists())
+
+        # Move up a directory before the next iteration. getcwd() has already resolved any symlinks, so the parent is the real parent.
+        cur_dir = cur_dir.parent
+
+
+@lru_cache(maxsize=1)
+def _discovery_cache():
+    """Load the discovery cache from disk.
+    """
+    cache = read_cache(DISCOVERY_CACHE)
+
+    if not isinstance(cache, dict) or cache.get('version') != __version__ or not isinstance(cache.get('entries'), dict):
+        cache = {'version': __version__, 'entries': {}}
+
+    return cache
+
+
+def cached_discovery(kind, env_var, config_value, find):
+    """Returns the result of find(watched), answering from the on-disk discovery cache when possible.
+
+    Entries are keyed by the cwd, the environment variable and config value that can override the search, and $HOME. An entry is only used when every path the original search depended on still has the same inode, mtime and size. That is the directories between the cwd and the result, and the markers that exist in them, not every marker we looked for. Creating or removing a file changes the mtime of its directory, so this catches new or deleted markers as well as edits to qmk.json.
+
+    Set QMK_NO_DISCOVERY_CACHE to bypass the cache.
+    """
+    if 'QMK_NO_DISCOVERY_CACHE' in os.environ:
+        return find([])
+
+    key = json.dumps([kind, os.getcwd(), os.environ.get(env_var), str(config_value) if config_value else None, os.path.expanduser('~')])
+    entries = _discovery_cache()['entries']
+    entry = entries.get(key)
+
+    if entry and all(fingerprint(path) == fp for path, fp in entry['watched']):
+        return Path(entry['path'])
+
+    watched = []
+    result = find(watched)
+    fingerprints = []
+    racy_ns = time.time_ns() - DISCOVERY_RACY_NS
+
+    for path in watched:
+        fp = fingerprint(path)
+
+        # Don't store results that depend on something modified within the last couple of seconds, a second change inside the same mtime tick would go unnoticed.
+        if fp and fp[1] > racy_ns:
+            return result
+
+        fingerprints.append([str(path), fp])
+
+    entries.pop(key, None)
+    entries[key] = {'path': str(result), 'watched': fingerprints}
+
+    while len(entries) > DISCOVERY_CACHE_ENTRIES:
+        del entries[next(iter(entries))]
+
+    write_cache(DISCOVERY_CACHE, _discovery_cache())
+
+    return result
@@ -0,0 +1,221 @@
+"""Run external commands in parallel.
+
+Submit commands to a JobRunner and then run() them, at most `jobs` at a time. The output of each command is either captured and handed back in one piece when it finishes, or streamed as it arrives with every line prefixed by the job's name. With fail_fast the first failure stops everything still running and skips everything that hasn't started.
+
+    runner = JobRunner(jobs=4)
+    runner.submit(['make', 'clean'], name='clean')
+    runner.submit(['make', 'all'], name='all')
+
+    if not runner.run():
+        ...
+"""
+import os
+import shlex
+import signal
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from threading import Event, Lock
+
+from milc import cli
+
+PREFIX_WIDTH = 24  # Longest job name to show in front of streamed output
+
+
+def cpu_jobs():
+    """Returns the default number of commands to run at once, one per CPU.
+    """
+    return os.cpu_count() or 1
+
+
+def _terminate(process):
+    """Stop process and anything it started.
+    """
+    if hasattr(os, 'killpg'):
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+            return
+        except OSError:
+            pass
+
+    process.terminate()
+
+
+class Job(object):
+    """A command to run, and what happened when it ran.
+    """
+    def __init__(self, command, name=None, cwd=None, env=None):
+        self.command = command
+        self.name = name or shlex.join(command)
+        self.cwd = cwd
+        self.env = env
+        self.output = bytearray()
+        self.returncode = None
+        self.start = self.end = None
+        self.cancelled = False
+        self.process = None
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def seconds(self):
+        if self.start is None:
+            return 0
+
+        return (self.end or time.monotonic()) - self.start
+
+    @property
+    def status(self):
+        if self.cancelled:
+            return 'cancelled' if self.start else 'skipped'
+
+        if self.returncode is None:
+            return 'pending'
+
+        return 'ok' if self.returncode == 0 else f'exit {self.returncode}'
+
+
+class JobRunner(object):
+    """Runs submitted jobs, at most `jobs` at a time.
+
+    Args:
+        jobs
+            How many jobs to run at once. Default: the number of CPUs
+
+        capture
+            Collect each job's output in `job.output` and pass it to finished(), instead of streaming it with a prefix.
+
+        fail_fast
+            Stop running jobs and skip the rest when one fails.
+
+        finished
+            Called with each job that ran as it finishes, from the thread that called run().
+
+        stream
+            Where streamed output goes. Default: sys.stdout
+    """
+    def __init__(self, jobs=None, capture=True, fail_fast=False, finished=None, stream=None):
+        self.jobs = max(jobs or cpu_jobs(), 1)
+        self.capture = capture
+        self.fail_fast = fail_fast
+        self.finished = finished
+        self._stream = stream
+        self.queue = []
+        self.lock = Lock()
+        self.cancel_event = Event()
+        self.start = self.end = None
+
+    @property
+    def stream(self):
+        return self._stream or sys.stdout
+
+    def submit(self, command, name=None, cwd=None, env=None):
+        """Add a command to run. Returns its Job.
+        """
+        job = Job(command, name, cwd, env)
+        self.queue.append(job)
+
+        return job
+
+    def cancel(self):
+        """Stop every running job, and don't start any more.
+        """
+        self.cancel_event.set()
+
+        with self.lock:
+            for job in self.queue:
+                if job.returncode is None:
+                    job.cancelled = True
+
+                if job.process and job.process.poll() is None:
+                    _terminate(job.process)
+
+    def _write(self, job, line):
+        prefix = job.name if len(job.name) <= PREFIX_WIDTH else job.name[:PREFIX_WIDTH - 3] + '...'
+
+        with self.lock:
+            self.stream.write(f'[{prefix:<{PREFIX_WIDTH}}] {line.decode("utf-8", errors="replace").rstrip()}\n')
+            self.stream.flush()
+
+    def _run_job(self, job):
+        with self.lock:
+            if self.cancel_event.is_set():
+                job.cancelled = True
+                return job
+
+            job.start = time.monotonic()
+
+            try:
+                # Each job gets its own process group so cancel() can stop everything it started, not just the command itself.
+                job.process = subprocess.Popen(job.command, cwd=job.cwd, env=job.env, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, start_new_session=hasattr(os, 'killpg'))
+            except OSError as e:
+                job.output += f'{e.__class__.__name__}: {e}\n'.encode('utf-8')
+                job.returncode = 127
+                job.end = time.monotonic()
+                return job
+
+        for line in job.process.stdout:
+            if self.capture:
+                job.output += line
+            else:
+                self._write(job, line)
+
+        job.process.stdout.close()
+        job.returncode = job.process.wait()
+        job.end = time.monotonic()
+
+        if self.fail_fast and job.returncode and not job.cancelled:
+            self.cancel()
+
+        return job
+
+    def run(self):
+        """Run every submitted job. Returns True if they all succeeded.
+        """
+        self.start = time.monotonic()
+
+        with ThreadPoolExecutor(min(self.jobs, len(self.queue)) or 1) as executor:
+            futures = [executor.submit(self._run_job, job) for job in self.queue]
+
+            try:
+                for future in as_completed(futures):
+                    job = future.result()
+
+                    if self.finished and job.start:
+                        self.finished(job)
+
+            except KeyboardInterrupt:
+                # Our jobs are in their own process groups, so they didn't get the ^C.
+                self.cancel()
+                raise
+
+        self.end = time.monotonic()
+
+        return all(job.returncode == 0 and not job.cancelled for job in self.queue)
+
+    def failed(self):
+        """Returns the jobs that failed, were cancelled or were skipped.
+        """
+        return [job for job in self.queue if job.returncode != 0 or job.cancelled]
+
+    def cancelled(self):
+        """Returns the jobs that were cancelled or skipped.
+        """
+        return [job for job in self.queue if job.cancelled]
+
+    def log_summary(self, log=None):
+        """Log how long every job took, and how much running them in parallel saved.
+        """
+        log = log or cli.log
+        busy = sum(job.seconds for job in self.queue)
+        wall = (self.end or time.monotonic()) - (self.start or time.monotonic())
+
+        for job in sorted(self.queue, key=lambda job: job.seconds, reverse=True):
+            level = log.info if job.status == 'ok' else log.error
+            level('%8.2fs  %-9s  %s', job.seconds, job.status, job)
+
+        cancelled = len(self.cancelled())
+        failed = len(self.failed()) - cancelled
+        log.info('%d jobs, %d failed, %d cancelled, in %.2fs (%.2fs of work, %.1fx parallel).', len(self.queue), failed, cancelled, wall, busy, busy / wall if wall else 0)
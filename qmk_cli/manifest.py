@@ -0,0 +1,219 @@
+"""Lazy registration of subcommands from a cached manifest.
+
+Importing a subcommand module pulls in everything that module needs, even when the user is running a different subcommand. Instead we keep a manifest of each module's subcommands, their help text and their arguments. On startup only the module for the subcommand being dispatched is imported, every other subcommand is registered with a stub parser built from the manifest. That is enough for `qmk --help` and tab completion to work.
+
+Stub arguments are registered through cli.argument(), the same as the real ones, so milc knows which of them are backed by the config file. `qmk config` lists and sets every subcommand's config, including defaults the manifest does not keep, so it always imports every module.
+
+The manifest is rebuilt, by importing every module, whenever qmk_cli or one of the modules changes. Set QMK_EAGER_SUBCOMMANDS to always import every module.
+"""
+import json
+import os
+import subprocess
+import sys
+from importlib import import_module
+from pathlib import Path
+
+from milc import cli
+
+from . import __version__
+from .cache import fingerprint, read_cache, write_cache
+
+MANIFEST_CACHE = 'subcommands.json'
+JSON_TYPES = (str, int, float, bool, type(None))
+EAGER_SUBCOMMANDS = {'config'}  # Subcommands that need every module's arguments registered for real
+
+
+def _manifest_key(package, modules):
+    """Returns the key that identifies a manifest for these modules.
+    """
+    package_dir = Path(sys.modules[package].__file__).parent
+    sources = {module: fingerprint(package_dir / f'{module}.py') for module in modules}
+
+    # Some help text includes $QMK_HOME or a default worked out from the number of CPUs, so those invalidate the manifest too.
+    return [__version__, list(sys.version_info[:2]), fingerprint(__file__), os.environ.get('QMK_HOME'), os.cpu_count(), package, sources]
+
+
+def _json_value(value):
+    """Returns value if it can be stored in the manifest, or its string representation if it can't.
+    """
+    if isinstance(value, JSON_TYPES):
+        return value
+
+    if isinstance(value, (list, tuple)) and all(isinstance(item, JSON_TYPES) for item in value):
+        return list(value)
+
+    return str(value)
+
+
+def _describe_argument(parser, section, action):
+    """Returns a manifest entry for an argparse action, in the form it was passed to cli.argument().
+
+    Defaults are only kept for arguments backed by the config file. arg_only defaults are often worked out at startup, from the environment or the machine we're running on, and the stub never uses them.
+    """
+    action_names = {action_class: name for name, action_class in parser._registries['action'].items() if isinstance(name, str)}
+    arg_only = section in cli.milc.arg_only.get(action.dest, [])
+    argument = {
+        'option_strings': action.option_strings,
+        'dest': action.dest,
+        'action': action_names.get(type(action), 'store' if action.nargs != 0 else 'store_true'),
+        'help': action.help,
+    }
+
+    if arg_only:
+        argument['arg_only'] = True
+    else:
+        argument['default'] = _json_value(action.default)
+
+    if action.nargs != 0:
+        argument['nargs'] = action.nargs
+        argument['metavar'] = _json_value(action.metavar) if action.metavar is not None else None
+        argument['choices'] = _json_value(list(action.choices)) if action.choices is not None else None
+
+    if action.option_strings:
+        argument['required'] = action.required
+
+    if argument['action'] in ('store_const', 'append_const'):
+        argument['const'] = _json_value(action.const)
+
+    if argument['action'] == 'version':
+        argument['version'] = action.version
+
+    return argument
+
+
+def _describe_arguments(parser, section):
+    """Returns manifest entries for every argument of parser.
+
+    milc adds a store_boolean argument as a --flag/--no-flag pair, which we fold back into the single argument it was declared as.
+    """
+    arguments = [_describe_argument(parser, section, action) for action in parser._actions if action.dest != 'help']
+    enabled = {argument['dest']: argument for argument in arguments if argument['action'] == 'store_true' and argument['help'] and argument['help'].startswith('Enable ')}
+    described = []
+
+    for argument in arguments:
+        boolean = enabled.get(argument['dest'])
+
+        if boolean and argument['action'] == 'store_false' and argument['option_strings'] == ['--no-' + boolean['option_strings'][-1][2:]]:
+            continue
+
+        if argument is boolean:
+            argument['action'] = 'store_boolean'
+            argument['help'] = argument['help'][len('Enable '):]
+
+        described.append(argument)
+
+    return described
+
+
+def _describe_subcommand(name):
+    """Returns a manifest entry for a registered subcommand.
+    """
+    parser = cli.subcommands[name].subparser
+    subparsers = cli.milc._subparsers
+    help_text = {choice.dest: choice.help for choice in subparsers._choices_actions}
+
+    return {
+        'name': name,
+        'help': help_text.get(name, ''),
+        'hidden': name not in (subparsers.metavar or '{}')[1:-1].split(','),
+        'arguments': _describe_arguments(parser, name.replace('-', '_')),
+    }
+
+
+def _stub_handler(name):
+    """Returns a placeholder for a subcommand whose module has not been imported.
+
+    The stub only runs when peek_subcommand() misjudged the command line, in which case we rerun ourselves with every module imported.
+    """
+    def stub(cli):
+        cli.log.debug('Subcommand %s was not imported, rerunning with QMK_EAGER_SUBCOMMANDS=1.', name)
+        env = {**os.environ, 'QMK_EAGER_SUBCOMMANDS': '1'}
+
+        # sys.argv[0] is usually the qmk script or the path to __main__.py, neither of which is something sys.executable can run on its own
+        return subprocess.run([sys.executable, '-m', 'qmk_cli', *sys.argv[1:]], env=env, cwd=os.environ.get('ORIG_CWD')).returncode
+
+    stub.__name__ = name.replace('-', '_')
+
+    return stub
+
+
+def _register_stub(subcommand):
+    """Register a subcommand from its manifest entry without importing its module.
+    """
+    handler = cli.subcommand(subcommand['help'], hidden=subcommand['hidden'])(_stub_handler(subcommand['name']))
+
+    for argument in subcommand['arguments']:
+        argument = argument.copy()
+        option_strings = argument.pop('option_strings')
+        dest = argument.pop('dest')
+
+        if option_strings:
+            cli.argument(*option_strings, dest=dest, **argument)(handler)
+        else:
+            cli.argument(dest, **argument)(handler)
+
+
+def peek_subcommand(argv):
+    """Returns the first positional argument in argv, which argparse will treat as the subcommand.
+
+    Returns None when there is no subcommand, and False when argv contains an option we can't account for.
+    """
+    options = cli.milc._arg_parser._option_string_actions
+    args = iter(argv)
+
+    for arg in args:
+        if arg == '--':
+            return next(args, None)
+
+        if arg == '-' or not arg.startswith('-'):
+            return False if arg.startswith('@') else arg
+
+        option = arg.split('=', 1)[0]
+        if option not in options:
+            return False
+
+        nargs = options[option].nargs
+        if nargs in ('?', '*', '+'):
+            return False
+
+        if '=' not in arg and nargs != 0:
+            for _ in range(nargs or 1):
+                next(args, None)
+
+    return None
+
+
+def build_manifest(package, modules):
+    """Import every subcommand module and save a manifest describing them.
+    """
+    manifest = {}
+
+    for module in modules:
+        before = set(cli.subcommands)
+        import_module(f'{package}.{module}')
+        manifest[module] = [_describe_subcommand(name) for name in cli.subcommands if name not in before]
+
+    write_cache(MANIFEST_CACHE, {'key': _manifest_key(package, modules), 'modules': manifest})
+
+
+def register_subcommands(package, modules, argv=None):
+    """Register the subcommands found in package's modules, importing only the one being dispatched.
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+
+    manifest = read_cache(MANIFEST_CACHE)
+
+    if not manifest or manifest.get('key') != json.loads(json.dumps(_manifest_key(package, modules))):
+        return build_manifest(package, modules)
+
+    dispatched = peek_subcommand(argv)
+
+    for module in modules:
+        subcommands = manifest['modules'][module]
+
+        if 'QMK_EAGER_SUBCOMMANDS' in os.environ or dispatched is False or dispatched in EAGER_SUBCOMMANDS or any(subcommand['name'] == dispatched for subcommand in subcommands):
+            import_module(f'{package}.{module}')
+        else:
+            for subcommand in subcommands:
+                _register_stub(subcommand)
@@ -0,0 +1,197 @@
+"""A local cache of bare mirrors of qmk_firmware and its submodules.
+
+With `--mirror` (or `qmk config clone.mirror=true`) `qmk clone` and `qmk setup` keep a mirror of every repository they clone in the qmk cache directory. Each mirror is fetched before cloning, which only downloads what changed since it was last used, and the clone then borrows objects from it with `--reference` and `--dissociate`. Every checkout still ends up with its own copy of the objects it needs, so mirrors can be refreshed or removed at any time without breaking anything.
+
+Manage the cache with `qmk mirror list|refresh|prune`.
+"""
+import hashlib
+import os
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from tempfile import mkdtemp
+
+from milc import cli
+
+from .cache import CACHE_DIR
+from .git import fetch_jobs, git_output, run_git
+from .progress import stall_retries
+from .helpers import rmtree
+
+MIRROR_DIR = CACHE_DIR / 'mirrors'
+LAST_USED = 'qmk-last-used'  # Touched in a mirror every time it is fetched or used
+
+
+def mirror_path(url):
+    """Returns the directory url is mirrored to.
+    """
+    name = re.sub(r'[^A-Za-z0-9._-]+', '_', re.sub(r'^[A-Za-z0-9+.-]+://', '', url).rstrip('/'))
+    digest = hashlib.sha1(url.encode('utf-8')).hexdigest()[:8]
+
+    return MIRROR_DIR / f'{name[-64:]}-{digest}.git'
+
+
+def resolve_url(base, url):
+    """Resolve a relative submodule url against the url of its superproject, the same way git does.
+    """
+    if not url.startswith(('./', '../')):
+        return url
+
+    base = base.rstrip('/')
+
+    while url.startswith(('./', '../')):
+        if url.startswith('../'):
+            base = base.rsplit('/', 1)[0]
+
+        url = url.split('/', 1)[1]
+
+    return f'{base}/{url}'
+
+
+def touch(path):
+    """Record that the mirror at path was just used.
+    """
+    try:
+        (path / LAST_USED).touch()
+    except OSError as e:
+        cli.log.debug('Could not update %s: %s', path / LAST_USED, e)
+
+
+def update_mirror(url):
+    """Create or fetch the mirror of url. Returns its path, or None if that failed.
+    """
+    path = mirror_path(url)
+
+    if path.exists():
+        cli.log.info('Updating mirror of %s', url)
+
+        if not run_git(['fetch', '--progress', '--prune', 'origin'], cwd=path, label=url, retries=stall_retries()):
+            return None
+
+    else:
+        cli.log.info('Creating mirror of %s', url)
+        MIRROR_DIR.mkdir(parents=True, exist_ok=True)
+
+        # Clone somewhere private first, so an interrupted clone never looks like a mirror
+        tmpdir = mkdtemp(dir=MIRROR_DIR, prefix=f'.{path.name}.')
+
+        if not run_git(['clone', '--mirror', '--progress', url, tmpdir], label=url, retries=stall_retries()):
+            rmtree(tmpdir)
+            return None
+
+        try:
+            os.rename(tmpdir, path)
+        except OSError:
+            # Someone else created it while we were cloning
+            rmtree(tmpdir)
+
+    touch(path)
+
+    return path
+
+
+def submodule_urls(path, url):
+    """Returns the urls of the submodules listed in the default branch of the mirror at path.
+    """
+    output = git_output(['config', '--blob', 'HEAD:.gitmodules', '--get-regexp', r'^submodule\..*\.url$'], cwd=path)
+
+    return [resolve_url(url, line.split(' ', 1)[1]) for line in (output or '').splitlines() if ' ' in line]
+
+
+def refresh_mirrors(urls, jobs=None):
+    """Create or update the mirrors of urls and all of their submodules, jobs at a time. Returns the number that failed.
+    """
+    seen = set(urls)
+    failed = 0
+
+    with ThreadPoolExecutor(jobs or fetch_jobs()) as executor:
+        pending = {executor.submit(update_mirror, url): url for url in seen}
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                url = pending.pop(future)
+                path = future.result()
+
+                if not path:
+                    failed += 1
+                    continue
+
+                for submodule_url in submodule_urls(path, url):
+                    if submodule_url not in seen:
+                        seen.add(submodule_url)
+                        pending[executor.submit(update_mirror, submodule_url)] = submodule_url
+
+    return failed
+
+
+def reference(url):
+    """Returns the mirror to borrow objects from when cloning url, or None if we don't have one.
+    """
+    path = mirror_path(url)
+
+    if not path.is_dir():
+        return None
+
+    touch(path)
+
+    return path
+
+
+def directory_size(path):
+    """Returns the total size of the files under path, in bytes.
+    """
+    size = 0
+
+    for root, _, files in os.walk(path):
+        for file in files:
+            try:
+                size += os.lstat(os.path.join(root, file)).st_size
+            except OSError:
+                pass
+
+    return size
+
+
+def list_mirrors():
+    """Returns a list of dicts describing every mirror in the cache.
+    """
+    if not MIRROR_DIR.is_dir():
+        return []
+
+    mirrors = []
+
+    for path in sorted(MIRROR_DIR.glob('*.git')):
+        try:
+            last_used = (path / LAST_USED).stat().st_mtime
+        except OSError:
+            last_used = path.stat().st_mtime
+
+        mirrors.append({
+            'path': path,
+            'url': (git_output(['config', '--get', 'remote.origin.url'], cwd=path) or '').strip(),
+            'size': directory_size(path),
+            'last_used': last_used,
+        })
+
+    return mirrors
+
+
+def prune_mirrors(days):
+    """Remove mirrors that have not been used in the last `days` days, and anything left behind by interrupted clones. Returns the removed mirrors.
+    """
+    cutoff = time.time() - days*86400
+    removed = []
+
+    for mirror in list_mirrors():
+        if mirror['last_used'] < cutoff:
+            cli.log.info('Removing mirror of %s', mirror['url'] or mirror['path'].name)
+            rmtree(mirror['path'])
+            removed.append(mirror)
+
+    for tmpdir in MIRROR_DIR.glob('.*.git.*'):
+        if tmpdir.stat().st_mtime < cutoff:
+            rmtree(tmpdir)
+
+    return removed
@@ -0,0 +1,138 @@
+"""Record how long each phase of `qmk` startup takes.
+
+Phases are always recorded, it only costs a clock read per phase. They are reported when `--profile-startup` is passed or QMK_PROFILE is set:
+
+    qmk --profile-startup ...               Print a table to stderr
+    qmk --profile-startup=FILE ...          Write JSON to FILE
+    QMK_PROFILE=1 qmk ...                   Print a table to stderr
+    QMK_PROFILE=FILE qmk ...                Write JSON to FILE
+
+This module is imported before anything else in qmk_cli.script_qmk, so it must only use the standard library.
+"""
+import atexit
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+PROFILE_ARG = '--profile-startup'
+
+_last_ns = time.perf_counter_ns()
+_last_imports = len(sys.modules)
+phases = []
+
+
+def _process_age_ns():
+    """Returns how long ago the kernel started this process, or None if we can't tell.
+    """
+    try:
+        with open('/proc/self/stat') as stat:
+            fields = stat.read().rsplit(')', 1)[1].split()
+
+        start_ns = int(fields[19]) * 1000 * 1000 * 1000 // os.sysconf('SC_CLK_TCK')
+
+        return time.clock_gettime_ns(time.CLOCK_BOOTTIME) - start_ns
+
+    except (AttributeError, IndexError, OSError, ValueError):
+        return None
+
+
+def phase(name):
+    """Record the time and number of imports since the previous phase ended as the phase `name`.
+    """
+    global _last_ns, _last_imports
+
+    now_ns = time.perf_counter_ns()
+    imports = len(sys.modules)
+    phases.append({'phase': name, 'ms': (now_ns-_last_ns) / 1000000, 'imports': imports - _last_imports})
+    _last_ns = now_ns
+    _last_imports = imports
+
+
+def _git_head(path):
+    """Returns the commit checked out at path, or None.
+    """
+    try:
+        result = subprocess.run(['git', '-C', str(path), 'rev-parse', 'HEAD'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+    except OSError:
+        return None
+
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def results():
+    """Returns everything we recorded as a JSON-serializable dict.
+    """
+    from . import __version__
+
+    qmk_home = os.environ.get('QMK_HOME')
+
+    return {
+        'qmk_cli_version': __version__,
+        'qmk_firmware': qmk_home,
+        'qmk_firmware_head': _git_head(qmk_home) if qmk_home else None,
+        'python_version': platform.python_version(),
+        'platform': platform.platform(),
+        'argv': sys.argv,
+        'total_ms': sum(p['ms'] for p in phases),
+        'phases': phases,
+    }
+
+
+def print_table(file=sys.stderr):
+    """Print the phases as a table.
+    """
+    total_ms = 0
+    print(f"{'Phase':<24} {'Time (ms)':>10} {'Total (ms)':>11} {'Imports':>8}", file=file)
+
+    for p in phases:
+        total_ms += p['ms']
+        imports = '' if p['imports'] is None else p['imports']
+        print(f"{p['phase']:<24} {p['ms']:>10.2f} {total_ms:>11.2f} {imports:>8}", file=file)
+
+
+def report(destination):
+    """Report the phases to destination, a path for JSON or None for a table on stderr.
+    """
+    if destination:
+        with open(destination, 'w', encoding='utf-8') as fd:
+            json.dump(results(), fd, indent=4)
+            fd.write('\n')
+    else:
+        print_table()
+
+
+def init():
+    """Enable reporting if it was asked for.
+
+    This removes our flag from sys.argv so the argument parser never sees it.
+    """
+    destination = os.environ.get('QMK_PROFILE')
+    enabled = bool(destination)
+
+    if destination in ('1', 'table'):
+        destination = None
+
+    argv = [sys.argv[0]]
+    for i, arg in enumerate(sys.argv[1:], 1):
+        if arg == '--':
+            argv.extend(sys.argv[i:])
+            break
+
+        if arg == PROFILE_ARG or arg.startswith(PROFILE_ARG + '='):
+            enabled = True
+            destination = arg.split('=', 1)[1] if '=' in arg else None
+        else:
+            argv.append(arg)
+
+    sys.argv = argv
+
+    if enabled:
+        process_age_ns = _process_age_ns()
+        if process_age_ns is not None:
+            # The kernel only tracks the start time in clock ticks, usually 10ms.
+            phases.insert(0, {'phase': 'interpreter', 'ms': max(process_age_ns - (time.perf_counter_ns() - _last_ns), 0) / 1000000, 'imports': None})
+
+        atexit.register(report, os.path.abspath(destination) if destination else None)
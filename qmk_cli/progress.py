@@ -0,0 +1,374 @@
+"""Follow git's progress output.
+
+Git reports progress as lines like `Receiving objects:  45% (4500/10000), 1.23 MiB | 2.00 MiB/s` that it redraws with a carriage return. We split its output on both `\\r` and `\\n` and parse each progress line into a ProgressEvent. The events drive a compact progress display, and are collected into per-repository, per-phase statistics that `--stats FILE` writes out as JSON.
+
+A git process run with `--progress` that prints nothing for QMK_GIT_STALL_TIMEOUT seconds (Default: 60) is assumed to be stuck on a slow or dead server and is stopped, so the caller can retry it, up to QMK_GIT_STALL_RETRIES times (Default: 2). Other commands, such as checkout or merge, can be silent for as long as they need, so they are never stopped.
+"""
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import time
+from collections import namedtuple
+from functools import lru_cache
+from threading import Lock, Thread
+
+from milc import cli
+
+STALL_TIMEOUT = 60  # Default for $QMK_GIT_STALL_TIMEOUT
+STALL_RETRIES = 2  # Default for $QMK_GIT_STALL_RETRIES
+DISPLAY_INTERVAL = 0.1  # Seconds between redraws of the progress line
+UNITS = {'bytes': 1, 'KiB': 1024, 'MiB': 1024**2, 'GiB': 1024**3}
+SIZE = r'[\d.]+ (?:bytes|[KMG]iB)'
+PROGRESS_RE = re.compile(rf'^(?:remote: )?(?P<phase>[A-Z][A-Za-z ]*?):\s+(?:(?P<percent>\d+)% \((?P<current>\d+)/(?P<total>\d+)\)|(?P<count>\d+))(?:, (?P<bytes>{SIZE})(?: \| (?P<rate>{SIZE})/s)?)?(?P<done>, done)?')
+CLONING_RE = re.compile(r"^Cloning into (?:bare repository )?'(?P<path>.*)'\.\.\.$")
+
+ProgressEvent = namedtuple('ProgressEvent', ['repo', 'phase', 'current', 'total', 'bytes', 'rate', 'done'])
+
+
+@lru_cache(maxsize=None)
+def _env_number(name, default, number_type):
+    """Returns the value of the environment variable name as a number_type, or default if it is unset or not a number of 0 or more.
+    """
+    value = os.environ.get(name)
+
+    if value is None:
+        return default
+
+    try:
+        number = number_type(value)
+    except ValueError:
+        number = -1
+
+    if number < 0:
+        cli.log.warning('Ignoring %s=%r, it must be a number of 0 or more. Using %s instead.', name, value, default)
+        return default
+
+    return number
+
+
+def stall_timeout():
+    """Returns how many seconds git may go without printing anything before we stop it.
+    """
+    return _env_number('QMK_GIT_STALL_TIMEOUT', STALL_TIMEOUT, float)
+
+
+def stall_retries():
+    """Returns how many times to retry a git command that stalled.
+    """
+    return _env_number('QMK_GIT_STALL_RETRIES', STALL_RETRIES, int)
+
+
+def parse_size(size):
+    """Returns the number of bytes in a size printed by git, such as `1.23 MiB`.
+    """
+    value, unit = size.split(' ')
+
+    return int(float(value) * UNITS[unit])
+
+
+def parse_progress(repo, line):
+    """Returns a ProgressEvent for a line of git output, or None if it isn't a progress line.
+    """
+    match = PROGRESS_RE.match(line)
+
+    if not match:
+        return None
+
+    current = int(match['current'] or match['count'])
+    total = int(match['total']) if match['total'] else None
+
+    return ProgressEvent(
+        repo=repo,
+        phase=match['phase'],
+        current=current,
+        total=total,
+        bytes=parse_size(match['bytes']) if match['bytes'] else None,
+        rate=parse_size(match['rate']) if match['rate'] else None,
+        done=bool(match['done']),
+    )
+
+
+def format_size(size):
+    for unit in ('bytes', 'KiB', 'MiB'):
+        if size < 1024:
+            return f'{size:.0f} {unit}' if unit == 'bytes' else f'{size:.1f} {unit}'
+
+        size /= 1024
+
+    return f'{size:.1f} GiB'
+
+
+def format_event(event):
+    """Returns a one line description of event.
+    """
+    text = f'{event.repo}: {event.phase}'
+
+    if event.total:
+        text += f' {event.current * 100 // event.total}% ({event.current}/{event.total})'
+    else:
+        text += f' {event.current}'
+
+    if event.bytes is not None:
+        text += f', {format_size(event.bytes)}'
+
+    if event.rate is not None:
+        text += f' at {format_size(event.rate)}/s'
+
+    return text
+
+
+class PhaseStats(object):
+    """What happened during one phase, like `Receiving objects`, of one git command.
+    """
+    def __init__(self, now):
+        self.start = self.end = now
+        self.objects = 0
+        self.total = None
+        self.bytes = None
+        self.rate = None
+        self.done = False
+
+    def update(self, event, now):
+        self.end = now
+        self.objects = event.current
+        self.total = event.total
+        self.bytes = event.bytes if event.bytes is not None else self.bytes
+        self.rate = event.rate if event.rate is not None else self.rate
+        self.done = event.done
+
+    def to_dict(self):
+        return {
+            'seconds': round(self.end - self.start, 3),
+            'objects': self.objects,
+            'total': self.total,
+            'bytes': self.bytes,
+            'rate': self.rate,
+            'done': self.done,
+        }
+
+
+class RunStats(object):
+    """Statistics for one repository within one git command.
+    """
+    def __init__(self, repo, command, now):
+        self.repo = repo
+        self.command = command
+        self.start = self.end = now
+        self.phases = {}
+        self.stalled = False
+        self.returncode = None
+
+    def to_dict(self):
+        return {
+            'repo': self.repo,
+            'command': self.command,
+            'seconds': round(self.end - self.start, 3),
+            'returncode': self.returncode,
+            'stalled': self.stalled,
+            'phases': {
+                phase: stats.to_dict()
+                for phase, stats in self.phases.items()
+            },
+        }
+
+
+class Stats(object):
+    """Every RunStats from this process, for `--stats`.
+    """
+    def __init__(self):
+        self.lock = Lock()
+        self.runs = []
+        self.start = time.monotonic()
+
+    def add(self, run):
+        with self.lock:
+            self.runs.append(run)
+
+    def to_dict(self):
+        with self.lock:
+            runs = [run.to_dict() for run in self.runs]
+
+        return {
+            'seconds': round(time.monotonic() - self.start, 3),
+            'stalls': sum(run['stalled'] for run in runs),
+            'runs': runs,
+        }
+
+    def write(self, path):
+        """Write a JSON summary to path, or stdout if path is `-`.
+        """
+        summary = json.dumps(self.to_dict(), indent=4)
+
+        if path == '-':
+            print(summary)
+            return
+
+        try:
+            with open(path, 'w', encoding='utf-8') as fd:
+                fd.write(summary + '\n')
+
+        except OSError as e:
+            cli.log.error('Could not write git stats to %s: %s', path, e)
+
+
+class ProgressDisplay(object):
+    """Shows progress from any number of git processes.
+
+    On a terminal the latest progress is drawn on a single line that other output scrolls past. Otherwise we print a line as each phase finishes.
+    """
+    def __init__(self, stream=None):
+        self._stream = stream
+        self.lock = Lock()
+        self.status = ''
+        self.last_draw = 0
+
+    @property
+    def stream(self):
+        return self._stream or sys.stdout
+
+    def _clear(self):
+        if self.status:
+            self.stream.write('\r\x1b[K')
+            self.status = ''
+
+    def line(self, text):
+        """Print a line of output that isn't progress.
+        """
+        with self.lock:
+            self._clear()
+            self.stream.write(text + '\n')
+            self.stream.flush()
+
+    def progress(self, event):
+        with self.lock:
+            if not self.stream.isatty():
+                if event.done:
+                    self.stream.write(format_event(event) + ', done.\n')
+                    self.stream.flush()
+
+                return
+
+            now = time.monotonic()
+
+            if event.done or now - self.last_draw >= DISPLAY_INTERVAL:
+                self._clear()
+                self.status = format_event(event)[:shutil.get_terminal_size().columns - 1]
+                self.stream.write(self.status)
+                self.stream.flush()
+                self.last_draw = now
+
+    def finish(self):
+        """Remove the progress line.
+        """
+        with self.lock:
+            self._clear()
+            self.stream.flush()
+
+
+class GitProgress(object):
+    """Parses the output of one git process, which is stopped if it prints nothing for stall_timeout seconds. 0 lets it run for as long as it takes.
+    """
+    def __init__(self, repo, command, display, stats, stall_timeout=0):
+        self.command = command
+        self.display = display
+        self.stats = stats
+        self.partial = b''
+        self.stall_timeout = stall_timeout
+        self.last_activity = time.monotonic()
+        self.runs = []
+        self._new_run(repo)
+
+    def _new_run(self, repo):
+        self.run = RunStats(repo, self.command, time.monotonic())
+        self.runs.append(self.run)
+        self.stats.add(self.run)
+
+    def feed(self, data):
+        """Handle a chunk of output. An empty chunk means the output has ended.
+        """
+        self.last_activity = time.monotonic()
+        lines = re.split(rb'[\r\n]', self.partial + data)
+        self.partial = lines.pop() if data else b''
+
+        for line in lines:
+            if line.strip():
+                self.handle(line.decode('utf-8', errors='replace').rstrip())
+
+    def handle(self, line):
+        now = time.monotonic()
+        event = parse_progress(self.run.repo, line)
+
+        if event:
+            if event.phase not in self.run.phases:
+                self.run.phases[event.phase] = PhaseStats(now)
+
+            self.run.phases[event.phase].update(event, now)
+            self.run.end = now
+            self.display.progress(event)
+            return
+
+        cloning = CLONING_RE.match(line)
+
+        if cloning and self.run.phases:
+            # `git clone --recurse-submodules` moving on to a submodule
+            self.run.end = now
+            self._new_run(cloning['path'])
+
+        self.display.line(line)
+
+    def finish(self, returncode, stalled):
+        now = time.monotonic()
+
+        for run in self.runs:
+            run.returncode = returncode
+            run.stalled = stalled
+
+        self.run.end = now
+        self.display.finish()
+
+
+def _read(fd, progress):
+    while True:
+        data = os.read(fd, 65536)
+        progress.feed(data)
+
+        if not data:
+            break
+
+
+def stream(process, progress):
+    """Feed the output of process to progress until it exits, stopping it if it stalls for progress.stall_timeout seconds. Returns True if it stalled.
+    """
+    stall_timeout = progress.stall_timeout
+    reader = Thread(target=_read, args=(process.stdout.fileno(), progress), name='git output', daemon=True)
+    reader.start()
+    stalled = False
+
+    while True:
+        try:
+            process.wait(timeout=1 if stall_timeout else None)
+            break
+
+        except subprocess.TimeoutExpired:
+            if time.monotonic() - progress.last_activity >= stall_timeout:
+                stalled = True
+                process.terminate()
+                process.wait()
+                break
+
+    # Something git started may still be holding its output open after we stopped it, so don't wait long for that
+    reader.join(1 if stalled else None)
+
+    if not reader.is_alive():
+        process.stdout.close()
+
+    progress.finish(process.returncode, stalled)
+
+    return stalled
+
+
+display = ProgressDisplay()
+stats = Stats()
@@ -3,6 +3,9 @@
 
 This program can be run from anywhere, with or without a qmk_firmware repository. If a qmk_firmware repository can be located we will use that to augment our available subcommands.
 """
+# This is imported first so it can time everything else.
+from qmk_cli import profiler
+
 import os
 from pathlib import Path
 import shlex
@@ -16,6 +19,10 @@ import platformdirs
 
 from . import __version__
 from .helpers import find_qmk_firmware, is_qmk_firmware, find_qmk_userspace, is_qmk_userspace
+from .manifest import peek_subcommand
+
+profiler.init()
+profiler.phase('imports')
 
 
 def _get_default_distrib_path():
@@ -39,6 +46,8 @@ if QMK_DISTRIB_DIR.exists():
 if 'QMK_PATH_PREFIX' in os.environ:
     os.environ['PATH'] = os.environ['QMK_PATH_PREFIX'] + os.pathsep + os.environ['PATH']
 
+profiler.phase('path setup')
+
 milc.cli.milc_options(version=__version__)
 milc.EMOJI_LOGLEVELS['INFO'] = '{fg_blue}Ψ{style_reset_all}'
 
@@ -53,6 +62,17 @@ def qmk_main(cli):
     cli.print_help()
 
 
+# milc 1.x has no prerun hooks, in that case parsing is counted as part of the subcommand.
+if hasattr(milc.cli, 'prerun'):
+
+    @milc.cli.prerun
+    def profile_parsing(cli):
+        profiler.phase('argument parsing')
+
+
+profiler.phase('milc setup')
+
+
 def run_cmd(*command):
     """Run a command in a subshell.
     """
@@ -64,18 +84,32 @@ def run_cmd(*command):
     return subprocess.run(command)
 
 
-# Python setuptools entrypoint
-def main():
-    """Setup the environment before dispatching to the entrypoint.
+def import_firmware_cli(qmk_firmware):
+    """Import the subcommands provided by qmk_firmware.
     """
-    # Warn if they use an outdated python version
-    if sys.version_info < (3, 9):
-        print('Warning: Your Python version is out of date! Some subcommands may not work!')
-        print('Please upgrade to Python 3.9 or later.')
+    try:
+        import qmk.cli  # noqa: F401
+
+    except ImportError as e:
+        if qmk_firmware.name != 'qmk_firmware':
+            print('Warning: %s does not end in "qmk_firmware". Do you need to set QMK_HOME to "%s/qmk_firmware"?' % (qmk_firmware, qmk_firmware))
 
-    # Environment setup
+        print('Error: %s: %s', (e.__class__.__name__, e))
+        print_exc()
+        sys.exit(1)
+
+    profiler.phase('qmk.cli')
+
+
+def load():
+    """Setup the environment and register every subcommand, without dispatching to one.
+
+    Returns the path to qmk_firmware.
+    """
     qmk_userspace = find_qmk_userspace()
+    profiler.phase('userspace discovery')
     qmk_firmware = find_qmk_firmware()
+    profiler.phase('firmware discovery')
     if is_qmk_userspace(qmk_userspace):
         os.environ['QMK_USERSPACE'] = str(qmk_userspace)
     elif 'QMK_USERSPACE' in os.environ:  # Failed to find valid userspace, including what was in the environment if specified -- wipe any environment variable if present as it's clearly invalid.
@@ -84,6 +118,8 @@ def main():
     os.environ['ORIG_CWD'] = os.getcwd()
 
     import qmk_cli.subcommands  # noqa: F401
+    wrapper_subcommands = set(milc.cli.subcommands) - {'batch', 'config', 'daemon'}
+    profiler.phase('qmk_cli.subcommands')
 
     # Check out and initialize the qmk_firmware environment
     if is_qmk_firmware(qmk_firmware):
@@ -91,19 +127,27 @@ def main():
         os.chdir(str(qmk_firmware))
         sys.path.append(str(qmk_firmware / 'lib/python'))
 
-        try:
-            import qmk.cli  # noqa: F401
+        # Our own subcommands need nothing from qmk_firmware, so don't spend time importing its CLI for them. It is still needed for `qmk config`, for `qmk --help` to list everything, and by `qmk batch` and `qmk daemon` to preload it.
+        if peek_subcommand(sys.argv[1:]) not in wrapper_subcommands:
+            import_firmware_cli(qmk_firmware)
+
+    return qmk_firmware
+
 
-        except ImportError as e:
-            if qmk_firmware.name != 'qmk_firmware':
-                print('Warning: %s does not end in "qmk_firmware". Do you need to set QMK_HOME to "%s/qmk_firmware"?' % (qmk_firmware, qmk_firmware))
+# Python setuptools entrypoint
+def main():
+    """Setup the environment before dispatching to the entrypoint.
+    """
+    # Warn if they use an outdated python version
+    if sys.version_info < (3, 9):
+        print('Warning: Your Python version is out of date! Some subcommands may not work!')
+        print('Please upgrade to Python 3.9 or later.')
 
-            print('Error: %s: %s', (e.__class__.__name__, e))
-            print_exc()
-            sys.exit(1)
+    load()
 
     # Call the entrypoint
     return_code = milc.cli()
+    profiler.phase('subcommand')
 
     if return_code is False:
         exit(1)
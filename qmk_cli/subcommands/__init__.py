@@ -1,8 +1,20 @@
 """QMK CLI Subcommands
 
 We list each subcommand here explicitly because all the reliable ways of searching for modules are slow and delay startup.
+
+Only the module for the subcommand being dispatched is imported, the rest are registered from a manifest. See qmk_cli.manifest for details.
 """
-from . import clone  # noqa: F401
-from . import console  # noqa: F401
-from . import env  # noqa: F401
-from . import setup  # noqa: F401
+from qmk_cli.manifest import register_subcommands
+
+SUBCOMMANDS = (
+    'batch',
+    'clone',
+    'console',
+    'daemon',
+    'env',
+    'mirror',
+    'run_parallel',
+    'setup',
+)
+
+register_subcommands(__name__, SUBCOMMANDS)
@@ -0,0 +1,48 @@
+"""Run many qmk commands from one warm process.
+"""
+import sys
+import time
+
+from milc import cli
+from qmk_cli.batch import BatchError, parse_batch, run_batch
+from qmk_cli.helpers import AbsPath
+
+
+@cli.argument('-j', '--jobs', arg_only=True, type=int, default=1, help='Number of commands to run at once. Default: 1')
+@cli.argument('file', arg_only=True, help='File to read commands from, one per line, or - to read them from stdin.')
+@cli.subcommand('Run many qmk commands from one warm process.')
+def batch(cli):
+    """Run every command in a batch file and report which ones failed.
+    """
+    try:
+        if cli.args.file == '-':
+            commands = parse_batch(sys.stdin)
+        else:
+            with open(AbsPath(cli.args.file), encoding='utf-8') as fd:
+                commands = parse_batch(fd)
+
+    except (OSError, BatchError) as e:
+        cli.log.error('Could not read %s: %s', cli.args.file, e)
+        return False
+
+    start = time.monotonic()
+    failed = []
+
+    def finished(command):
+        color = '{fg_red}' if command.returncode else '{fg_green}'
+        cli.echo('%s==>{fg_reset} %s (exit %d, %.1fs)', color, command, command.returncode, command.seconds)
+        sys.stdout.flush()
+        sys.stdout.buffer.write(command.output)
+        sys.stdout.flush()
+
+        if command.returncode:
+            failed.append(command)
+
+    run_batch(commands, cli.args.jobs, finished)
+
+    cli.log.info('Ran %d commands in %.1fs, %d failed.', len(commands), time.monotonic() - start, len(failed))
+
+    for command in failed:
+        cli.log.error('Line %d exited %d: %s', command.line_number, command.returncode, command)
+
+    return not failed
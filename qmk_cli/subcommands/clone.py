@@ -4,8 +4,8 @@ import os
 from pathlib import Path
 
 from milc import cli
-from qmk_cli.git import git_clone
-from qmk_cli.helpers import AbsPath
+from qmk_cli.git import clone_arguments, clone_options, git_clone, worktree_add, write_stats
+from qmk_cli.helpers import AbsPath, is_qmk_firmware
 
 default_repo = 'qmk_firmware'
 default_fork = 'qmk/' + default_repo
@@ -16,6 +16,8 @@ default_branch = 'master'
 @cli.argument('-b', '--branch', arg_only=True, default=default_branch, help='The branch to clone. Default: %s' % default_branch)
 @cli.argument('destination', arg_only=True, default=Path(os.environ['ORIG_CWD']) / default_repo, type=AbsPath, nargs='?', help='The directory to clone to. Default: (current directory)')
 @cli.argument('fork', arg_only=True, default=default_fork, nargs='?', help='The qmk_firmware fork to clone. Default: %s' % default_fork)
+@cli.argument('--worktree', arg_only=True, action='store_true', help='Add the fork as a worktree of your existing qmk_firmware (%s), sharing its objects instead of cloning.' % os.environ['QMK_HOME'])
+@clone_arguments
 @cli.subcommand('Clone a qmk_firmware fork.')
 def clone(cli):
     git_url = '/'.join((cli.args.baseurl, cli.args.fork))
@@ -25,4 +27,18 @@ def clone(cli):
         cli.log.error('Destination already exists: %s', cli.args.destination)
         exit(1)
 
-    return git_clone(git_url, cli.args.destination, cli.args.branch)
+    try:
+        if cli.args.worktree:
+            home = Path(os.environ['QMK_HOME'])
+            options = clone_options(cli.config.clone)
+
+            if not is_qmk_firmware(home):
+                cli.log.error('--worktree needs an existing qmk_firmware clone, but %s is not one.', home)
+                exit(1)
+
+            return worktree_add(home, cli.args.destination, git_url, cli.args.branch, options['depth'], options['shallow_submodules'], options['jobs'], options['mirror'])
+
+        return git_clone(git_url, cli.args.destination, cli.args.branch, **clone_options(cli.config.clone))
+
+    finally:
+        write_stats(cli.config.clone)
@@ -2,14 +2,25 @@
 
 cli implementation of https://www.pjrc.com/teensy/hid_listen.html
 """
-from functools import lru_cache
+import os
+import re
+from functools import lru_cache, partial
 from pathlib import Path
 from platform import platform
 from threading import Thread
-from time import sleep, strftime
+from time import monotonic, sleep
 
 from milc import cli
 from milc.questions import yesno
+from qmk_cli.console.descriptor import DescriptorCache
+from qmk_cli.console.filters import LineFilter, SelectorError, device_selected, parse_device_selectors
+from qmk_cli.console.hotplug import open_hotplug
+from qmk_cli.console.lines import REPORT_SIZE, LineAssembler
+from qmk_cli.console.output import FORMATS, MultiWriter, open_writer
+from qmk_cli.console.reader import ConsoleReader, open_pollable
+from qmk_cli.console.recording import DEVICE, Recorder, RecordingError, read_recording
+from qmk_cli.console.scheduler import ScanScheduler
+from qmk_cli.console.server import QUEUE_SIZE, FanoutServer, ServerAddressError
 
 LOG_COLOR = {
     'next': 0,
@@ -55,6 +66,10 @@ KNOWN_BOOTLOADERS = {
     ('314B', '0106'): 'apm32-dfu: APM32 DFU ISP Mode',
     ('342D', 'DFA0'): 'wb32-dfu: WB32 Device in DFU Mode',
 }
+CONSOLE_BACKENDS = ('hid', 'simulated')
+BOOTLOADER_IDS = frozenset((int(vid, 16), int(pid, 16)) for vid, pid in KNOWN_BOOTLOADERS)
+SCAN_INTERVAL = 0.1  # The fastest we scan for consoles
+BOOTLOADER_SCAN_INTERVAL = 0.5  # The fastest we scan for bootloaders, which is more expensive
 
 
 def install_deps():
@@ -76,10 +91,26 @@ def install_deps():
         return True
 
 
+def console_backend():
+    """Returns the name of the device backend to use, from QMK_CONSOLE_BACKEND.
+    """
+    backend = os.environ.get('QMK_CONSOLE_BACKEND', 'hid')
+
+    if backend not in CONSOLE_BACKENDS:
+        cli.log.error('Unknown QMK_CONSOLE_BACKEND %s, expected one of: %s', backend, ', '.join(CONSOLE_BACKENDS))
+        exit(1)
+
+    return backend
+
+
 @lru_cache(maxsize=0)
 def import_usb_core():
     """Attempts to import the usb.core module.
     """
+    if console_backend() == 'simulated':
+        from qmk_cli.console.simulated import simulated_usb_core
+        return simulated_usb_core()
+
     try:
         import usb.core
         return usb.core
@@ -96,7 +127,10 @@ def import_usb_core():
 def import_hid():
     """Attempts to import the hid module.
     """
-    import os
+    if console_backend() == 'simulated':
+        from qmk_cli.console.simulated import simulated_hid
+        return simulated_hid()
+
     old_cwd = os.getcwd()
     try:
         # macOS library search paths don't include homebrew by default when launched via a `uv`-based deployment.
@@ -124,112 +158,269 @@ def import_hid():
 
 
 class MonitorDevice(object):
-    def __init__(self, hid_device, numeric):
+    def __init__(self, hid_device, writer, threaded=False, report_size=REPORT_SIZE, recorder=None, line_filter=None):
         self.hid = import_hid()
         self.hid_device = hid_device
-        self.numeric = numeric
-        self.device = self.hid.Device(path=hid_device['path'])
-        self.current_line = ''
+        self.writer = writer
+        self.identity = writer.identity(hid_device)
+        self.recorder = recorder
+        self.line_filter = line_filter or None
+        self.report_size = report_size
+        self.connected = True
+        self.lines = LineAssembler()
+        self.device = None
+        self.fd = None if threaded else open_pollable(self.hid, hid_device['path'])
+
+        if self.fd is None:
+            self.device = self.hid.Device(path=hid_device['path'])
+
+        if recorder:
+            self.device_id = recorder.add_device(hid_device)
 
         cli.log.info('Console Connected: %(color)s%(manufacturer_string)s %(product_string)s{style_reset_all} (%(color)s%(vendor_id)04X:%(product_id)04X:%(index)d{style_reset_all})', hid_device)
 
-    def read(self, size, encoding='ascii', timeout=1):
-        """Read size bytes from the device.
+    def __str__(self):
+        return '%(manufacturer_string)s %(product_string)s (%(vendor_id)04X:%(product_id)04X:%(index)d)' % self.hid_device
+
+    @property
+    def pollable(self):
+        """True when this device is read by a ConsoleReader instead of its own thread.
         """
-        return self.device.read(size, timeout).decode(encoding)
+        return self.fd is not None
+
+    def fileno(self):
+        return self.fd
+
+    def close(self):
+        self.connected = False
+
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+        if self.device is not None:
+            self.device.close()
 
-    def read_line(self):
-        """Read from the device's console until we get a \n.
+    def read(self, size, timeout=1000):
+        """Read a report of up to size bytes from the device.
         """
-        while '\n' not in self.current_line:
-            self.current_line += self.read(32).replace('\x00', '')
+        report = self.device.read(size, timeout)
 
-        lines = self.current_line.split('\n', 1)
-        self.current_line = lines[1]
+        if self.recorder and report:
+            self.recorder.write(self.device_id, report)
+
+        return report
+
+    def read_lines(self):
+        """Read from the device's console until we have at least one complete line.
+        """
+        lines = []
+
+        while not lines:
+            lines = self.lines.feed(self.read(self.report_size))
+
+        return lines
+
+    def read_ready(self):
+        """Read every report waiting on our file descriptor and print any complete lines.
+
+        Returns False once the device has gone away.
+        """
+        report = bytearray(self.report_size)
+        view = memoryview(report)
+
+        while True:
+            try:
+                size = os.readv(self.fd, [report])
+            except BlockingIOError:
+                return True
+            except OSError:
+                return False
 
-        return lines[0]
+            if not size:
+                return False
+
+            if self.recorder:
+                self.recorder.write(self.device_id, view[:size])
+
+            for line in self.lines.feed(view[:size]):
+                self.print_line(line)
+
+    def print_line(self, text):
+        """Print a line received from the device.
+        """
+        if self.line_filter and not self.line_filter(text):
+            return
+
+        self.writer.write(self.identity, text)
 
     def run_forever(self):
         while True:
             try:
-                message = {**self.hid_device, 'text': self.read_line()}
-                identifier = (int2hex(message['vendor_id']), int2hex(message['product_id'])) if self.numeric else (message['manufacturer_string'], message['product_string'])
-                message['identifier'] = ':'.join(identifier)
-                message['ts'] = '{style_dim}{fg_green}%s{style_reset_all} ' % (strftime(cli.config.general.datetime_fmt),) if cli.args.timestamp else ''
+                for line in self.read_lines():
+                    self.print_line(line)
 
-                cli.echo('%s', '%(ts)s%(color)s%(identifier)s:%(index)d{style_reset_all}: %(text)s' % message)
+                self.flush()
 
             except self.hid.HIDException:
                 break
 
+        self.connected = False
+
+    def flush(self):
+        """Write out everything we've read so far.
+        """
+        self.writer.flush()
+
+        if self.recorder:
+            self.recorder.flush()
+
 
 class FindDevices(object):
-    def __init__(self, vid, pid, index, numeric):
+    def __init__(self, selectors, writer, threaded=False, report_size=REPORT_SIZE, recorder=None, wait=1, line_filter=None):
         self.hid = import_hid()
-        self.vid = vid
-        self.pid = pid
-        self.index = index
-        self.numeric = numeric
+        self.selectors = selectors
+        self.line_filter = line_filter
+        self.writer = writer
+        self.recorder = recorder
+        self.descriptors = DescriptorCache()
+        self.threaded = threaded
+        self.report_size = report_size
+        self.wait = wait
+        self.scheduler = ScanScheduler()
 
     def run_forever(self):
         """Process messages from our queue in a loop.
         """
         live_devices = {}
         live_bootloaders = {}
+        hotplug = open_hotplug()
+        reader = ConsoleReader(on_disconnect=hotplug.wake, on_batch=self.flush)
+        cli.log.debug('Waiting for devices using %s.', hotplug.name)
+
+        # Without hotplug events we poll, backing off to --wait. With them, scans are mostly triggered by events.
+        max_interval = max(self.wait, hotplug.interval) if hotplug.notifies else self.wait
+        self.scheduler.add('consoles', partial(self.update_devices, live_devices, reader, hotplug), SCAN_INTERVAL, max_interval)
+
+        if cli.args.bootloaders:
+            self.scheduler.add('bootloaders', partial(self.update_bootloaders, live_bootloaders), BOOTLOADER_SCAN_INTERVAL, max_interval)
 
         while True:
             try:
-                for device in list(live_devices):
-                    if not live_devices[device]['thread'].is_alive():
-                        cli.log.info('Console Disconnected: %(color)s%(manufacturer_string)s %(product_string)s{style_reset_all} (%(color)s%(vendor_id)04X:%(product_id)04X:%(index)d{style_reset_all})', live_devices[device])
-                        del live_devices[device]
-
-                for device in self.find_devices():
-                    if device['path'] not in live_devices:
-                        device['color'] = LOG_COLOR['colors'][LOG_COLOR['next']]
-                        LOG_COLOR['next'] = (LOG_COLOR['next'] + 1) % len(LOG_COLOR['colors'])
-                        live_devices[device['path']] = device
-
-                        try:
-                            monitor = MonitorDevice(device, self.numeric)
-                            device['thread'] = Thread(target=monitor.run_forever, daemon=True)
-
-                            device['thread'].start()
-                        except Exception as e:
-                            device['e'] = e
-                            device['e_name'] = e.__class__.__name__
-                            cli.log.error("Could not connect to %(color)s%(manufacturer_string)s %(product_string)s{style_reset_all} (%(color)s%(vendor_id)04X:%(product_id)04X:%(index)d{style_reset_all}): %(e_name)s: %(e)s", device)
-                            if cli.config.general.verbose:
-                                cli.log.exception(e)
-                            del live_devices[device['path']]
-
-                if cli.args.bootloaders:
-                    for device in self.find_bootloaders():
-                        if device.address in live_bootloaders:
-                            live_bootloaders[device.address]._qmk_found = True
-                        else:
-                            name = KNOWN_BOOTLOADERS[(int2hex(device.idVendor), int2hex(device.idProduct))]
-                            cli.log.info('Bootloader Connected: {style_bright}{fg_magenta}%s', name)
-                            device._qmk_found = True
-                            live_bootloaders[device.address] = device
-
-                    for device in list(live_bootloaders):
-                        if live_bootloaders[device]._qmk_found:
-                            live_bootloaders[device]._qmk_found = False
-                        else:
-                            name = KNOWN_BOOTLOADERS[(int2hex(live_bootloaders[device].idVendor), int2hex(live_bootloaders[device].idProduct))]
-                            cli.log.info('Bootloader Disconnected: {style_bright}{fg_magenta}%s', name)
-                            del live_bootloaders[device]
-
-                sleep(.1)
+                self.scheduler.run_due()
+                changed = hotplug.wait(self.scheduler.timeout())
+
+                if changed or not hotplug.notifies:
+                    self.descriptors.invalidate()
+
+                if changed:
+                    self.scheduler.wake()
 
             except KeyboardInterrupt:
                 break
 
+        hotplug.close()
+        self.writer.close()
+
+        if self.recorder:
+            self.recorder.close()
+
+    def flush(self):
+        """Write out everything our devices have read so far.
+        """
+        self.writer.flush()
+
+        if self.recorder:
+            self.recorder.flush()
+
+    def update_devices(self, live_devices, reader, hotplug):
+        """Rescan for consoles, connecting to new ones and forgetting the ones that have gone. Returns True if anything changed.
+        """
+        changed = False
+
+        for device in list(live_devices):
+            if not live_devices[device]['monitor'].connected:
+                cli.log.info('Console Disconnected: %(color)s%(manufacturer_string)s %(product_string)s{style_reset_all} (%(color)s%(vendor_id)04X:%(product_id)04X:%(index)d{style_reset_all})', live_devices[device])
+
+                if self.recorder:
+                    self.recorder.remove_device(live_devices[device]['monitor'].device_id)
+
+                del live_devices[device]
+                changed = True
+
+                # It may be about to reappear as a bootloader
+                self.scheduler.burst('bootloaders')
+
+        for device in self.find_devices():
+            if device['path'] not in live_devices:
+                device['color'] = next_color()
+                changed = True
+
+                if self.connect_device(device, reader, hotplug):
+                    live_devices[device['path']] = device
+
+        return changed
+
+    def update_bootloaders(self, live_bootloaders):
+        """Rescan for bootloaders, logging the ones that have come or gone since the last scan. Returns True if anything changed.
+        """
+        changed = False
+
+        for device in self.find_bootloaders():
+            if device.address in live_bootloaders:
+                live_bootloaders[device.address]._qmk_found = True
+            else:
+                name = KNOWN_BOOTLOADERS[(int2hex(device.idVendor), int2hex(device.idProduct))]
+                cli.log.info('Bootloader Connected: {style_bright}{fg_magenta}%s', name)
+                device._qmk_found = True
+                live_bootloaders[device.address] = device
+                changed = True
+
+        for device in list(live_bootloaders):
+            if live_bootloaders[device]._qmk_found:
+                live_bootloaders[device]._qmk_found = False
+            else:
+                name = KNOWN_BOOTLOADERS[(int2hex(live_bootloaders[device].idVendor), int2hex(live_bootloaders[device].idProduct))]
+                cli.log.info('Bootloader Disconnected: {style_bright}{fg_magenta}%s', name)
+                del live_bootloaders[device]
+                changed = True
+
+        return changed
+
+    def connect_device(self, device, reader, hotplug):
+        """Start reading from a newly found device. Returns False if we couldn't open it.
+        """
+        try:
+            device['monitor'] = MonitorDevice(device, self.writer, self.threaded, self.report_size, self.recorder, self.line_filter)
+
+            if device['monitor'].pollable:
+                reader.add(device['monitor'])
+            else:
+                Thread(target=self.monitor_device, args=(device['monitor'], hotplug), daemon=True).start()
+
+        except Exception as e:
+            device['e'] = e
+            device['e_name'] = e.__class__.__name__
+            cli.log.error("Could not connect to %(color)s%(manufacturer_string)s %(product_string)s{style_reset_all} (%(color)s%(vendor_id)04X:%(product_id)04X:%(index)d{style_reset_all}): %(e_name)s: %(e)s", device)
+            if cli.config.general.verbose:
+                cli.log.exception(e)
+
+            return False
+
+        return True
+
+    def monitor_device(self, monitor, hotplug):
+        """Thread target that reads from a device until it goes away, then wakes up the main loop so it notices right away.
+        """
+        try:
+            monitor.run_forever()
+        finally:
+            hotplug.wake()
+
     def is_bootloader(self, hid_device):
         """Returns true if the device in question matches a known bootloader vid/pid.
         """
-        return (int2hex(hid_device.idVendor), int2hex(hid_device.idProduct)) in KNOWN_BOOTLOADERS
+        return (hid_device.idVendor, hid_device.idProduct) in BOOTLOADER_IDS
 
     def is_console_hid(self, hid_device):
         """Returns true when the usage page indicates it's a teensy-style console.
@@ -239,36 +430,29 @@ class FindDevices(object):
     def is_filtered_device(self, hid_device):
         """Returns True if the device should be included in the list of available consoles.
         """
-        return int2hex(hid_device['vendor_id']) == self.vid and int2hex(hid_device['product_id']) == self.pid
+        return device_selected(self.selectors, hid_device)
 
     def find_devices_by_report(self, hid_devices):
-        """Returns a list of available teensy-style consoles by doing a brute-force search.
+        """Returns a list of available teensy-style consoles by parsing their report descriptors.
 
-        Some versions of linux don't report usage and usage_page. In that case we fallback to reading the report (possibly inaccurately) ourselves.
+        Some versions of linux don't report usage and usage_page. In that case we fallback to reading the report descriptor from sysfs ourselves.
         """
         devices = []
 
         for device in hid_devices:
-            path = device['path'].decode('utf-8')
-
-            if path.startswith('/dev/hidraw'):
-                number = path[11:]
-                report = Path(f'/sys/class/hidraw/hidraw{number}/device/report_descriptor')
-
-                if report.exists():
-                    rp = report.read_bytes()
+            path = os.fsdecode(device['path'])
 
-                    if rp[1] == 0x31 and rp[3] == 0x09:
-                        devices.append(device)
+            if path.startswith('/dev/hidraw') and self.descriptors.is_console(path[5:]):
+                devices.append(device)
 
         return devices
 
     def find_bootloaders(self):
         """Returns a list of available bootloader devices.
         """
-        import usb.core
+        usb_core = import_usb_core()
 
-        return list(filter(self.is_bootloader, usb.core.find(find_all=True)))
+        return list(usb_core.find(find_all=True, custom_match=self.is_bootloader))
 
     def find_devices(self):
         """Returns a list of available teensy-style consoles.
@@ -279,9 +463,6 @@ class FindDevices(object):
         if not devices:
             devices = self.find_devices_by_report(hid_devices)
 
-        if self.vid and self.pid:
-            devices = list(filter(self.is_filtered_device, devices))
-
         # Add index numbers
         device_index = {}
         for device in devices:
@@ -293,6 +474,9 @@ class FindDevices(object):
             device_index[id] += 1
             device['index'] = device_index[id]
 
+        if self.selectors:
+            devices = list(filter(self.is_filtered_device, devices))
+
         return devices
 
 
@@ -302,6 +486,51 @@ def int2hex(number):
     return "%04X" % number
 
 
+def next_color():
+    """Returns the color for the next device we show.
+    """
+    color = LOG_COLOR['colors'][LOG_COLOR['next']]
+    LOG_COLOR['next'] = (LOG_COLOR['next'] + 1) % len(LOG_COLOR['colors'])
+
+    return color
+
+
+def replay(path, writer, speed=1.0, selectors=None, line_filter=None):
+    """Replay a recording through writer. A speed of 0 replays as fast as possible.
+    """
+    devices = {}
+    started = None
+
+    for record_type, device_id, timestamp, payload in read_recording(path):
+        if record_type == DEVICE:
+            if device_selected(selectors, payload):
+                payload['color'] = next_color()
+                devices[device_id] = (writer.identity(payload), LineAssembler())
+
+            continue
+
+        if device_id not in devices:
+            continue
+
+        if speed:
+            if started is None:
+                started = (monotonic(), timestamp)
+
+            delay = (timestamp - started[1]) / 1000000000 / speed - (monotonic() - started[0])
+
+            if delay > 0:
+                writer.flush()
+                sleep(delay)
+
+        identity, lines = devices[device_id]
+
+        for line in lines.feed(payload):
+            if not line_filter or line_filter(line):
+                writer.write(identity, line, timestamp / 1000000000)
+
+    writer.close()
+
+
 def list_devices(device_finder):
     """Show the user a nicely formatted list of devices.
     """
@@ -310,8 +539,7 @@ def list_devices(device_finder):
     if devices:
         cli.log.info('Available devices:')
         for dev in devices:
-            color = LOG_COLOR['colors'][LOG_COLOR['next']]
-            LOG_COLOR['next'] = (LOG_COLOR['next'] + 1) % len(LOG_COLOR['colors'])
+            color = next_color()
             cli.log.info("\t%s%s:%s:%d{style_reset_all}\t%s %s", color, int2hex(dev['vendor_id']), int2hex(dev['product_id']), dev['index'], dev['manufacturer_string'], dev['product_string'])
 
     if cli.args.bootloaders:
@@ -325,50 +553,82 @@ def list_devices(device_finder):
 
 
 @cli.argument('--bootloaders', arg_only=True, default=True, action='store_boolean', help='displaying bootloaders.')
-@cli.argument('-d', '--device', help='Device to select - uses format <pid>:<vid>[:<index>].')
+@cli.argument('-d', '--device', help='Devices to select, comma separated. Each is <vid>:<pid>[:<index>] (wildcards allowed) or manufacturer=, product= or serial=<pattern>.')
+@cli.argument('--exclude', arg_only=True, action='append', default=[], help='Hide lines matching this regular expression. May be passed multiple times.')
+@cli.argument('-f', '--format', arg_only=True, default='pretty', choices=FORMATS, help='Output format. json and jsonl include a timestamp and the device for every line (Default: pretty)')
+@cli.argument('-g', '--grep', arg_only=True, action='append', default=[], help='Only show lines matching this regular expression. May be passed multiple times.')
 @cli.argument('-l', '--list', arg_only=True, action='store_true', help='List available hid_listen devices.')
 @cli.argument('-n', '--numeric', arg_only=True, action='store_true', help='Show VID/PID instead of names.')
+@cli.argument('--record', arg_only=True, type=Path, help='Save every report received to this file, which can be viewed later with --replay.')
+@cli.argument('--record-max-size', arg_only=True, type=int, default=64, help='Start a new recording file when the current one reaches this many MiB (Default: 64)')
+@cli.argument('--record-keep', arg_only=True, type=int, default=5, help='How many old recording files to keep (Default: 5)')
+@cli.argument('--replay', arg_only=True, type=Path, help='Show a recording made with --record instead of reading from devices.')
+@cli.argument('--replay-speed', arg_only=True, type=float, default=1.0, help='Replay this many times faster than real time, 0 for as fast as possible (Default: 1)')
+@cli.argument('--report-size', arg_only=True, type=int, default=REPORT_SIZE, help='Size of the console reports to read (Default: %d)' % REPORT_SIZE)
+@cli.argument('--threaded', arg_only=True, action='store_true', help='Read each device from its own thread instead of a single select() loop.')
+@cli.argument('--serve', arg_only=True, help='Also send output to every client connected to this address, unix:/path/to/socket or tcp:host:port.')
+@cli.argument('--serve-format', arg_only=True, default='jsonl', choices=[f for f in FORMATS if f != 'json'], help='Output format for --serve clients (Default: jsonl)')
+@cli.argument('--serve-queue', arg_only=True, type=int, default=QUEUE_SIZE // 1024, help='KiB of output to hold for a slow --serve client before dropping lines (Default: %d)' % (QUEUE_SIZE//1024))
 @cli.argument('-t', '--timestamp', arg_only=True, action='store_true', help='Print the timestamp for received messages as well.')
-@cli.argument('-w', '--wait', type=int, default=1, help="How many seconds to wait between checks (Default: 1)")
+@cli.argument('-w', '--wait', type=float, default=1, help="How many seconds to wait between checks when nothing is changing (Default: 1)")
 @cli.subcommand('Acquire debugging information from usb hid devices.')
 def console(cli):
     """Acquire debugging information from usb hid devices
     """
-    vid = None
-    pid = None
-    index = 1
+    try:
+        selectors = parse_device_selectors(cli.config.console.device or '')
+        line_filter = LineFilter(cli.args.grep, cli.args.exclude)
 
-    if cli.config.console.device:
-        device = cli.config.console.device.split(':')
+    except SelectorError as e:
+        cli.log.error('%s', e)
+        cli.print_help()
+        exit(1)
 
-        if len(device) == 2:
-            vid, pid = device
+    except re.error as e:
+        cli.log.error('Invalid regular expression: %s', e)
+        exit(1)
 
-        elif len(device) == 3:
-            vid, pid, index = device
+    if cli.args.serve and (cli.args.list or cli.args.replay):
+        cli.log.error('--serve cannot be used with %s.', '--list' if cli.args.list else '--replay')
+        return False
 
-            if not index.isdigit():
-                cli.log.error('Device index must be a number! Got "%s" instead.', index)
-                exit(1)
+    writer = open_writer(cli.args.format, cli.args.numeric, cli.args.timestamp, cli.config.general.datetime_fmt, cli.config.general.color)
 
-            index = int(index)
+    if cli.args.replay:
+        try:
+            return replay(cli.args.replay, writer, cli.args.replay_speed, selectors, line_filter)
 
-            if index < 1:
-                cli.log.error('Device index must be greater than 0! Got %s', index)
-                exit(1)
+        except (OSError, RecordingError) as e:
+            cli.log.error('Could not replay %s: %s', cli.args.replay, e)
+            return False
 
-        else:
-            cli.log.error('Invalid format for device, expected "<pid>:<vid>[:<index>]" but got "%s".', cli.config.console.device)
-            cli.print_help()
+        except KeyboardInterrupt:
+            writer.close()
+            return
+
+    server = None
+
+    if cli.args.serve:
+        try:
+            server = FanoutServer(cli.args.serve, cli.args.serve_queue * 1024)
+        except (OSError, ServerAddressError) as e:
+            cli.log.error('Could not serve on %s: %s', cli.args.serve, e)
             exit(1)
 
-        vid = vid.upper()
-        pid = pid.upper()
+        cli.log.info('Serving console output on %s', cli.args.serve)
+        server_writer = open_writer(cli.args.serve_format, cli.args.numeric, cli.args.timestamp, cli.config.general.datetime_fmt, False, server)
+        writer = MultiWriter([writer, server_writer])
 
-    device_finder = FindDevices(vid, pid, index, cli.args.numeric)
+    recorder = Recorder(cli.args.record, cli.args.record_max_size * 1024 * 1024, cli.args.record_keep) if cli.args.record else None
+    device_finder = FindDevices(selectors, writer, cli.args.threaded, cli.args.report_size, recorder, float(cli.config.console.wait), line_filter)
 
     if cli.args.list:
         return list_devices(device_finder)
 
-    print('Looking for devices...', flush=True)
-    device_finder.run_forever()
+    cli.log.info('Looking for devices...')
+
+    try:
+        device_finder.run_forever()
+    finally:
+        if server:
+            server.close()
@@ -0,0 +1,35 @@
+"""Keep a warm qmk process running to speed up later invocations.
+"""
+from milc import cli
+from qmk_cli.daemon import DaemonError, connect, serve, socket_path, stop
+
+
+@cli.argument('--status', arg_only=True, action='store_true', help='Report whether the daemon is running.')
+@cli.argument('--stop', arg_only=True, action='store_true', help='Stop the running daemon.')
+@cli.subcommand('Keep a warm qmk process running to speed up later invocations.')
+def daemon(cli):
+    """Run the qmk daemon in the foreground.
+
+    While it is running every `qmk` command run by this user is handed off to it. Set QMK_NO_DAEMON to run a command in its own process anyway.
+    """
+    try:
+        if cli.args.status:
+            sock = connect()
+
+            if sock:
+                sock.close()
+                cli.log.info('qmk daemon is running on %s', socket_path())
+                return True
+
+            cli.log.info('qmk daemon is not running.')
+            return False
+
+        if cli.args.stop:
+            cli.log.info('Stopped qmk daemon (pid %s).', stop())
+            return True
+
+        serve(cli.log)
+
+    except DaemonError as e:
+        cli.log.error(str(e))
+        return False
@@ -1,13 +1,47 @@
 """Prints environment information.
 """
+import json
 import os
+import shlex
 from pathlib import Path
 
 from milc import cli
 from qmk_cli.helpers import is_qmk_firmware, is_qmk_userspace
 
+ENV_FORMATS = ('sh', 'fish', 'json', 'make')
 
-@cli.argument('var', arg_only=True, default=None, nargs='?', help='Optional variable to query')
+
+def fish_quote(value):
+    """Quote value for the fish shell, which doesn't treat backslashes in single quotes the way POSIX shells do.
+    """
+    return "'" + value.replace('\\', '\\\\').replace("'", "\\'") + "'"
+
+
+def make_escape(value):
+    """Escape value for the right hand side of a make variable assignment.
+    """
+    return value.replace('$', '$$').replace('#', '\\#')
+
+
+def format_env(data, env_format):
+    """Returns data formatted so it can be eval'd by a shell, or included in a Makefile.
+    """
+    if env_format == 'json':
+        return json.dumps(data, indent=4)
+
+    data = {key: '' if val is None else str(val) for key, val in data.items()}
+
+    if env_format == 'fish':
+        return '\n'.join(f'set -gx {key} {fish_quote(val)};' for key, val in data.items())
+
+    if env_format == 'make':
+        return '\n'.join(f'{key} := {make_escape(val)}' for key, val in data.items())
+
+    return '\n'.join(f'export {key}={shlex.quote(val)}' for key, val in data.items())
+
+
+@cli.argument('-f', '--format', arg_only=True, choices=ENV_FORMATS, help='Print variables in a format that can be eval\'d by sh or fish, loaded as json, or included in a Makefile.')
+@cli.argument('var', arg_only=True, nargs='*', help='Optional variables to query')
 @cli.subcommand('Prints environment information.')
 def env(cli):
     home = os.environ.get('QMK_HOME', "")
@@ -25,9 +59,23 @@ def env(cli):
         converted_key = 'QMK_' + key.upper()
         data[converted_key] = val
 
+    unknown = [var for var in cli.args.var if var not in data]
+
+    if unknown:
+        cli.log.error('Unknown variable(s): %s', ', '.join(unknown))
+        return False
+
     if cli.args.var:
-        # dump out requested arg
-        print(data[cli.args.var])
+        data = {var: data[var] for var in cli.args.var}
+
+    if cli.args.format:
+        print(format_env(data, cli.args.format))
+
+    elif cli.args.var:
+        # dump out requested args, one per line
+        for var in cli.args.var:
+            print(data[var])
+
     else:
         # dump out everything
         for key, val in data.items():
@@ -0,0 +1,60 @@
+"""Manage the local mirrors used by `qmk clone --mirror` and `qmk setup --mirror`.
+"""
+import time
+
+from milc import cli
+from qmk_cli.git import fetch_jobs
+from qmk_cli.mirror import MIRROR_DIR, list_mirrors, prune_mirrors, refresh_mirrors
+from qmk_cli.progress import stats
+
+
+@cli.argument('--stats', arg_only=True, help='refresh: Write a JSON summary of how long each git phase took for each mirror to this file, or - for stdout.')
+@cli.argument('--days', arg_only=True, type=int, default=30, help='prune: Remove mirrors that have not been used for this many days, 0 to remove them all. Default: 30')
+@cli.argument('-j', '--jobs', arg_only=True, type=int, default=fetch_jobs(), help='refresh: Number of mirrors to fetch in parallel. Default: %d' % fetch_jobs())
+@cli.argument('urls', arg_only=True, nargs='*', help='refresh: Mirror these repositories and their submodules too, such as https://github.com/qmk/qmk_firmware')
+@cli.argument('action', arg_only=True, nargs='?', default='list', choices=['list', 'refresh', 'prune'], help='What to do. Default: list')
+@cli.subcommand('Manage the local mirrors used by `qmk clone --mirror`.')
+def mirror(cli):
+    """List, refresh or prune the mirror cache.
+    """
+    if cli.args.urls and cli.args.action != 'refresh':
+        cli.log.error('Repository URLs can only be given to `qmk mirror refresh`.')
+        return False
+
+    if cli.args.action == 'refresh':
+        urls = [mirror['url'] for mirror in list_mirrors() if mirror['url']]
+        urls.extend(url for url in cli.args.urls if url not in urls)
+
+        if not urls:
+            cli.log.info('No mirrors to refresh. Give a repository URL to create one.')
+            return True
+
+        failed = refresh_mirrors(urls, cli.args.jobs)
+
+        if cli.args.stats:
+            stats.write(cli.args.stats)
+
+        if failed:
+            cli.log.error('Could not refresh %d mirror(s).', failed)
+            return False
+
+        return True
+
+    if cli.args.action == 'prune':
+        removed = prune_mirrors(cli.args.days)
+        cli.log.info('Removed %d mirror(s), freeing %.1f MiB.', len(removed), sum(mirror['size'] for mirror in removed) / 1048576)
+        return True
+
+    mirrors = list_mirrors()
+
+    if not mirrors:
+        cli.log.info('No mirrors in %s', MIRROR_DIR)
+        return True
+
+    for mirror in mirrors:
+        last_used = time.strftime('%Y-%m-%d %H:%M', time.localtime(mirror['last_used']))
+        cli.echo('{fg_cyan}%s{fg_reset}  %8.1f MiB  last used %s  %s', mirror['url'] or '(unknown)', mirror['size'] / 1048576, last_used, mirror['path'])
+
+    cli.echo('%d mirror(s), %.1f MiB total in %s', len(mirrors), sum(mirror['size'] for mirror in mirrors) / 1048576, MIRROR_DIR)
+
+    return True
@@ -0,0 +1,72 @@
+"""Run several external commands at once.
+"""
+import os
+import shlex
+import sys
+
+from milc import cli
+from qmk_cli.helpers import AbsPath
+from qmk_cli.jobs import JobRunner
+
+
+def read_commands(lines):
+    """Returns the command from each line, skipping blank lines and comments.
+    """
+    commands = []
+
+    for line in lines:
+        command = shlex.split(line, comments=True)
+
+        if command:
+            commands.append(command)
+
+    return commands
+
+
+@cli.argument('-j', '--jobs', arg_only=True, type=int, default=0, help='Number of commands to run at once. Default: the number of CPUs')
+@cli.argument('-f', '--file', arg_only=True, help='File to read commands from, one per line, or - to read them from stdin.')
+@cli.argument('--fail-fast', arg_only=True, action='store_true', help='Stop every command still running when one fails.')
+@cli.argument('--stream', arg_only=True, action='store_true', help='Show output as it arrives, prefixed with the command, instead of all at once when each command finishes.')
+@cli.argument('commands', arg_only=True, nargs='*', help='Commands to run. Quote each one so it is a single argument.')
+@cli.subcommand('Run several external commands at once.')
+def run_parallel(cli):
+    """Run every command given on the command line or in a file and report which ones failed.
+    """
+    try:
+        commands = read_commands(cli.args.commands)
+
+        if cli.args.file == '-':
+            commands += read_commands(sys.stdin)
+        elif cli.args.file:
+            with open(AbsPath(cli.args.file), encoding='utf-8') as fd:
+                commands += read_commands(fd)
+
+    except (OSError, ValueError) as e:
+        cli.log.error('Could not read commands: %s', e)
+        return False
+
+    if not commands:
+        cli.log.error('No commands to run!')
+        cli.print_help()
+        return False
+
+    def finished(job):
+        if cli.args.stream:
+            return
+
+        color = '{fg_green}' if job.status == 'ok' else '{fg_red}'
+        cli.echo('%s==>{fg_reset} %s (%s, %.1fs)', color, job, job.status, job.seconds)
+        sys.stdout.flush()
+        sys.stdout.buffer.write(job.output)
+        sys.stdout.flush()
+
+    runner = JobRunner(cli.args.jobs, capture=not cli.args.stream, fail_fast=cli.args.fail_fast, finished=finished)
+    cwd = os.environ.get('ORIG_CWD')
+
+    for command in commands:
+        runner.submit(command, cwd=cwd)
+
+    success = runner.run()
+    runner.log_summary()
+
+    return success
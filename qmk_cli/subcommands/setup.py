@@ -2,13 +2,12 @@
 """
 import os
 import shlex
-import subprocess
 import sys
 from pathlib import Path
 
 from milc import cli
 from milc.questions import choice, question, yesno
-from qmk_cli.git import git_clone
+from qmk_cli.git import clone_arguments, clone_options, fetch_branch, git_clone, git_output, lost_commits, run_git, switch_fork, update_checkout, write_stats
 from qmk_cli.helpers import AbsPath, is_qmk_firmware, rmtree
 
 default_base = 'https://github.com'
@@ -21,26 +20,12 @@ def git_upstream(destination):
     """Add the qmk/qmk_firmware upstream to a qmk_firmware clone.
     """
     git_url = '/'.join((cli.args.baseurl, default_fork))
-    git_cmd = [
-        'git',
-        '-C',
-        destination,
-        'remote',
-        'add',
-        'upstream',
-        git_url,
-    ]
-
-    with subprocess.Popen(git_cmd, stderr=subprocess.STDOUT, stdout=subprocess.PIPE, bufsize=1, universal_newlines=True, encoding='utf-8') as p:
-        for line in p.stdout:
-            print(line, end='')
 
-    if p.returncode == 0:
+    if run_git(['remote', 'add', 'upstream', git_url], cwd=destination):
         cli.log.info('Added %s as remote upstream.', git_url)
         return True
-    else:
-        cli.log.error('%s exited %d', ' '.join(git_cmd), p.returncode)
-        return False
+
+    return False
 
 
 def git_clone_fork(fork, branch, force=False):
@@ -48,18 +33,84 @@ def git_clone_fork(fork, branch, force=False):
         rmtree(cli.args.home)
 
     git_url = '/'.join((cli.args.baseurl, fork))
-    if git_clone(git_url, cli.args.home, branch):
+    if git_clone(git_url, cli.args.home, branch, **clone_options(cli.config.setup)):
         git_upstream(cli.args.home)
     else:
         exit(1)
 
 
+def git_switch_fork(fork, branch):
+    """Switch the existing qmk_firmware clone to another fork or branch once the user has confirmed what will be lost, falling back to deleting and recloning it.
+    """
+    git_url = '/'.join((cli.args.baseurl, fork))
+    options = clone_options(cli.config.setup)
+    ref = fetch_branch(cli.args.home, git_url, branch, options['depth'])
+
+    if ref:
+        lost = lost_commits(cli.args.home, branch, ref)
+
+        if lost is None:
+            cli.log.error('Could not tell which commits switching to %s %s would discard, not switching.', fork, branch)
+            exit(1)
+
+        if lost:
+            cli.log.warning('%d commit(s) on your %s branch are not in %s %s and will be lost:', len(lost), branch, fork, branch)
+
+            for commit in lost:
+                cli.log.warning('    %s', commit)
+
+        discarded = f'uncommitted changes to tracked files and the {len(lost)} commit(s) listed above' if lost else 'uncommitted changes to tracked files'
+
+        if not yesno(f'WARNING: This will reset the {branch} branch of {cli.args.home} to {fork} {branch}, discarding {discarded}. Untracked files are kept. Proceed?', default=False):
+            exit(1)
+
+        if switch_fork(cli.args.home, ref, branch, options['shallow_submodules'], options['jobs'], options['mirror']):
+            if 'upstream' not in (git_output(['remote'], cwd=cli.args.home) or '').split():
+                git_upstream(cli.args.home)
+
+            return
+
+    if yesno('Could not switch to %s. Delete your qmk_firmware directory and clone it again instead?' % fork, default=False):
+        git_clone_fork(fork, branch, force=True)
+
+    else:
+        exit(1)
+
+
+def found_qmk_firmware():
+    """Ask the user what to do with the qmk_firmware clone we found.
+    """
+    found_prompt = "What do you want to do?"
+    found_options = [
+        "Update it",
+        f"Reset to a clean copy of {cli.args.fork}",
+        "Switch to a different fork or branch",
+        "Keep it and continue",
+    ]
+
+    found_action = choice(found_prompt, options=found_options, default=3)
+    if found_action == "Update it":
+        options = clone_options(cli.config.setup)
+
+        if not update_checkout(cli.args.home, options['shallow_submodules'], options['jobs'], options['mirror']):
+            exit(1)
+
+    elif found_action == f"Reset to a clean copy of {cli.args.fork}":
+        git_switch_fork(cli.args.fork, cli.args.branch)
+
+    elif found_action == "Switch to a different fork or branch":
+        fork_name = question("Enter the name of the fork:", default=cli.args.fork)
+        branch_name = question("Enter the branch name to switch to:", default=cli.args.branch)
+        git_switch_fork(fork_name, branch_name)
+
+
 @cli.argument('-n', '--no', arg_only=True, action='store_true', help='Answer no to all questions')
 @cli.argument('-y', '--yes', arg_only=True, action='store_true', help='Answer yes to all questions')
 @cli.argument('--baseurl', arg_only=True, default=default_base, help='The URL all git operations start from. Default: %s' % default_base)
 @cli.argument('-b', '--branch', arg_only=True, default=default_branch, help='The branch to clone. Default: %s' % default_branch)
 @cli.argument('-H', '--home', arg_only=True, default=Path(os.environ['QMK_HOME']), type=AbsPath, help='The location for QMK Firmware. Default: %s' % os.environ['QMK_HOME'])
 @cli.argument('fork', arg_only=True, default=default_fork, nargs='?', help='The qmk_firmware fork to clone. Default: %s' % default_fork)
+@clone_arguments
 @cli.subcommand('Setup your computer for qmk_firmware.')
 def setup(cli):
     """Guide the user through setting up their QMK environment.
@@ -75,48 +126,30 @@ def setup(cli):
     # Check on qmk_firmware
     # If it exists, ask the user what to do with it
     # If it doesn't exist, offer to check it out
-    if is_qmk_firmware(cli.args.home):
-        cli.log.info('Found qmk_firmware at %s.', str(cli.args.home))
-        found_prompt = "What do you want to do?"
-        found_options = [
-            f"Delete and reclone {cli.args.fork}",
-            "Delete and clone a different fork",
-            "Keep it and continue",
-        ]
-        delete_confirm = "WARNING: This will delete your current qmk_firmware directory. Proceed?"
-
-        found_action = choice(found_prompt, options=found_options, default=2)
-        if found_action == f"Delete and reclone {cli.args.fork}":
-            if not yesno(delete_confirm, default=False):
-                exit(1)
-
-            git_clone_fork(cli.args.fork, cli.args.branch, force=True)
-
-        elif found_action == "Delete and clone a different fork":
-            fork_name = question("Enter the name of the fork:", default=cli.args.fork)
-            branch_name = question("Enter the branch name to clone:", default=cli.args.branch)
+    try:
+        if is_qmk_firmware(cli.args.home):
+            cli.log.info('Found qmk_firmware at %s.', str(cli.args.home))
+            found_qmk_firmware()
 
-            if not yesno(delete_confirm, default=False):
-                exit(1)
+        # Exists (but not an empty dir)
+        elif cli.args.home.exists() and any(cli.args.home.iterdir()):
+            path_str = str(cli.args.home)
 
-            git_clone_fork(fork_name, branch_name, force=True)
+            if cli.args.home.name != 'qmk_firmware':
+                cli.log.warning('Warning: %s does not end in "qmk_firmware". Did you mean to use "--home %s/qmk_firmware"?' % (path_str, path_str))
 
-    # Exists (but not an empty dir)
-    elif cli.args.home.exists() and any(cli.args.home.iterdir()):
-        path_str = str(cli.args.home)
+            cli.log.error("Path '%s' exists but is not a qmk_firmware clone!", path_str)
+            exit(1)
 
-        if cli.args.home.name != 'qmk_firmware':
-            cli.log.warning('Warning: %s does not end in "qmk_firmware". Did you mean to use "--home %s/qmk_firmware"?' % (path_str, path_str))
-
-        cli.log.error("Path '%s' exists but is not a qmk_firmware clone!", path_str)
-        exit(1)
-
-    else:
-        cli.log.error('Could not find qmk_firmware!')
-        if yesno(clone_prompt):
-            git_clone_fork(cli.args.fork, cli.args.branch)
         else:
-            cli.log.warning('Not cloning qmk_firmware due to user input or --no flag.')
+            cli.log.error('Could not find qmk_firmware!')
+            if yesno(clone_prompt):
+                git_clone_fork(cli.args.fork, cli.args.branch)
+            else:
+                cli.log.warning('Not cloning qmk_firmware due to user input or --no flag.')
+
+    finally:
+        write_stats(cli.config.setup)
 
     # Offer to set `user.qmk_home` for them.
     if str(cli.args.home) != os.environ['QMK_HOME'] and yesno(home_prompt):
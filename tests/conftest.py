@@ -0,0 +1,18 @@
+"""Shared setup for the qmk_cli tests.
+
+Some modules read their environment when they are imported, so this has to run before any of them are.
+"""
+import os
+import sys
+from pathlib import Path
+from tempfile import mkdtemp
+
+REPO = Path(__file__).resolve().parent.parent
+TMPDIR = Path(mkdtemp(prefix='qmk_cli_tests.'))
+
+sys.path.insert(0, str(REPO))
+os.environ['QMK_CACHE_DIR'] = str(TMPDIR / 'cache')
+os.environ['QMK_HOME'] = str(TMPDIR / 'qmk_firmware')
+os.environ['ORIG_CWD'] = str(TMPDIR)
+os.environ['QMK_EAGER_SUBCOMMANDS'] = '1'
+os.environ['QMK_NO_DAEMON'] = '1'
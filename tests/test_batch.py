@@ -0,0 +1,47 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from qmk_cli.batch import BatchError, parse_batch
+
+REPO = Path(__file__).resolve().parent.parent
+
+
+def test_parse_batch():
+    commands = parse_batch(['# A comment\n', '\n', 'qmk env QMK_HOME  # trailing\n', "env -f json 'QMK HOME'\n"])
+
+    assert [(command.line_number, command.argv) for command in commands] == [(3, ['env', 'QMK_HOME']), (4, ['env', '-f', 'json', 'QMK HOME'])]
+    assert str(commands[1]) == "qmk env -f json 'QMK HOME'"
+
+
+def test_parse_batch_error():
+    with pytest.raises(BatchError, match='Line 2'):
+        parse_batch(['env\n', 'env "unterminated\n'])
+
+
+def qmk(*args, stdin=None):
+    """Run qmk in its own process with stderr merged into stdout. Returns the CompletedProcess.
+    """
+    env = {**os.environ, 'PYTHONPATH': str(REPO)}
+
+    return subprocess.run([sys.executable, '-m', 'qmk_cli', *args], env=env, input=stdin, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=60)
+
+
+def test_batch_output_matches():
+    batch = qmk('batch', '-j', '2', '-', stdin=b'env NOPE\nqmk env -f json QMK_HOME\n')
+
+    assert batch.returncode == 1
+    assert b'\x1b[' not in batch.stdout
+
+    for argv, returncode in ((['env', 'NOPE'], 1), (['env', '-f', 'json', 'QMK_HOME'], 0)):
+        command = qmk(*argv)
+        header = f'==> qmk {" ".join(argv)} (exit {returncode}, '.encode()
+
+        assert command.returncode == returncode
+        assert batch.stdout.count(header) == 1
+        assert batch.stdout.split(header, 1)[1].split(b'\n', 1)[1].startswith(command.stdout)
+
+    assert b'Line 1 exited 1: qmk env NOPE' in batch.stdout
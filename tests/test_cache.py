@@ -0,0 +1,108 @@
+import json
+import os
+
+import pytest
+
+from qmk_cli import cache, helpers
+from qmk_cli.cache import fingerprint, read_cache, write_cache
+from qmk_cli.helpers import USERSPACE_MARKERS, cached_discovery, find_upwards, is_qmk_userspace
+
+
+def test_fingerprint(tmp_path):
+    path = tmp_path / 'file'
+
+    assert fingerprint(path) is None
+
+    path.write_text('one')
+    first = fingerprint(path)
+    assert first == fingerprint(path)
+
+    path.write_text('three')
+    assert fingerprint(path) != first
+
+    # Same size, different modification time
+    second = fingerprint(path)
+    os.utime(path, ns=(second[1] - 10**9, second[1] - 10**9))
+    assert fingerprint(path) != second
+
+
+def test_read_and_write(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, 'CACHE_DIR', tmp_path / 'cache')
+
+    assert read_cache('test.json') is None
+    assert write_cache('test.json', {'key': [1, 2]})
+    assert read_cache('test.json') == {'key': [1, 2]}
+    assert os.listdir(tmp_path / 'cache') == ['test.json']
+
+
+def test_unreadable_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, 'CACHE_DIR', tmp_path)
+    (tmp_path / 'test.json').write_text('{"truncated": ')
+
+    assert read_cache('test.json') is None
+
+
+def test_unwritable_cache(tmp_path, monkeypatch):
+    (tmp_path / 'file').write_text('')
+    monkeypatch.setattr(cache, 'CACHE_DIR', tmp_path / 'file' / 'cache')
+
+    assert not write_cache('test.json', {})
+
+
+@pytest.fixture
+def discover(tmp_path, monkeypatch):
+    """Returns a function that finds qmk_userspace through the discovery cache, and the list of searches that weren't answered by it.
+    """
+    monkeypatch.setattr(cache, 'CACHE_DIR', tmp_path / 'cache')
+    monkeypatch.setattr(helpers, 'DISCOVERY_RACY_NS', 0)
+    monkeypatch.delenv('QMK_NO_DISCOVERY_CACHE', raising=False)
+    searches = []
+
+    def find(watched):
+        searches.append(watched)
+        return find_upwards(is_qmk_userspace, USERSPACE_MARKERS, watched)
+
+    def discover():
+        helpers._discovery_cache.cache_clear()
+        return cached_discovery('test', 'QMK_TEST', None, find)
+
+    yield discover, searches
+
+    helpers._discovery_cache.cache_clear()
+
+
+def test_discovery_cache(tmp_path, monkeypatch, discover):
+    discover, searches = discover
+    userspace = tmp_path / 'userspace'
+    cwd = userspace / 'a' / 'b'
+    cwd.mkdir(parents=True)
+    (userspace / 'qmk.json').write_text(json.dumps({'userspace_version': '1.0'}))
+    monkeypatch.chdir(cwd)
+
+    assert discover() == userspace
+    assert discover() == userspace
+    assert len(searches) == 1
+
+    # Only the directories up to the result and the markers of the result are checked, not every marker we looked for
+    assert [str(path) for path in searches[0]] == [str(cwd), str(cwd.parent), str(userspace), str(userspace / 'qmk.json')]
+
+    # Editing qmk.json, or creating one closer to the cwd, is noticed
+    (userspace / 'qmk.json').write_text(json.dumps({'userspace_version': '1.0', 'build_targets': []}))
+    assert discover() == userspace
+    assert len(searches) == 2
+
+    (cwd / 'qmk.json').write_text(json.dumps({'userspace_version': '1.0'}))
+    assert discover() == cwd
+    assert discover() == cwd
+    assert len(searches) == 3
+
+
+def test_discovery_cache_racy(tmp_path, monkeypatch, discover):
+    discover, searches = discover
+    (tmp_path / 'qmk.json').write_text(json.dumps({'userspace_version': '1.0'}))
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(helpers, 'DISCOVERY_RACY_NS', 60 * 10**9)
+
+    # A result that depends on something modified within DISCOVERY_RACY_NS is not stored
+    assert discover() == discover() == tmp_path
+    assert len(searches) == 2
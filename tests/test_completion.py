@@ -0,0 +1,121 @@
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+from argcomplete.completers import ChoicesCompleter
+
+from qmk_cli.completion import COMPLETION_INDEX, CommandLine, DynamicCompletionError, _describe_parser, git_head
+
+REPO = Path(__file__).resolve().parent.parent
+needs_git = pytest.mark.skipif(not shutil.which('git'), reason='needs git')
+
+
+def git(cwd, *args):
+    return subprocess.run(['git', '-c', 'user.name=qmk', '-c', 'user.email=qmk@example.com', '-c', 'init.defaultBranch=master', *args], cwd=cwd, check=True, capture_output=True, encoding='utf-8').stdout.strip()
+
+
+@pytest.fixture
+def index():
+    parser = argparse.ArgumentParser(prog='qmk')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Make the logging more verbose')
+    parser.add_argument('--level', choices=['debug', 'info'], help='Log level')
+    subparsers = parser.add_subparsers()
+    console = subparsers.add_parser('console', help='Acts like the QMK console')
+    console.add_argument('-f', '--format', choices=['text', 'jsonl'], help='Output format')
+    console.add_argument('-j', '--jobs', type=int).completer = ChoicesCompleter([1, 2, 4])
+    console.add_argument('--hidden', help=argparse.SUPPRESS)
+    env = subparsers.add_parser('env', help='Prints environment information')
+    env.add_argument('names', nargs='*', choices=['QMK_HOME', 'QMK_FIRMWARE'], help='Variables')
+    run = subparsers.add_parser('run', help='Run a command')
+    run.add_argument('command', nargs=argparse.REMAINDER)
+    values, value_ids = [], {}
+
+    return {'tree': _describe_parser(parser, values, value_ids), 'values': values}
+
+
+def complete(index, line):
+    words = line.split(' ')
+    command_line = CommandLine(index)
+
+    for word in words[1:-1]:
+        command_line.feed(word)
+
+    return sorted(command_line.completions(words[-1]))
+
+
+def test_command_line(index):
+    assert complete(index, 'qmk ') == ['--help', '--level', '--verbose', '-h', '-v', 'console', 'env', 'run']
+    assert complete(index, 'qmk co') == ['console']
+    assert complete(index, 'qmk --l') == ['--level']
+    assert complete(index, 'qmk --level ') == ['debug', 'info']
+    assert complete(index, 'qmk --level=i') == ['--level=info']
+    assert complete(index, 'qmk -v console --') == ['--format', '--help', '--jobs']
+    assert complete(index, 'qmk console -f ') == ['jsonl', 'text']
+    assert complete(index, 'qmk console -fjsonl -j ') == ['1', '2', '4']
+    assert complete(index, 'qmk console --jobs 2 -f t') == ['text']
+    assert complete(index, 'qmk env QMK_HOME Q') == ['QMK_FIRMWARE', 'QMK_HOME']
+    assert complete(index, 'qmk env -- Q') == ['QMK_FIRMWARE', 'QMK_HOME']
+    assert complete(index, 'qmk nope c') == ['console']
+
+
+def test_dynamic_arguments(index):
+    with pytest.raises(DynamicCompletionError):
+        complete(index, 'qmk run ')
+
+
+@needs_git
+def test_git_head(tmp_path):
+    repo = tmp_path / 'repo'
+    repo.mkdir()
+    git(repo, 'init')
+    assert git_head(repo) is None
+
+    git(repo, 'commit', '--allow-empty', '-m', 'first')
+    first = git(repo, 'rev-parse', 'HEAD')
+    assert git_head(repo) == first
+
+    git(repo, 'pack-refs', '--all')
+    assert not (repo / '.git' / 'refs' / 'heads' / 'master').exists()
+    assert git_head(repo) == first
+
+    git(repo, 'commit', '--allow-empty', '-m', 'second')
+    git(repo, 'checkout', '--detach', first)
+    assert git_head(repo) == first
+
+    git(repo, 'worktree', 'add', '-b', 'other', str(tmp_path / 'worktree'), 'master')
+    assert git_head(tmp_path / 'worktree') == git(repo, 'rev-parse', 'master')
+    assert git_head(tmp_path / 'missing') is None
+
+
+def argcomplete(env, cwd, line, index):
+    """Ask `qmk` to complete line, from the index or by starting up completely. Returns what it wrote for the shell.
+    """
+    env = {**env, '_ARGCOMPLETE': '1', 'COMP_LINE': line, 'COMP_POINT': str(len(line)), '_ARGCOMPLETE_STDOUT_FILENAME': str(cwd / 'completions')}
+
+    if not index:
+        env['QMK_NO_COMPLETION_INDEX'] = '1'
+
+    subprocess.run([sys.executable, '-m', 'qmk_cli'], env=env, cwd=cwd, check=True, timeout=60)
+
+    return (cwd / 'completions').read_bytes()
+
+
+def test_index_matches_argcomplete(tmp_path):
+    env = {**os.environ, 'PYTHONPATH': str(REPO), 'QMK_CACHE_DIR': str(tmp_path / 'cache')}
+    cwd = tmp_path / 'cwd'
+    cwd.mkdir()
+    subprocess.run([sys.executable, '-m', 'qmk_cli.completion'], env=env, check=True, timeout=60)
+
+    assert (tmp_path / 'cache' / COMPLETION_INDEX).exists()
+
+    for line in ('qmk ', 'qmk en', 'qmk -', 'qmk --log-file-level w', 'qmk console --format ', 'qmk console --format=j', 'qmk mirror ', 'qmk setup -'):
+        assert argcomplete(env, cwd, line, index=True) == argcomplete(env, cwd, line, index=False), line
+
+    # Completing from the index doesn't start up the CLI
+    check = 'import sys; from qmk_cli import completion; answered = completion.complete(); sys.exit(not answered or "milc" in sys.modules)'
+    completion_env = {**env, '_ARGCOMPLETE': '1', 'COMP_LINE': 'qmk en', 'COMP_POINT': '6', '_ARGCOMPLETE_STDOUT_FILENAME': str(cwd / 'completions')}
+    assert subprocess.run([sys.executable, '-c', check], env=completion_env, cwd=cwd, timeout=60).returncode == 0
@@ -0,0 +1,87 @@
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+from tempfile import mkdtemp
+
+import pytest
+
+from qmk_cli import daemon
+
+pytestmark = pytest.mark.skipif(not daemon.supported(), reason='qmk daemon is not supported on this platform')
+
+REPO = Path(__file__).resolve().parent.parent
+FORWARD = 'import sys; from qmk_cli import daemon; code = daemon.forward(sys.argv[1:]); sys.exit(99 if code is None else code)'
+
+
+@pytest.fixture
+def qmk_env(tmp_path):
+    # Unix socket paths are short, so keep ours out of pytest's long tmp_path
+    socket_dir = Path(mkdtemp(prefix='qmk', dir='/tmp' if os.path.isdir('/tmp') else None))
+    env = {**os.environ, 'PYTHONPATH': str(REPO), 'QMK_CACHE_DIR': str(tmp_path / 'cache'), 'QMK_DAEMON_SOCKET': str(socket_dir / 'run' / 'daemon.sock')}
+    env.pop('QMK_NO_DAEMON')
+
+    yield env
+
+    for path in sorted(socket_dir.rglob('*'), reverse=True):
+        path.rmdir() if path.is_dir() else path.unlink()
+
+    socket_dir.rmdir()
+
+
+@pytest.fixture
+def qmk_daemon(qmk_env):
+    process = subprocess.Popen([sys.executable, '-m', 'qmk_cli', 'daemon'], env={**qmk_env, 'QMK_NO_DAEMON': '1'}, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+
+    while not Path(qmk_env['QMK_DAEMON_SOCKET']).exists():
+        assert process.poll() is None and time.monotonic() < deadline, 'qmk daemon did not start'
+        time.sleep(0.05)
+
+    yield qmk_env
+
+    process.terminate()
+    process.wait()
+
+
+def run(env, *argv, forward=False):
+    """Run qmk with argv, in its own process or forwarded to the daemon. Returns the CompletedProcess.
+    """
+    if forward:
+        command = [sys.executable, '-c', FORWARD, 'qmk', *argv]
+    else:
+        command = [sys.executable, '-m', 'qmk_cli', *argv]
+        env = {**env, 'QMK_NO_DAEMON': '1'}
+
+    return subprocess.run(command, env=env, capture_output=True, timeout=60)
+
+
+@pytest.mark.parametrize('argv', [['env'], ['env', 'NOPE'], ['env', '-f', 'json', 'QMK_HOME']])
+def test_forwarded_output_matches(qmk_daemon, argv):
+    local = run(qmk_daemon, *argv)
+    forwarded = run(qmk_daemon, *argv, forward=True)
+
+    assert forwarded.returncode != 99, 'the command was not forwarded to the daemon'
+    assert (forwarded.returncode, forwarded.stdout, forwarded.stderr) == (local.returncode, local.stdout, local.stderr)
+    assert b'\x1b[' not in forwarded.stderr
+
+
+def test_daemon_refuses_daemon_commands(qmk_daemon):
+    assert run(qmk_daemon, '-v', 'daemon', '--status', forward=True).returncode == 99
+
+
+def test_handshake_mismatch(qmk_daemon, monkeypatch):
+    monkeypatch.setenv('QMK_DAEMON_SOCKET', qmk_daemon['QMK_DAEMON_SOCKET'])
+    request = {'argv': ['qmk', 'env'], 'cwd': os.getcwd(), 'env': dict(os.environ), 'handshake': {**daemon.handshake(), 'version': '0.0.0'}}
+
+    with daemon.connect() as sock:
+        daemon._send(sock, request, (0, 1, 2))
+        reply, _ = daemon._recv(sock)
+
+    assert 'pid' not in reply
+    assert 'version' in reply['refused']
+
+
+def test_no_daemon(qmk_env):
+    assert run(qmk_env, 'env', forward=True).returncode == 99
@@ -0,0 +1,78 @@
+from qmk_cli.console.descriptor import CONSOLE_USAGE, DescriptorCache, is_console_descriptor, top_level_usages
+
+# Usage Page (0xFF31), Usage (0x74), Collection (Application), Usage (0x75), Report Size (8), Input, End Collection
+CONSOLE = bytes.fromhex('0631ff 0974 a101 0975 7508 8102 c0')
+
+# Usage Page (Generic Desktop), Usage (Keyboard), Collection (Application), Usage Page (Keyboard), Collection (Logical), End Collection, End Collection
+KEYBOARD = bytes.fromhex('0501 0906 a101 0507 a102 c0 c0')
+
+
+def test_console_descriptor():
+    assert top_level_usages(CONSOLE) == [CONSOLE_USAGE]
+    assert is_console_descriptor(CONSOLE)
+
+
+def test_other_descriptor():
+    assert top_level_usages(KEYBOARD) == [(0x01, 0x06)]
+    assert not is_console_descriptor(KEYBOARD)
+
+
+def test_several_collections():
+    assert top_level_usages(KEYBOARD + CONSOLE) == [(0x01, 0x06), CONSOLE_USAGE]
+    assert is_console_descriptor(KEYBOARD + CONSOLE)
+
+
+def test_nested_collections_are_not_top_level():
+    # Usage Page (Generic Desktop), Usage (Mouse), Collection (Application), Usage Page (0xFF31), Usage (0x74), Collection (Logical), End Collection, End Collection
+    nested = bytes.fromhex('0501 0902 a101 0631ff 0974 a102 c0 c0')
+
+    assert top_level_usages(nested) == [(0x01, 0x02)]
+    assert not is_console_descriptor(nested)
+
+
+def test_extended_usage():
+    # A 4 byte Usage carries its own usage page, overriding the global one
+    extended = bytes.fromhex('0501 0b740031ff a101 c0')
+
+    assert top_level_usages(extended) == [CONSOLE_USAGE]
+
+
+def test_push_and_pop():
+    # Push, Usage Page (0xFF31), Pop restores Generic Desktop before the Usage is used
+    pushed = bytes.fromhex('0501 a4 0631ff b4 0906 a101 c0')
+
+    assert top_level_usages(pushed) == [(0x01, 0x06)]
+
+
+def test_long_items_are_skipped():
+    long_item = bytes([0xFE, 2, 0x42, 0xAA, 0xBB])
+
+    assert top_level_usages(long_item + CONSOLE) == [CONSOLE_USAGE]
+
+
+def test_truncated_descriptors():
+    for length in range(len(CONSOLE)):
+        top_level_usages(CONSOLE[:length])
+
+    assert top_level_usages(b'\xfe') == []
+
+
+def test_descriptor_cache(tmp_path):
+    device = tmp_path / 'hidraw0' / 'device'
+    device.mkdir(parents=True)
+    (device / 'report_descriptor').write_bytes(CONSOLE)
+    cache = DescriptorCache(str(tmp_path))
+
+    assert cache.is_console('hidraw0')
+    assert not cache.is_console('hidraw1')
+
+    # Cached until invalidated
+    (device / 'report_descriptor').write_bytes(KEYBOARD)
+    assert cache.is_console('hidraw0')
+
+    # A different device behind the same node is looked at again
+    device.rename(tmp_path / 'old')
+    device.mkdir()
+    (device / 'report_descriptor').write_bytes(KEYBOARD)
+    cache.invalidate()
+    assert not cache.is_console('hidraw0')
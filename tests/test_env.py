@@ -0,0 +1,53 @@
+import json
+import shutil
+import subprocess
+
+import pytest
+
+from qmk_cli.subcommands.env import format_env
+
+DATA = {
+    'QMK_HOME': "/home/me/it's qmk",
+    'QMK_PATH': 'C:\\qmk\\$HOME #1',
+    'QMK_EMPTY': None,
+    'QMK_COLOR': True,
+}
+
+
+def test_sh():
+    assert format_env(DATA, 'sh') == '\n'.join([
+        '''export QMK_HOME='/home/me/it'"'"'s qmk\'''',
+        "export QMK_PATH='C:\\qmk\\$HOME #1'",
+        "export QMK_EMPTY=''",
+        'export QMK_COLOR=True',
+    ])
+
+
+@pytest.mark.skipif(not shutil.which('sh'), reason='needs sh')
+def test_sh_round_trip():
+    script = format_env(DATA, 'sh') + '\nprintf "%s\\n" "$QMK_HOME" "$QMK_PATH" "$QMK_EMPTY" "$QMK_COLOR"'
+    output = subprocess.run(['sh', '-c', script], capture_output=True, encoding='utf-8', check=True).stdout
+
+    assert output.split('\n')[:4] == [DATA['QMK_HOME'], DATA['QMK_PATH'], '', 'True']
+
+
+def test_fish():
+    assert format_env(DATA, 'fish') == '\n'.join([
+        "set -gx QMK_HOME '/home/me/it\\'s qmk';",
+        "set -gx QMK_PATH 'C:\\\\qmk\\\\$HOME #1';",
+        "set -gx QMK_EMPTY '';",
+        "set -gx QMK_COLOR 'True';",
+    ])
+
+
+def test_make():
+    assert format_env(DATA, 'make') == '\n'.join([
+        "QMK_HOME := /home/me/it's qmk",
+        'QMK_PATH := C:\\qmk\\$$HOME \\#1',
+        'QMK_EMPTY := ',
+        'QMK_COLOR := True',
+    ])
+
+
+def test_json():
+    assert json.loads(format_env(DATA, 'json')) == DATA
@@ -0,0 +1,94 @@
+import re
+
+import pytest
+
+from qmk_cli.console.filters import DeviceSelector, LineFilter, SelectorError, device_selected, parse_device_selectors
+
+DEVICE = {
+    'vendor_id': 0xFEED,
+    'product_id': 0x6060,
+    'index': 1,
+    'manufacturer_string': 'QMK',
+    'product_string': 'Planck',
+    'serial_number': 'ABC123',
+}
+
+
+@pytest.mark.parametrize(
+    'selector,selected', [
+        ('feed:6060', True),
+        ('FEED:6060', True),
+        ('feed:6060:1', True),
+        ('feed:6060:2', False),
+        ('fe*:*', True),
+        ('beef:6060', False),
+        ('manufacturer=qmk', True),
+        ('product=Plan*', True),
+        ('product=Preonic', False),
+        ('serial=ABC???', True),
+    ]
+)
+def test_selector_matches(selector, selected):
+    assert DeviceSelector(selector).matches(DEVICE) is selected
+
+
+def test_missing_field_only_matches_wildcard():
+    device = {**DEVICE, 'serial_number': None}
+
+    assert not DeviceSelector('serial=ABC*').matches(device)
+    assert DeviceSelector('serial=*').matches(device)
+
+
+@pytest.mark.parametrize('selector', ['feed', 'feed:6060:1:2', 'feed:6060:x', 'feed:6060:0', 'color=red'])
+def test_invalid_selectors(selector):
+    with pytest.raises(SelectorError):
+        DeviceSelector(selector)
+
+
+def test_parse_device_selectors():
+    selectors = parse_device_selectors(' feed:6060 ,, product=Preonic,')
+
+    assert [str(selector) for selector in selectors] == ['feed:6060', 'product=Preonic']
+    assert device_selected(selectors, DEVICE)
+    assert not device_selected(selectors[1:], DEVICE)
+    assert device_selected([], DEVICE)
+
+
+def test_line_filter():
+    line_filter = LineFilter(grep=['matrix', r'^layer \d'], exclude=['debug'])
+
+    assert line_filter
+    assert line_filter('matrix scan')
+    assert line_filter('layer 2 on')
+    assert not line_filter('set layer 2')
+    assert not line_filter('matrix debug')
+    assert not line_filter('keycode 0x04')
+
+
+def test_empty_line_filter():
+    line_filter = LineFilter()
+
+    assert not line_filter
+    assert line_filter('anything')
+    assert LineFilter(exclude=['x'])('abc')
+    assert not LineFilter(exclude=['x'])('xyz')
+
+
+def test_inline_flags():
+    line_filter = LineFilter(grep=['(?i)error', 'warn'], exclude=['(?i)IGNORED'])
+
+    assert line_filter('ERROR: matrix')
+    assert line_filter('warn: eeprom')
+    assert not line_filter('WARN: eeprom')
+    assert not line_filter('Error: ignored')
+
+
+def test_backreferences():
+    assert LineFilter(grep=[r'(a)\1', r'(b)\1'])('bb')
+    assert not LineFilter(grep=[r'(a)\1', r'(b)\1'])('ab')
+    assert not LineFilter(exclude=[r'(a)\1', r'(b)\1'])('xbbx')
+
+
+def test_invalid_pattern():
+    with pytest.raises(re.error):
+        LineFilter(grep=['('])
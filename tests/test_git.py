@@ -0,0 +1,124 @@
+import shutil
+import subprocess
+
+import pytest
+
+from qmk_cli.git import fetch_branch, fetch_depth, git_output, is_shallow, lost_commits, switch_fork, update_checkout
+
+pytestmark = pytest.mark.skipif(not shutil.which('git'), reason='needs git')
+
+
+def git(cwd, *args):
+    subprocess.run(['git', '-c', 'user.name=qmk', '-c', 'user.email=qmk@example.com', '-c', 'init.defaultBranch=master', *args], cwd=cwd, check=True, capture_output=True)
+
+
+def commit(repo, message):
+    (repo / 'file').write_text(message)
+    git(repo, 'add', 'file')
+    git(repo, 'commit', '-m', message)
+
+
+def count(repo):
+    return int(git_output(['rev-list', '--count', 'HEAD'], cwd=repo))
+
+
+@pytest.fixture
+def upstream(tmp_path):
+    repo = tmp_path / 'upstream'
+    repo.mkdir()
+    git(repo, 'init')
+
+    for n in range(3):
+        commit(repo, f'commit {n}')
+
+    return repo
+
+
+def clone(upstream, name, *args):
+    destination = upstream.parent / name
+    git(upstream.parent, 'clone', *args, upstream.as_uri(), str(destination))
+
+    return destination
+
+
+def test_update_full_clone(upstream):
+    full = clone(upstream, 'full')
+    commit(upstream, 'commit 3')
+
+    assert update_checkout(full)
+    assert not is_shallow(full)
+    assert count(full) == 4
+    assert fetch_depth(full, 1) == []
+
+
+def test_update_shallow_clone(upstream):
+    shallow = clone(upstream, 'shallow', '--depth=1')
+    commit(upstream, 'commit 3')
+
+    assert update_checkout(shallow)
+    assert is_shallow(shallow)
+    assert count(shallow) == 2
+    assert git_output(['rev-parse', 'HEAD'], cwd=shallow) == git_output(['rev-parse', 'HEAD'], cwd=upstream)
+    assert fetch_depth(shallow, 1) == ['--depth=1']
+    assert fetch_depth(shallow, 0) == []
+
+
+def test_update_diverged_clone(upstream):
+    full = clone(upstream, 'full')
+    commit(upstream, 'upstream change')
+    commit(full, 'local change')
+
+    assert not update_checkout(full)
+
+
+def test_update_empty_clone(upstream):
+    empty = upstream.parent / 'empty'
+    empty.mkdir()
+    git(empty, 'init')
+    git(empty, 'remote', 'add', 'origin', upstream.as_uri())
+    git(empty, 'config', 'branch.master.remote', 'origin')
+    git(empty, 'config', 'branch.master.merge', 'refs/heads/master')
+
+    # There is no current commit to update from
+    assert not update_checkout(empty)
+
+
+def test_switch_fork(upstream):
+    full = clone(upstream, 'full')
+    fork = clone(upstream, 'fork')
+    commit(fork, 'fork change')
+    ref = fetch_branch(full, fork.as_uri(), 'master')
+
+    assert ref.endswith('/master')
+    assert lost_commits(full, 'master', ref) == []
+    assert lost_commits(full, 'other', ref) == []
+
+    (full / 'file').write_text('uncommitted')
+    (full / 'untracked').write_text('kept')
+
+    assert switch_fork(full, ref, 'master')
+    assert git_output(['rev-parse', 'HEAD'], cwd=full) == git_output(['rev-parse', 'HEAD'], cwd=fork)
+    assert git_output(['rev-parse', '--abbrev-ref', 'master@{upstream}'], cwd=full).strip() == ref
+    assert (full / 'file').read_text() == 'fork change'
+    assert (full / 'untracked').read_text() == 'kept'
+
+
+def test_lost_commits(upstream):
+    full = clone(upstream, 'full')
+    ref = fetch_branch(full, upstream.as_uri(), 'master')
+    commit(full, 'local change')
+
+    lost = lost_commits(full, 'master', ref)
+    assert len(lost) == 1
+    assert lost[0].endswith(' local change')
+
+    # Commits another branch still has are kept, but those only on a detached HEAD would be lost
+    git(full, 'checkout', '-q', '-b', 'feature')
+    commit(full, 'feature change')
+    assert lost_commits(full, 'master', ref) == []
+    assert [line.split(' ', 1)[1] for line in lost_commits(full, 'feature', ref)] == ['feature change']
+
+    git(full, 'checkout', '-q', '--detach')
+    commit(full, 'detached change')
+    assert [line.split(' ', 1)[1] for line in lost_commits(full, 'master', ref)] == ['detached change']
+    assert lost_commits(full, 'master', 'no-such-ref') is None
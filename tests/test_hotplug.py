@@ -0,0 +1,182 @@
+import os
+import socket
+import threading
+import time
+
+import pytest
+
+from qmk_cli.console import hotplug
+from qmk_cli.console.hotplug import EventHotplug, InotifyHotplug, PollingHotplug, UeventHotplug, open_hotplug
+
+linux = pytest.mark.skipif(not os.path.isdir('/proc/self/fd'), reason='needs linux')
+
+
+class PipeHotplug(EventHotplug):
+    """An event backend fed through a pipe, every byte of which is an event we care about.
+    """
+    name = 'pipe'
+
+    def __init__(self, followup_delays=()):
+        self.events_r, self.events_w = os.pipe()
+        self.followup_delays = followup_delays
+        os.set_blocking(self.events_r, False)
+        super().__init__(self.events_r)
+
+    def read_events(self):
+        return bool(os.read(self.events_r, 512))
+
+    def close(self):
+        super().close()
+        os.close(self.events_w)
+
+
+def open_fds():
+    return set(os.listdir('/proc/self/fd'))
+
+
+def inotify_event(wd, mask, name):
+    name = name.encode() + b'\0' * (16 - len(name))
+
+    return InotifyHotplug.EVENT.pack(wd, mask, 0, len(name)) + name
+
+
+def test_polling_wait_and_wake():
+    polling = PollingHotplug()
+
+    assert not polling.wait(0.01)
+
+    polling.wake()
+    assert polling.wait(5)
+    assert not polling.wait(0.01)
+
+    threading.Timer(0.05, polling.wake).start()
+    start = time.monotonic()
+    assert polling.wait(5)
+    assert time.monotonic() - start < 1
+
+
+def test_event_wait():
+    events = PipeHotplug()
+
+    try:
+        assert not events.wait(0.01)
+
+        events.wake()
+        events.wake()
+        assert events.wait(5)
+        assert not events.wait(0.01)
+
+        os.write(events.events_w, b'x')
+        assert events.wait(5)
+        assert not events.wait(0.01)
+
+    finally:
+        events.close()
+
+
+def test_event_followups():
+    events = PipeHotplug(followup_delays=(0.05,))
+
+    try:
+        os.write(events.events_w, b'x')
+        assert events.wait(5)
+
+        # The follow-up rescan arrives without another event, and only once
+        start = time.monotonic()
+        assert events.wait(5)
+        assert 0.04 < time.monotonic() - start < 1
+        assert not events.wait(0.1)
+
+    finally:
+        events.close()
+
+
+@linux
+def test_inotify_events(monkeypatch):
+    inotify = InotifyHotplug.__new__(InotifyHotplug)
+    inotify.fd, write_fd = os.pipe()
+    inotify._watches = {1: '/dev', 2: '/dev/bus/usb', 3: '/dev/bus/usb/001'}
+    added = []
+    monkeypatch.setattr(inotify, '_add_watch', lambda path, mask: added.append(path), raising=False)
+    os.set_blocking(inotify.fd, False)
+
+    try:
+        os.write(write_fd, inotify_event(1, InotifyHotplug.IN_CREATE, 'tty1') + inotify_event(1, InotifyHotplug.IN_ATTRIB, 'video0'))
+        assert not inotify.read_events()
+
+        os.write(write_fd, inotify_event(1, InotifyHotplug.IN_CREATE, 'tty1') + inotify_event(1, InotifyHotplug.IN_ATTRIB, 'hidraw3'))
+        assert inotify.read_events()
+
+        os.write(write_fd, inotify_event(3, InotifyHotplug.IN_DELETE, '004'))
+        assert inotify.read_events()
+
+        os.write(write_fd, inotify_event(2, InotifyHotplug.IN_CREATE | InotifyHotplug.IN_ISDIR, '002'))
+        assert inotify.read_events()
+        assert added == ['/dev/bus/usb/002']
+
+        # Events for watches we no longer know about are ignored
+        os.write(write_fd, inotify_event(9, InotifyHotplug.IN_CREATE, 'hidraw0'))
+        assert not inotify.read_events()
+
+    finally:
+        os.close(inotify.fd)
+        os.close(write_fd)
+
+
+@linux
+def test_inotify_closes_on_failure(monkeypatch):
+    def add_watch(self, path, mask):
+        raise OSError(28, 'inotify_add_watch failed')
+
+    try:
+        InotifyHotplug().close()
+    except OSError:
+        pytest.skip('inotify is not available')
+
+    monkeypatch.setattr(InotifyHotplug, '_add_watch', add_watch)
+    before = open_fds()
+
+    with pytest.raises(OSError):
+        InotifyHotplug()
+
+    assert open_fds() == before
+
+
+@linux
+def test_uevent_events():
+    netlink = UeventHotplug.__new__(UeventHotplug)
+    netlink._sock, sender = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+    netlink._sock.setblocking(False)
+
+    try:
+        sender.send(b'add@/devices/pci0000:00/input\0ACTION=add\0SUBSYSTEM=input\0')
+        assert not netlink.read_events()
+
+        sender.send(b'add@/devices/pci0000:00/input\0ACTION=add\0SUBSYSTEM=input\0')
+        sender.send(b'remove@/devices/pci0000:00/hidraw/hidraw2\0ACTION=remove\0SUBSYSTEM=hidraw\0')
+        assert netlink.read_events()
+        assert not netlink.read_events()
+
+        sender.send(b'libudev\0\xfe\xed\xca\xfeACTION=bind\0SUBSYSTEM=usb\0DEVTYPE=usb_device\0')
+        assert netlink.read_events()
+
+    finally:
+        netlink._sock.close()
+        sender.close()
+
+
+def test_open_hotplug_fallback(monkeypatch):
+    def unavailable(self):
+        raise OSError(38, 'Function not implemented')
+
+    monkeypatch.setattr(hotplug, 'platform', lambda: 'Linux-6.1-x86_64')
+    monkeypatch.setattr(InotifyHotplug, '__init__', unavailable)
+    monkeypatch.setattr(UeventHotplug, '__init__', lambda self: None)
+    assert isinstance(open_hotplug(), UeventHotplug)
+
+    monkeypatch.setattr(UeventHotplug, '__init__', unavailable)
+    assert isinstance(open_hotplug(), PollingHotplug)
+
+    monkeypatch.setattr(hotplug, 'platform', lambda: 'macOS-14.0-arm64')
+    monkeypatch.setattr(InotifyHotplug, '__init__', lambda self: None)
+    assert isinstance(open_hotplug(), PollingHotplug)
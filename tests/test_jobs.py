@@ -0,0 +1,90 @@
+import io
+import os
+import shlex
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from qmk_cli.jobs import PREFIX_WIDTH, JobRunner
+
+# Creates argv[1], then waits for argv[2] to exist. Two of these only both succeed if they run at the same time
+RENDEZVOUS = 'import os, sys, time; open(sys.argv[1], "w").close(); deadline = time.monotonic() + 10; any(os.path.exists(sys.argv[2]) or time.sleep(0.01) for _ in iter(lambda: time.monotonic() < deadline, False)); sys.exit(not os.path.exists(sys.argv[2]))'
+
+
+def python(code, *args):
+    return [sys.executable, '-c', code, *args]
+
+
+def test_capture():
+    finished = []
+    runner = JobRunner(2, finished=finished.append)
+    hello = runner.submit(python('print("hello"); print("stderr", file=__import__("sys").stderr)'), name='hello')
+    fail = runner.submit(python('raise SystemExit(3)'))
+
+    assert not runner.run()
+    assert sorted(finished, key=str) == sorted([hello, fail], key=str)
+    assert (hello.status, hello.output.replace(b'\r', b'')) == ('ok', b'hello\nstderr\n')
+    assert fail.status == 'exit 3'
+    assert fail.name == shlex.join(fail.command)
+    assert runner.failed() == [fail]
+    assert hello.seconds > 0
+
+
+def test_runs_in_parallel(tmp_path):
+    first, second = str(tmp_path / 'first'), str(tmp_path / 'second')
+    runner = JobRunner(2)
+    runner.submit(python(RENDEZVOUS, first, second))
+    runner.submit(python(RENDEZVOUS, second, first))
+
+    assert runner.run()
+
+
+def test_cwd_and_env(tmp_path):
+    runner = JobRunner(1)
+    job = runner.submit(python('import os; print(os.getcwd(), os.environ["QMK_TEST"])'), cwd=tmp_path, env={**os.environ, 'QMK_TEST': 'yes'})
+
+    assert runner.run()
+    assert job.output.decode().split() == [str(tmp_path), 'yes']
+
+
+def test_stream():
+    stream = io.StringIO()
+    runner = JobRunner(1, capture=False, stream=stream)
+    job = runner.submit(python('print("one"); print("two")'), name='x' * (PREFIX_WIDTH+10))
+
+    assert runner.run()
+    assert job.output == b''
+    assert stream.getvalue() == f'[{"x" * (PREFIX_WIDTH - 3)}...] one\n[{"x" * (PREFIX_WIDTH - 3)}...] two\n'
+
+
+def test_missing_command():
+    runner = JobRunner(1)
+    job = runner.submit(['qmk-no-such-command'])
+
+    assert not runner.run()
+    assert job.returncode == 127
+    assert job.output.startswith(b'FileNotFoundError')
+
+
+def test_fail_fast():
+    runner = JobRunner(2, fail_fast=True)
+    fail = runner.submit(python('import time; time.sleep(0.2); raise SystemExit(1)'))
+    slow = runner.submit(python('import time; time.sleep(30)'))
+    skipped = runner.submit(python('pass'))
+    start = time.monotonic()
+
+    assert not runner.run()
+    assert time.monotonic() - start < 10
+    assert [fail.status, slow.status, skipped.status] == ['exit 1', 'cancelled', 'skipped']
+    assert runner.cancelled() == [slow, skipped]
+
+
+def test_run_parallel(tmp_path):
+    env = {**os.environ, 'PYTHONPATH': str(Path(__file__).resolve().parent.parent)}
+    commands = [shlex.join(python(RENDEZVOUS, str(tmp_path / 'first'), str(tmp_path / 'second'))), shlex.join(python(RENDEZVOUS, str(tmp_path / 'second'), str(tmp_path / 'first')))]
+    result = subprocess.run([sys.executable, '-m', 'qmk_cli', 'run-parallel', '-j', '2', '-f', '-', commands[0]], env=env, input=f'# Comment\n\n{commands[1]}\n', capture_output=True, encoding='utf-8', timeout=60)
+
+    assert result.returncode == 0
+    assert result.stdout.count('==>') == 2
+    assert '2 jobs, 0 failed, 0 cancelled' in result.stderr
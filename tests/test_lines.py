@@ -0,0 +1,47 @@
+from qmk_cli.console.lines import MAX_LINE_LENGTH, REPORT_SIZE, LineAssembler
+
+
+def report(text):
+    """Returns text as a console report, padded with NULs.
+    """
+    return text.encode('utf-8').ljust(REPORT_SIZE, b'\0')
+
+
+def test_lines_across_reports():
+    lines = LineAssembler()
+
+    assert lines.feed(report('hello ')) == []
+    assert lines.feed(report('world\nsecond')) == ['hello world']
+    assert lines.feed(report(' line\nthird\n')) == ['second line', 'third']
+    assert lines.feed(report('')) == []
+    assert lines.buffer == b''
+
+
+def test_several_lines_in_one_report():
+    assert LineAssembler().feed(b'a\nb\n\nc') == ['a', 'b', '']
+
+
+def test_bytes_like_reports():
+    lines = LineAssembler()
+    data = bytearray(report('one\ntwo'))
+
+    assert lines.feed(memoryview(data)[:8]) == ['one']
+    assert lines.feed(bytearray(b'\n')) == ['two']
+
+
+def test_split_utf8_and_invalid_bytes():
+    lines = LineAssembler()
+    encoded = 'naïve\n'.encode('utf-8')
+
+    # A multibyte character split across two reports is decoded once the line is complete
+    assert lines.feed(encoded[:3]) == []
+    assert lines.feed(encoded[3:]) == ['naïve']
+    assert lines.feed(b'\xff\xfebad\n') == ['��bad']
+
+
+def test_long_lines_are_emitted():
+    lines = LineAssembler()
+
+    assert lines.feed(b'x' * (MAX_LINE_LENGTH-1)) == []
+    assert lines.feed(b'yz') == ['x' * (MAX_LINE_LENGTH-1) + 'yz']
+    assert lines.feed(b'\n') == ['']
@@ -0,0 +1,93 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from milc import cli
+
+from qmk_cli import manifest
+from qmk_cli.manifest import MANIFEST_CACHE, _manifest_key, _stub_handler, peek_subcommand
+
+
+@pytest.mark.parametrize(
+    'argv,subcommand', [
+        (['env'], 'env'),
+        (['-v', 'daemon', '--stop'], 'daemon'),
+        (['--config-file', 'qmk.ini', 'config', '-a'], 'config'),
+        (['--log-file-fmt=%(message)s', 'env'], 'env'),
+        (['--', 'env'], 'env'),
+        ([], None),
+        (['-v'], None),
+        (['--no-such-option', 'env'], False),
+        (['@argsfile'], False),
+    ]
+)
+def test_peek_subcommand(argv, subcommand):
+    assert peek_subcommand(argv) == subcommand
+
+
+def test_manifest_key(tmp_path, monkeypatch):
+    package = tmp_path / 'manifest_key_package'
+    package.mkdir()
+    (package / '__init__.py').write_text('')
+    (package / 'one.py').write_text('')
+    monkeypatch.syspath_prepend(str(tmp_path))
+    __import__('manifest_key_package')
+
+    key = _manifest_key('manifest_key_package', ['one', 'two'])
+    assert key == _manifest_key('manifest_key_package', ['one', 'two'])
+
+    (package / 'two.py').write_text('')
+    added = _manifest_key('manifest_key_package', ['one', 'two'])
+    assert added != key
+
+    (package / 'one.py').write_text('# Changed\n')
+    assert _manifest_key('manifest_key_package', ['one', 'two']) != added
+
+
+def test_stub_reruns_qmk(monkeypatch):
+    runs = []
+    monkeypatch.setattr(sys, 'argv', ['/usr/local/bin/qmk', '-v', 'env'])
+    monkeypatch.setattr(manifest.subprocess, 'run', lambda command, **kwargs: runs.append((command, kwargs['env'])) or subprocess.CompletedProcess(command, 3))
+
+    assert _stub_handler('env')(cli) == 3
+    assert runs[0][0] == [sys.executable, '-m', 'qmk_cli', '-v', 'env']
+    assert runs[0][1]['QMK_EAGER_SUBCOMMANDS'] == '1'
+
+
+def qmk(tmp_path, *args, eager=False):
+    """Run qmk with its own cache and config file in tmp_path. Returns what it printed.
+    """
+    env = {**os.environ, 'PYTHONPATH': str(Path(__file__).resolve().parent.parent), 'QMK_CACHE_DIR': str(tmp_path / 'cache')}
+    env.pop('QMK_EAGER_SUBCOMMANDS')
+
+    if eager:
+        env['QMK_EAGER_SUBCOMMANDS'] = '1'
+
+    command = [sys.executable, '-m', 'qmk_cli', '--config-file', str(tmp_path / 'qmk.ini'), *args]
+
+    return subprocess.run(command, env=env, cwd=tmp_path, capture_output=True, encoding='utf-8').stdout
+
+
+def test_config_with_warm_manifest(tmp_path):
+    # The first run imports everything and writes the manifest, the later ones register stubs from it
+    qmk(tmp_path, 'env')
+    manifest = json.loads((tmp_path / 'cache' / MANIFEST_CACHE).read_text())
+    eager = qmk(tmp_path, 'config', '-a', eager=True)
+
+    assert qmk(tmp_path, 'config', '-a') == eager
+    assert 'console.device=' in eager
+    assert 'setup.shallow_submodules=' in eager
+
+    qmk(tmp_path, 'config', 'console.device=feed:6060')
+    assert qmk(tmp_path, 'config', 'console.device').strip() == 'console.device=feed:6060 (config)'
+
+    # Stubs are registered the way the modules registered them
+    setup = {argument['dest']: argument for module in manifest['modules'].values() for subcommand in module if subcommand['name'] == 'setup' for argument in subcommand['arguments']}
+    assert setup['shallow_submodules']['action'] == 'store_boolean'
+    assert 'arg_only' not in setup['shallow_submodules']
+    assert setup['home']['arg_only']
+    assert 'default' not in setup['home']
@@ -0,0 +1,112 @@
+import os
+import shutil
+import subprocess
+import time
+
+import pytest
+
+from qmk_cli import mirror
+from qmk_cli.git import git_clone, git_output
+from qmk_cli.mirror import LAST_USED, list_mirrors, mirror_path, prune_mirrors, refresh_mirrors, resolve_url
+
+pytestmark = pytest.mark.skipif(not shutil.which('git'), reason='needs git')
+
+
+def git(cwd, *args):
+    subprocess.run(['git', '-c', 'user.name=qmk', '-c', 'user.email=qmk@example.com', '-c', 'init.defaultBranch=master', *args], cwd=cwd, check=True, capture_output=True)
+
+
+def commit(repo, message):
+    (repo / 'file').write_text(message)
+    git(repo, 'add', 'file')
+    git(repo, 'commit', '-m', message)
+
+
+def head(repo):
+    return git_output(['rev-parse', 'HEAD'], cwd=repo).strip()
+
+
+@pytest.fixture
+def upstream(tmp_path, monkeypatch):
+    """A superproject with one submodule, both in local repositories.
+    """
+    monkeypatch.setattr(mirror, 'MIRROR_DIR', tmp_path / 'mirrors')
+
+    # Submodules from file:// urls are refused by default since git 2.38.1
+    monkeypatch.setenv('GIT_CONFIG_COUNT', '1')
+    monkeypatch.setenv('GIT_CONFIG_KEY_0', 'protocol.file.allow')
+    monkeypatch.setenv('GIT_CONFIG_VALUE_0', 'always')
+
+    for name in ('sub', 'qmk_firmware'):
+        repo = tmp_path / 'upstream' / name
+        repo.mkdir(parents=True)
+        git(repo, 'init')
+        commit(repo, f'{name} commit')
+
+    superproject = tmp_path / 'upstream' / 'qmk_firmware'
+    git(superproject, 'submodule', 'add', '../sub', 'lib/sub')
+    git(superproject, 'commit', '-m', 'Add submodule')
+
+    return superproject
+
+
+def test_resolve_url():
+    assert resolve_url('https://github.com/qmk/qmk_firmware', '../ChibiOS.git') == 'https://github.com/qmk/ChibiOS.git'
+    assert resolve_url('https://github.com/qmk/qmk_firmware/', './lib/foo') == 'https://github.com/qmk/qmk_firmware/lib/foo'
+    assert resolve_url('https://github.com/qmk/qmk_firmware', '../../other/lib') == 'https://github.com/other/lib'
+    assert resolve_url('https://github.com/qmk/qmk_firmware', 'https://example.com/lib.git') == 'https://example.com/lib.git'
+
+
+def test_mirror_path(monkeypatch, tmp_path):
+    monkeypatch.setattr(mirror, 'MIRROR_DIR', tmp_path)
+    path = mirror_path('https://github.com/qmk/qmk_firmware')
+
+    assert path.parent == tmp_path
+    assert path.name.startswith('github.com_qmk_qmk_firmware-')
+    assert path.suffix == '.git'
+    assert mirror_path('https://github.com/qmk/qmk_firmware') == path
+    assert mirror_path('https://github.com/fork/qmk_firmware') != path
+    assert len(mirror_path('https://example.com/' + 'x'*200).name) < 80
+
+
+def test_refresh_mirrors(upstream):
+    url = upstream.as_uri()
+    submodule = upstream.parent / 'sub'
+
+    assert refresh_mirrors([url], 2) == 0
+    assert sorted(entry['url'] for entry in list_mirrors()) == sorted([url, resolve_url(url, '../sub')])
+    assert head(mirror_path(url)) == head(upstream)
+
+    # Refreshing again fetches what changed
+    commit(submodule, 'sub update')
+    assert refresh_mirrors([url], 2) == 0
+    assert head(mirror_path(resolve_url(url, '../sub'))) == head(submodule)
+
+
+def test_refresh_failure(upstream):
+    assert refresh_mirrors([(upstream.parent / 'missing').as_uri()]) == 1
+    assert list(mirror.MIRROR_DIR.iterdir()) == []
+
+
+def test_clone_from_mirror(upstream, tmp_path):
+    destination = tmp_path / 'qmk_firmware'
+
+    assert git_clone(upstream.as_uri(), destination, 'master', mirror=True)
+    assert (destination / 'lib' / 'sub' / 'file').read_text() == 'sub commit'
+    assert head(destination / 'lib' / 'sub') == head(upstream.parent / 'sub')
+
+    # The checkout has its own copy of every object, so the mirrors can go away
+    assert not list(destination.glob('.git/**/objects/info/alternates'))
+    prune_mirrors(0)
+    assert list_mirrors() == []
+    assert git_output(['fsck', '--no-dangling'], cwd=destination) is not None
+
+
+def test_prune_mirrors(upstream):
+    url = upstream.as_uri()
+    refresh_mirrors([url])
+    old = time.time() - 40*86400
+    os.utime(mirror_path(url) / LAST_USED, (old, old))
+
+    assert [entry['url'] for entry in prune_mirrors(30)] == [url]
+    assert [entry['url'] for entry in list_mirrors()] == [resolve_url(url, '../sub')]
@@ -0,0 +1,94 @@
+import io
+import shutil
+
+import pytest
+
+from qmk_cli import progress
+from qmk_cli.git import run_git
+from qmk_cli.progress import GitProgress, ProgressDisplay, ProgressEvent, Stats, parse_progress, parse_size
+
+
+@pytest.mark.parametrize(
+    'line,event', [
+        ('Receiving objects:  45% (4500/10000), 1.23 MiB | 2.00 MiB/s', ProgressEvent('repo', 'Receiving objects', 4500, 10000, 1289748, 2097152, False)),
+        ('Receiving objects: 100% (10000/10000), 3.50 MiB | 2.00 MiB/s, done.', ProgressEvent('repo', 'Receiving objects', 10000, 10000, 3670016, 2097152, True)),
+        ('remote: Counting objects: 100% (8/8), done.', ProgressEvent('repo', 'Counting objects', 8, 8, None, None, True)),
+        ('remote: Enumerating objects: 8, done.', ProgressEvent('repo', 'Enumerating objects', 8, None, None, None, True)),
+        ('Resolving deltas:   0% (0/2)', ProgressEvent('repo', 'Resolving deltas', 0, 2, None, None, False)),
+        ('Updating files:  50% (1/2)', ProgressEvent('repo', 'Updating files', 1, 2, None, None, False)),
+    ]
+)
+def test_parse_progress(line, event):
+    assert parse_progress('repo', line) == event
+
+
+@pytest.mark.parametrize('line', ["Cloning into 'qmk_firmware'...", 'From https://github.com/qmk/qmk_firmware', 'fatal: repository not found', 'warning: 50% done', ''])
+def test_not_progress(line):
+    assert parse_progress('repo', line) is None
+
+
+def test_parse_size():
+    assert parse_size('512 bytes') == 512
+    assert parse_size('1.50 KiB') == 1536
+    assert parse_size('2.00 GiB') == 2 * 1024**3
+
+
+def test_git_progress_feed():
+    display = ProgressDisplay(io.StringIO())
+    stats = Stats()
+    git = GitProgress('qmk_firmware', 'clone', display, stats)
+
+    # Progress lines are redrawn with \r, and may be split anywhere
+    git.feed(b"Cloning into 'qmk_firmware'...\nReceiving objects:  10% (1/10)\rReceiving obj")
+    git.feed(b'ects: 100% (10/10), 1.00 KiB | 1.00 KiB/s, done.\n')
+    git.feed(b"Cloning into '/tmp/qmk_firmware/lib/chibios'...\nReceiving objects: 100% (5/5), done.\n")
+    git.feed(b'')
+    git.finish(0, False)
+
+    runs = stats.to_dict()['runs']
+    assert [run['repo'] for run in runs] == ['qmk_firmware', '/tmp/qmk_firmware/lib/chibios']
+    assert runs[0]['phases']['Receiving objects']['objects'] == 10
+    assert runs[0]['phases']['Receiving objects']['bytes'] == 1024
+    assert runs[0]['phases']['Receiving objects']['done']
+    assert runs[1]['phases']['Receiving objects']['total'] == 5
+    assert all(run['returncode'] == 0 for run in runs)
+
+
+@pytest.fixture
+def stall_env(monkeypatch):
+    progress._env_number.cache_clear()
+    yield monkeypatch
+    progress._env_number.cache_clear()
+
+
+def test_stall_settings(stall_env):
+    stall_env.setenv('QMK_GIT_STALL_TIMEOUT', '2.5')
+    stall_env.setenv('QMK_GIT_STALL_RETRIES', '0')
+
+    assert progress.stall_timeout() == 2.5
+    assert progress.stall_retries() == 0
+
+
+@pytest.mark.parametrize('value', ['', '6o', '-1', '1.5'])
+def test_bad_stall_settings(stall_env, value):
+    stall_env.setenv('QMK_GIT_STALL_TIMEOUT', value)
+    stall_env.setenv('QMK_GIT_STALL_RETRIES', value)
+
+    assert progress.stall_retries() == progress.STALL_RETRIES
+
+    if value != '1.5':
+        assert progress.stall_timeout() == progress.STALL_TIMEOUT
+
+
+@pytest.mark.skipif(not shutil.which('git') or not shutil.which('sh'), reason='needs git and sh')
+def test_only_progress_commands_stall(stall_env, tmp_path):
+    stall_env.setenv('QMK_GIT_STALL_TIMEOUT', '0.2')
+    attempts = tmp_path / 'attempts'
+    silent = ['-c', f'alias.silent=!f() {{ echo x >> {attempts}; sleep 2; }}; f', 'silent']
+
+    # Commands like checkout and merge print nothing while they work, so they are left alone
+    assert run_git(silent, cwd=tmp_path)
+    assert attempts.read_text() == 'x\n'
+
+    assert not run_git([*silent, '--progress'], cwd=tmp_path, retries=1)
+    assert attempts.read_text() == 'x\n' * 3
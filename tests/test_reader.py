@@ -0,0 +1,115 @@
+import os
+import time
+from threading import Event
+
+import pytest
+
+from qmk_cli.console.reader import ConsoleReader, is_pollable, open_pollable
+
+
+class PipeDevice(object):
+    """A console device fed through a pipe. Goes away when the write end is closed.
+    """
+    def __init__(self, fail=False):
+        self.read_fd, self.write_fd = os.pipe()
+        self.fail = fail
+        self.data = b''
+        self.closed = Event()
+        os.set_blocking(self.read_fd, False)
+
+    def fileno(self):
+        return self.read_fd
+
+    def read_ready(self):
+        if self.fail:
+            raise OSError(5, 'Input/output error')
+
+        data = os.read(self.read_fd, 512)
+        self.data += data
+
+        return bool(data)
+
+    def close(self):
+        os.close(self.read_fd)
+        self.closed.set()
+
+
+def wait_for(condition, timeout=5):
+    """Wait up to timeout seconds for condition() to become true.
+    """
+    deadline = time.monotonic() + timeout
+
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+def test_is_pollable():
+    assert is_pollable('/dev/hidraw3')
+    assert is_pollable(b'/dev/hidraw3')
+    assert not is_pollable('IOService:/AppleACPIPlatformExpert/USB')
+    assert not is_pollable('\\\\?\\hid#vid_feed&pid_6060')
+
+
+def test_open_pollable():
+    class Backend(object):
+        def open_pollable(self, path):
+            return path.upper()
+
+    assert open_pollable(Backend(), 'sim:0') == 'SIM:0'
+    assert open_pollable(object(), 'IOService:/USB') is None
+
+
+def test_reader():
+    disconnects = []
+    batches = []
+    reader = ConsoleReader(on_disconnect=lambda: disconnects.append(True), on_batch=lambda: batches.append(True))
+    first, second = PipeDevice(), PipeDevice()
+    reader.add(first)
+    reader.add(second)
+
+    os.write(first.write_fd, b'hello ')
+    os.write(second.write_fd, b'world')
+    wait_for(lambda: first.data == b'hello ' and second.data == b'world')
+    assert batches
+
+    # Only the device that went away is dropped, the other keeps being read
+    os.close(first.write_fd)
+    assert first.closed.wait(5)
+    wait_for(lambda: disconnects == [True])
+
+    os.write(second.write_fd, b'!')
+    wait_for(lambda: second.data == b'world!')
+    assert not second.closed.is_set()
+
+    os.close(second.write_fd)
+    assert second.closed.wait(5)
+
+
+def test_reader_errors():
+    reader = ConsoleReader()
+    failing, working = PipeDevice(fail=True), PipeDevice()
+    reader.add(failing)
+    reader.add(working)
+
+    os.write(failing.write_fd, b'x')
+    assert failing.closed.wait(5)
+
+    os.write(working.write_fd, b'still here')
+    wait_for(lambda: working.data == b'still here')
+
+    for fd in (failing.write_fd, working.write_fd):
+        os.close(fd)
+
+
+@pytest.mark.skipif(not hasattr(os, 'O_NONBLOCK'), reason='needs O_NONBLOCK')
+def test_open_pollable_hidraw(tmp_path, monkeypatch):
+    monkeypatch.setattr('qmk_cli.console.reader.is_pollable', lambda path: True)
+    (tmp_path / 'hidraw0').write_bytes(b'')
+
+    fd = open_pollable(object(), str(tmp_path / 'hidraw0'))
+
+    try:
+        assert not os.get_blocking(fd)
+    finally:
+        os.close(fd)
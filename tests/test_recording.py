@@ -0,0 +1,100 @@
+import pytest
+
+from qmk_cli.console.recording import DEVICE, MAGIC, RECORD, REPORT, Recorder, RecordingError, read_recording
+
+PLANCK = {'vendor_id': 0xFEED, 'product_id': 0x6060, 'index': 1, 'manufacturer_string': 'QMK', 'product_string': 'Planck', 'serial_number': 'ABC123', 'path': b'/dev/hidraw0'}
+PREONIC = {**PLANCK, 'product_string': 'Preonic', 'path': b'/dev/hidraw1'}
+
+
+def records(path):
+    """Returns the (type, device, payload) of every record in a recording.
+    """
+    return [(record_type, device_id, payload) for record_type, device_id, _, payload in read_recording(path)]
+
+
+def test_record_and_read(tmp_path):
+    path = tmp_path / 'session.qmkcon'
+    recorder = Recorder(path)
+    planck = recorder.add_device(PLANCK)
+    preonic = recorder.add_device(PREONIC)
+    recorder.write(planck, b'hello\n')
+    recorder.write(preonic, b'world\n')
+    recorder.close()
+
+    described = {key: value for key, value in PLANCK.items() if key != 'path'}
+
+    assert (planck, preonic) == (0, 1)
+    assert records(path) == [(DEVICE, 0, described), (DEVICE, 1, {**described, 'product_string': 'Preonic'}), (REPORT, 0, b'hello\n'), (REPORT, 1, b'world\n')]
+
+
+def test_device_ids_are_reused(tmp_path):
+    recorder = Recorder(tmp_path / 'session.qmkcon')
+    planck = recorder.add_device(PLANCK)
+
+    # A second identical device gets its own id while the first is connected
+    assert recorder.add_device(PLANCK) == 1
+
+    # After a reconnect a device gets back an id it had before, but never one that's in use
+    recorder.remove_device(planck)
+    assert recorder.add_device(PLANCK) == planck
+    assert recorder.add_device(PLANCK) == 2
+    assert recorder.add_device(PREONIC) == 3
+
+    recorder.remove_device(3)
+    assert recorder.add_device(PREONIC) == 3
+    recorder.close()
+
+
+def test_appends_to_existing_recording(tmp_path):
+    path = tmp_path / 'session.qmkcon'
+
+    for report in (b'one', b'two'):
+        recorder = Recorder(path)
+        recorder.write(recorder.add_device(PLANCK), report)
+        recorder.close()
+
+    assert [payload for record_type, _, payload in records(path) if record_type == REPORT] == [b'one', b'two']
+
+
+def test_rotation(tmp_path):
+    path = tmp_path / 'session.qmkcon'
+    report = b'x' * 32
+    recorder = Recorder(path, max_size=len(MAGIC) + 3 * (RECORD.size + len(report)) + 200, keep=2)
+    planck = recorder.add_device(PLANCK)
+    preonic = recorder.add_device(PREONIC)
+    recorder.remove_device(preonic)
+
+    for _ in range(12):
+        recorder.write(planck, report)
+
+    recorder.close()
+
+    assert sorted(file.name for file in tmp_path.iterdir()) == ['session.qmkcon', 'session.qmkcon.1', 'session.qmkcon.2']
+
+    # Each file describes the devices connected when it was started, so it can be replayed on its own
+    for file in ('session.qmkcon.1', 'session.qmkcon'):
+        file_records = records(tmp_path / file)
+        assert file_records[0][:2] == (DEVICE, planck)
+        assert all(record_type == REPORT for record_type, _, _ in file_records[1:])
+
+
+def test_truncated_recording(tmp_path):
+    path = tmp_path / 'session.qmkcon'
+    recorder = Recorder(path)
+    recorder.write(recorder.add_device(PLANCK), b'complete')
+    recorder.write(0, b'cut short')
+    recorder.close()
+
+    path.write_bytes(path.read_bytes()[:-4])
+
+    assert [payload for record_type, _, payload in records(path) if record_type == REPORT] == [b'complete']
+
+
+def test_empty_and_invalid_recordings(tmp_path):
+    Recorder(tmp_path / 'empty.qmkcon').close()
+    (tmp_path / 'invalid.qmkcon').write_text('Not a recording')
+
+    assert records(tmp_path / 'empty.qmkcon') == []
+
+    with pytest.raises(RecordingError):
+        records(tmp_path / 'invalid.qmkcon')
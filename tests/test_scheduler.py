@@ -0,0 +1,109 @@
+import pytest
+
+from qmk_cli.console import scheduler
+from qmk_cli.console.scheduler import BACKOFF, BURST_DURATION, BURST_INTERVAL, ScanScheduler, ScanSource
+
+
+class Clock(object):
+    """A stand-in for time.monotonic() that only moves when told to.
+    """
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(scheduler.time, 'monotonic', clock)
+
+    return clock
+
+
+def test_backoff():
+    results = iter([False, False, False, False, True, False])
+    source = ScanSource('consoles', lambda: next(results), 0.5, 1)
+
+    source.run(0)
+    assert source.interval == 0.5 * BACKOFF
+    assert source.next_scan == 0.5 * BACKOFF
+
+    # Scans that find nothing back off to the maximum interval, a change drops us back to the minimum
+    for _ in range(3):
+        source.run(0)
+
+    assert source.interval == 1
+    source.run(0)
+    assert source.interval == 0.5
+    source.run(0)
+    assert source.interval == 0.5 * BACKOFF
+
+
+def test_max_interval_is_at_least_min_interval():
+    source = ScanSource('bootloaders', lambda: False, 2, 1)
+
+    source.run(0)
+    assert source.interval == source.max_interval == 2
+
+
+def test_wake():
+    source = ScanSource('consoles', lambda: False, 0.5, 10)
+
+    for _ in range(10):
+        source.run(0)
+
+    source.wake(3)
+    assert (source.interval, source.next_scan) == (0.5, 3)
+
+
+def test_burst():
+    source = ScanSource('bootloaders', lambda: False, 1, 10)
+    source.burst(100)
+    assert source.next_scan == 100
+
+    source.run(100)
+    assert (source.interval, source.next_scan) == (1, 100 + BURST_INTERVAL)
+
+    # Once the burst is over we back off again
+    source.run(100 + BURST_DURATION)
+    assert (source.interval, source.next_scan) == (BACKOFF, 100 + BURST_DURATION + BACKOFF)
+
+
+def test_scheduler(clock):
+    scans = []
+    schedule = ScanScheduler()
+
+    assert schedule.timeout() is None
+
+    schedule.add('consoles', lambda: scans.append('consoles'), 0.5, 5)
+    schedule.add('bootloaders', lambda: scans.append('bootloaders'), 2, 5)
+    assert schedule.timeout() == 0
+
+    schedule.run_due()
+    assert scans == ['consoles', 'bootloaders']
+    assert schedule.timeout() == pytest.approx(0.5 * BACKOFF)
+
+    clock.now += 0.5 * BACKOFF
+    schedule.run_due()
+    assert scans == ['consoles', 'bootloaders', 'consoles']
+
+    schedule.wake()
+    assert schedule.timeout() == 0
+    schedule.run_due()
+    assert scans[-2:] == ['consoles', 'bootloaders']
+
+
+def test_scheduler_burst(clock):
+    schedule = ScanScheduler()
+    schedule.add('bootloaders', lambda: False, 2, 5)
+    schedule.run_due()
+
+    schedule.burst('consoles')
+    assert schedule.timeout() == pytest.approx(2 * BACKOFF)
+
+    schedule.burst('bootloaders')
+    assert schedule.timeout() == 0
+    schedule.run_due()
+    assert schedule.timeout() == pytest.approx(BURST_INTERVAL)
@@ -0,0 +1,147 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+from qmk_cli.console.server import Client, FanoutServer, ServerAddressError, parse_address
+
+unix_sockets = pytest.mark.skipif(not hasattr(socket, 'AF_UNIX'), reason='needs unix sockets')
+
+
+def wait_for(condition, timeout=5):
+    """Wait up to timeout seconds for condition() to become true.
+    """
+    deadline = time.monotonic() + timeout
+
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+def receive(sock, size):
+    """Read exactly size bytes from sock.
+    """
+    data = b''
+    sock.settimeout(5)
+
+    while len(data) < size:
+        data += sock.recv(size - len(data))
+
+    return data
+
+
+@pytest.fixture
+def server():
+    server = FanoutServer('tcp:127.0.0.1:0')
+
+    yield server
+
+    server.close()
+
+
+def connect(server):
+    count = len(server.clients)
+    sock = socket.create_connection(server.listener.getsockname())
+    wait_for(lambda: len(server.clients) > count)
+
+    return sock
+
+
+@pytest.mark.parametrize(
+    'address,expected', [
+        ('tcp:localhost:8000', (socket.AF_INET, ('localhost', 8000))),
+        ('tcp:[::1]:8000', (socket.AF_INET6, ('::1', 8000))),
+        pytest.param('unix:/tmp/qmk.sock', (getattr(socket, 'AF_UNIX', None), '/tmp/qmk.sock'), marks=unix_sockets),
+    ]
+)
+def test_parse_address(address, expected):
+    assert parse_address(address) == expected
+
+
+@pytest.mark.parametrize('address', ['tcp:8000', 'tcp:localhost:http', 'unix:', 'udp:localhost:8000', '/tmp/qmk.sock'])
+def test_invalid_address(address):
+    with pytest.raises(ServerAddressError):
+        parse_address(address)
+
+
+def test_client_queue_limit():
+    client = Client(None, 'test')
+
+    assert client.push(b'one\n', 1, 8)
+    assert client.push(b'two\n', 1, 8)
+    assert not client.push(b'three\nfour\n', 2, 8)
+    assert (client.queued, client.dropped) == (8, 2)
+
+
+def test_fanout(server):
+    first, second = connect(server), connect(server)
+    server.write('hello\n')
+    server.write('world\n')
+
+    assert receive(first, 12) == receive(second, 12) == b'hello\nworld\n'
+
+    # A client that goes away doesn't affect the others
+    first.close()
+    wait_for(lambda: len(server.clients) == 1)
+    server.write('still here\n')
+    assert receive(second, 11) == b'still here\n'
+    second.close()
+
+
+def test_full_queue_drops_output():
+    server = FanoutServer('tcp:127.0.0.1:0', queue_size=64)
+    first, second = connect(server), connect(server)
+
+    try:
+        server.write('first\n')
+        server.write('x'*64 + '\n' + 'y'*8 + '\n')
+        server.write('last\n')
+
+        # Output that doesn't fit in a client's queue is counted as dropped, and what's after it still arrives
+        assert receive(first, 11) == receive(second, 11) == b'first\nlast\n'
+        assert [client.dropped for client in server.clients.values()] == [2, 2]
+
+    finally:
+        first.close()
+        second.close()
+        server.close()
+
+
+@unix_sockets
+def test_unix_socket(tmp_path):
+    path = tmp_path / 'console.sock'
+    path.write_text('')
+
+    with pytest.raises(ServerAddressError):
+        FanoutServer(f'unix:{path}')
+
+    # A stale socket left behind by an earlier server is replaced
+    path.unlink()
+    stale = socket.socket(socket.AF_UNIX)
+    stale.bind(str(path))
+    stale.close()
+
+    server = FanoutServer(f'unix:{path}')
+    client = socket.socket(socket.AF_UNIX)
+    client.connect(str(path))
+    wait_for(lambda: server.clients)
+    server.write('hello\n')
+    assert receive(client, 6) == b'hello\n'
+
+    client.close()
+    server.close()
+    assert not path.exists()
+
+
+@pytest.mark.parametrize('option', [['--list'], ['--replay', 'console.rec']])
+def test_serve_needs_devices(tmp_path, option):
+    env = {**os.environ, 'PYTHONPATH': str(Path(__file__).resolve().parent.parent), 'QMK_CONSOLE_BACKEND': 'simulated'}
+    result = subprocess.run([sys.executable, '-m', 'qmk_cli', 'console', '--serve', f'unix:{tmp_path / "console.sock"}', *option], env=env, cwd=tmp_path, capture_output=True, encoding='utf-8', timeout=60)
+
+    assert result.returncode == 1
+    assert f'--serve cannot be used with {option[0]}' in result.stderr
+    assert not (tmp_path / 'console.sock').exists()